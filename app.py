@@ -1,8 +1,9 @@
 import os
-from flask import Flask, request, jsonify, render_template 
+import copy
+from flask import Flask, request, jsonify, render_template, Response, stream_with_context
 from flask_cors import CORS
 import torch
-from transformers import AutoTokenizer, AutoModelForCausalLM
+from transformers import AutoTokenizer, AutoModelForCausalLM, TextIteratorStreamer
 from peft import PeftModel
 import warnings
 import requests
@@ -14,7 +15,19 @@ from urllib.parse import urlparse, quote
 import time
 import random
 from functools import lru_cache
+from threading import Thread, Lock
+from concurrent.futures import Future
+import queue
 from rag_retriever import RagRetriever
+from llm_client import call_llm_api, acall_llm_api
+from rate_limiter import TokenBucketRateLimiter
+from response_cache import SemanticResponseCache
+from user_store import UserRepository
+from chat_store import ChatHistoryStore
+from chat_search import ChatSearchIndex
+from code_store import ExpiringCodeStore, CODE_OK, CODE_MISSING, CODE_EXPIRED, CODE_LOCKED
+from risk_detection import detect_suicide_risk
+from merge_adapter import MERGE_INFO_FILE, adapter_fingerprint
 from flask import session
 from werkzeug.security import generate_password_hash, check_password_hash
 import json
@@ -23,7 +36,7 @@ import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 import secrets
-from datetime import datetime, timedelta
+from datetime import datetime
 
 warnings.filterwarnings("ignore")
 
@@ -49,57 +62,9 @@ USERS_FILE = USER_DATA_DIR / "users.json"
 CHAT_HISTORY_DIR = USER_DATA_DIR / "chat_histories"
 CHAT_HISTORY_DIR.mkdir(exist_ok=True)
 
-def load_users():
-    """Load users from JSON file"""
-    if USERS_FILE.exists():
-        try:
-            with open(USERS_FILE, 'r') as f:
-                content = f.read().strip()
-                if not content:
-                    print("⚠️ users.json is empty, creating empty database")
-                    with open(USERS_FILE, 'w') as fw:
-                        json.dump({}, fw)
-                    return {}
-                return json.loads(content)
-        except json.JSONDecodeError as e:
-            print(f"⚠️ users.json corrupted: {e}. Reinitializing...")
-            with open(USERS_FILE, 'w') as fw:
-                json.dump({}, fw)
-            return {}
-        except Exception as e:
-            print(f"⚠️ Error loading users: {e}")
-            return {}
-    else:
-        print("⚠️ users.json doesn't exist, creating...")
-        with open(USERS_FILE, 'w') as f:
-            json.dump({}, f)
-        return {}
-
-def save_users(users):
-    """Save users to JSON file"""
-    with open(USERS_FILE, 'w') as f:
-        json.dump(users, f, indent=2)
-
-def get_user_chat_file(email):
-    """Get chat history file path for user"""
-    safe_email = email.replace('@', '_').replace('.', '_')
-    return CHAT_HISTORY_DIR / f"{safe_email}_chats.json"
-
-def load_user_chats(email):
-    """Load user's chat history"""
-    chat_file = get_user_chat_file(email)
-    if chat_file.exists():
-        with open(chat_file, 'r') as f:
-            return json.load(f)
-    return []
-
-def save_user_chat(email, chat_data):
-    """Save user's chat history"""
-    chat_file = get_user_chat_file(email)
-    chats = load_user_chats(email)
-    chats.append(chat_data)
-    with open(chat_file, 'w') as f:
-        json.dump(chats, f, indent=2)
+# Per-user append-only chat logs; legacy *_chats.json files are imported on first access
+chat_store = ChatHistoryStore(CHAT_HISTORY_DIR)
+chat_search = ChatSearchIndex(CHAT_HISTORY_DIR, chat_store)
 
 
 # Load environment variables
@@ -117,10 +82,39 @@ TWILIO_ACCOUNT_SID = os.environ.get("TWILIO_ACCOUNT_SID", "")
 TWILIO_AUTH_TOKEN = os.environ.get("TWILIO_AUTH_TOKEN", "")
 TWILIO_PHONE = os.environ.get("TWILIO_PHONE", "")
 
-reset_codes = {}  
+# Accounts live in SQLite; users.json is imported once on first start
+USER_PROFILE_CACHE_SIZE = int(os.environ.get("USER_PROFILE_CACHE_SIZE", "10000"))
+user_repository = UserRepository(USER_DATA_DIR / "users.db", legacy_json_path=USERS_FILE,
+                                 cache_size=USER_PROFILE_CACHE_SIZE)
+
+# One-time codes, shared by all workers through SQLite (set AUTH_CODE_DB= to keep them in memory)
+AUTH_CODE_DB = os.environ.get("AUTH_CODE_DB", str(USER_DATA_DIR / "auth_codes.db")) or None
+AUTH_CODE_TTL = float(os.environ.get("AUTH_CODE_TTL", "600"))
+AUTH_CODE_MAX_SIZE = int(os.environ.get("AUTH_CODE_MAX_SIZE", "10000"))
+
+reset_codes = ExpiringCodeStore("reset", ttl=AUTH_CODE_TTL, max_size=AUTH_CODE_MAX_SIZE, db_path=AUTH_CODE_DB)
+verification_codes = ExpiringCodeStore("verification", ttl=AUTH_CODE_TTL, max_size=AUTH_CODE_MAX_SIZE,
+                                       db_path=AUTH_CODE_DB)
 
 BASE_MODEL_PATH = os.environ.get("MODEL_BASE_PATH", "./TinyLlama-1.1B-Chat-v1.0")
 ADAPTER_PATH = os.environ.get("ADAPTER_PATH", "./trained_model")
+# Output of merge_adapter.py; preferred over base + adapter when present and up to date
+MERGED_MODEL_PATH = os.environ.get("MERGED_MODEL_PATH", "./merged_model")
+STREAM_TOKEN_TIMEOUT = float(os.environ.get("STREAM_TOKEN_TIMEOUT", "60"))
+GEN_MAX_BATCH_SIZE = int(os.environ.get("GEN_MAX_BATCH_SIZE", "8"))
+GEN_MAX_WAIT_MS = float(os.environ.get("GEN_MAX_WAIT_MS", "25"))
+GEN_RESULT_TIMEOUT = float(os.environ.get("GEN_RESULT_TIMEOUT", "180"))
+
+# CPU inference: fp32 | bf16 | int8 (dynamic int8 on nn.Linear, applied after the adapter is merged)
+MODEL_CPU_DTYPE = os.environ.get("MODEL_CPU_DTYPE", "fp32").lower()
+MODEL_MERGE_ADAPTER = os.environ.get("MODEL_MERGE_ADAPTER", "1") != "0"
+# auto = CUDA only; 1 also compiles the forward pass on CPU
+MODEL_TORCH_COMPILE = os.environ.get("MODEL_TORCH_COMPILE", "auto").lower()
+# Intra-op threads per worker; defaults to the cores split evenly across WEB_CONCURRENCY workers
+WEB_CONCURRENCY = max(int(os.environ.get("WEB_CONCURRENCY", "1")), 1)
+TORCH_NUM_THREADS = int(os.environ.get("TORCH_NUM_THREADS", "0")) or max((os.cpu_count() or 1) // WEB_CONCURRENCY, 1)
+# Tokens generated by the startup throughput check (0 = skip)
+MODEL_BENCHMARK_TOKENS = int(os.environ.get("MODEL_BENCHMARK_TOKENS", "16"))
 
 # Initialize Gemini API with free tier management
 # Initialize Ollama API
@@ -129,13 +123,15 @@ LLM_API_URL = os.environ.get("LLM_API_URL", "https://chat.ivislabs.in/api/chat/c
 LLM_API_KEY = os.environ.get("LLM_API_KEY")
 
 ollama_client = None
-ollama_rate_limiter = {
-    'last_request_time': 0,
-    'request_count_minute': 0,
-    'request_count_day': 0,
-    'day_start': time.time(),
-    'minute_start': time.time()
-}
+LLM_RATE_LIMIT_PER_MINUTE = int(os.environ.get("LLM_RATE_LIMIT_PER_MINUTE", "60"))
+LLM_RATE_LIMIT_PER_DAY = int(os.environ.get("LLM_RATE_LIMIT_PER_DAY", "10000"))
+# Point every worker at the same file to share one budget across processes
+LLM_RATE_LIMIT_DB = os.environ.get("LLM_RATE_LIMIT_DB") or None
+
+ollama_rate_limiter = TokenBucketRateLimiter({
+    'minute': (LLM_RATE_LIMIT_PER_MINUTE, 60),
+    'day': (LLM_RATE_LIMIT_PER_DAY, 86400)
+}, db_path=LLM_RATE_LIMIT_DB)
 
 if LLM_API_URL and LLM_API_KEY:
     try:
@@ -151,147 +147,70 @@ if LLM_API_URL and LLM_API_KEY:
 else:
     print("⚠️ Ollama API not configured - using fallback responses")
 
+RESPONSE_CACHE_THRESHOLD = float(os.environ.get("RESPONSE_CACHE_THRESHOLD", "0.92"))
+RESPONSE_CACHE_TTL = float(os.environ.get("RESPONSE_CACHE_TTL", "3600"))
+RESPONSE_CACHE_SIZE = int(os.environ.get("RESPONSE_CACHE_SIZE", "500"))
+
+def _encode_for_response_cache(text):
+    """Embed cache keys through the retriever's query-embedding cache (one encode per query)"""
+    return rag_retriever.retriever.query_cache.encode([text])[0]
+
+# Shared by RAG generation, professional and expert-knowledge Ollama paths
+llm_response_cache = SemanticResponseCache(
+    _encode_for_response_cache,
+    threshold=RESPONSE_CACHE_THRESHOLD,
+    ttl=RESPONSE_CACHE_TTL,
+    max_size=RESPONSE_CACHE_SIZE
+)
+
 def check_ollama_rate_limit():
-    """Check if we can make an Ollama request"""
+    """Reserve one Ollama request slot; returns False instead of sleeping when limited"""
     if not ollama_client:
         return False
     
-    current_time = time.time()
-    
-    # Reset day counter if 24 hours passed
-    if current_time - ollama_rate_limiter['day_start'] > 86400:
-        ollama_rate_limiter['request_count_day'] = 0
-        ollama_rate_limiter['day_start'] = current_time
-        print("🔄 Daily Ollama counter reset")
-    
-    # Reset minute counter if 60 seconds passed
-    if current_time - ollama_rate_limiter['minute_start'] > 60:
-        ollama_rate_limiter['request_count_minute'] = 0
-        ollama_rate_limiter['minute_start'] = current_time
-    
-    # Check limits (adjust as needed for your Ollama instance)
-    if ollama_rate_limiter['request_count_day'] >= 10000:
-        print("⚠️ Ollama daily limit reached")
+    wait_time = ollama_rate_limiter.acquire()
+    if wait_time > 0:
+        print(f"⚠️ Ollama rate limit reached - next slot in {wait_time:.1f}s")
         return False
     
-    if ollama_rate_limiter['request_count_minute'] >= 60:
-        print("⚠️ Ollama minute limit reached")
-        return False
-    
-    # Enforce minimum delay between requests
-    time_since_last = current_time - ollama_rate_limiter['last_request_time']
-    if time_since_last < 0.1:
-        wait_time = 0.1 - time_since_last
-        time.sleep(wait_time)
-    
     return True
 
-def increment_ollama_counter():
-    """Increment rate limit counters after successful request"""
-    ollama_rate_limiter['request_count_minute'] += 1
-    ollama_rate_limiter['request_count_day'] += 1
-    ollama_rate_limiter['last_request_time'] = time.time()
-    print(f"📊 Ollama usage: {ollama_rate_limiter['request_count_minute']}/60 this minute, {ollama_rate_limiter['request_count_day']}/10000 today")
+def release_ollama_slot(succeeded):
+    """Refund the reserved slot when the call failed so failures don't count against the limit"""
+    if not succeeded:
+        ollama_rate_limiter.refund()
+    
+    usage = ollama_rate_limiter.snapshot()
+    print(f"📊 Ollama usage: {usage['minute']['used']:.0f}/{usage['minute']['capacity']} this minute, {usage['day']['used']:.0f}/{usage['day']['capacity']} today")
+
 def call_ollama_api(prompt, max_tokens=1000, temperature=0.7):
-    """Call LLM API with OpenAI-compatible format"""
+    """Call LLM API with OpenAI-compatible format (pooled keep-alive client)"""
     if not ollama_client:
         return None
-    
-    try:
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {ollama_client['api_key']}"
-        }
-        
-        # OpenAI-compatible chat completion format
-        payload = {
-            "model": ollama_client['model'],
-            "messages": [
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
-            "max_tokens": max_tokens,
-            "temperature": temperature,
-            "stream": False
-        }
-        
-        print(f"🔄 Calling LLM API: {ollama_client['api_url']}")
-        
-        response = requests.post(
-            ollama_client['api_url'],
-            headers=headers,
-            json=payload,
-            timeout=60
-        )
-        
-        print(f"📡 LLM Response Status: {response.status_code}")
-        
-        if response.status_code == 200:
-            data = response.json()
-            
-            # OpenAI-compatible format: choices[0].message.content
-            if 'choices' in data and len(data['choices']) > 0:
-                message = data['choices'][0].get('message', {})
-                content = message.get('content', '')
-                if content:
-                    print(f"✅ LLM Response received ({len(content)} chars)")
-                    return content
-            
-            # Alternative formats
-            elif 'message' in data:
-                if isinstance(data['message'], dict) and 'content' in data['message']:
-                    return data['message']['content']
-                elif isinstance(data['message'], str):
-                    return data['message']
-            
-            elif 'response' in data:
-                return data['response']
-            
-            elif 'content' in data:
-                return data['content']
-            
-            print(f"⚠️ Unexpected response format: {list(data.keys())}")
-            return None
-        
-        elif response.status_code == 405:
-            print(f"❌ 405 Method Not Allowed")
-            print(f"🔗 Endpoint: {ollama_client['api_url']}")
-            print(f"💡 Check if the endpoint URL is correct")
-            return None
-        
-        elif response.status_code == 401:
-            print(f"❌ 401 Unauthorized - Check your LLM_API_KEY")
-            return None
-        
-        elif response.status_code == 404:
-            print(f"❌ 404 Not Found - Check your LLM_API_URL")
-            return None
-        
-        elif response.status_code == 400:
-            print(f"❌ 400 Bad Request: {response.text}")
-            return None
-        
-        else:
-            print(f"❌ LLM API error: {response.status_code} - {response.text}")
-            return None
-            
-    except requests.exceptions.Timeout:
-        print(f"⏱️ LLM API request timeout")
-        return None
-    except requests.exceptions.ConnectionError:
-        print(f"🔌 LLM API connection error")
-        return None
-    except Exception as e:
-        print(f"❌ LLM API call failed: {e}")
+    return call_llm_api(ollama_client, prompt, max_tokens=max_tokens, temperature=temperature)
+
+async def acall_ollama_api(prompt, max_tokens=1000, temperature=0.7):
+    """
+    asyncio-native call_ollama_api - does not block a worker thread while waiting
+    Await llm_client.aclose_http_clients() before the calling event loop shuts down.
+    """
+    if not ollama_client:
         return None
+    return await acall_llm_api(ollama_client, prompt, max_tokens=max_tokens, temperature=temperature)
+
 def generate_with_retrieved_context(user_query, retrieved_contexts, use_ollama=True):
     """
     🧠 GENERATION PHASE - Synthesize retrieved knowledge into natural response
     This is where RAG's 'G' happens using Ollama LLM
     """
-    if not use_ollama or not ollama_client or not check_ollama_rate_limit():
+    if not use_ollama or not ollama_client:
+        return generate_fallback_with_context(user_query, retrieved_contexts)
+    
+    cached, query_embedding = llm_response_cache.lookup('rag_generation', user_query)
+    if cached:
+        return cached
+    
+    if not check_ollama_rate_limit():
         return generate_fallback_with_context(user_query, retrieved_contexts)
     
     # Prepare context from retrieved documents
@@ -317,14 +236,16 @@ Respond naturally as if having a caring conversation (400-600 words):"""
 
     try:
         response_text = call_ollama_api(prompt, max_tokens=800, temperature=0.7)
-        increment_ollama_counter()
+        release_ollama_slot(bool(response_text))
         
         if response_text:
-            return {
+            generated = {
                 'answer': response_text,
                 'generation_method': 'ollama_synthesis',
                 'context_used': len(retrieved_contexts)
             }
+            llm_response_cache.store('rag_generation', user_query, generated, embedding=query_embedding)
+            return generated
     except Exception as e:
         print(f"⚠️ Ollama generation failed: {e}")
     
@@ -363,6 +284,7 @@ tokenizer = None
 use_adapter = False
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 model_load_time = None
+model_runtime = {}
 
 # Professional Mental Health Response Generator
 class ProfessionalMentalHealthResponses:
@@ -424,6 +346,10 @@ If stress affects sleep, eating, or relationships consistently, consider speakin
     def get_professional_response_with_ollama(self, user_input):
         """Enhanced professional response using Ollama API"""
         
+        cached, query_embedding = llm_response_cache.lookup('professional', user_input)
+        if cached:
+            return cached
+        
         if not check_ollama_rate_limit():
             print("⚠️ Ollama rate limit hit - using fallback")
             return self._get_fallback_response(user_input)
@@ -442,10 +368,10 @@ Use markdown with ## headers and bullet points. Keep under 800 words."""
 
             response_text = call_ollama_api(prompt, max_tokens=1000, temperature=0.7)
             
-            increment_ollama_counter()
+            release_ollama_slot(bool(response_text))
             
             if response_text:
-                return {
+                result = {
                     'answer': response_text + "\n\n---\n*✨ Enhanced by Ollama Llama 3.2 Vision • For personalized care, please consult a licensed mental health professional.*",
                     'sources': [{
                         'title': f'Professional Clinical Guidance ({LLM_MODEL_NAME})',
@@ -460,6 +386,8 @@ Use markdown with ## headers and bullet points. Keep under 800 words."""
                     'type': 'professional_guidance',
                     'confidence': 0.95
                 }
+                llm_response_cache.store('professional', user_input, result, embedding=query_embedding)
+                return result
             else:
                 return self._get_fallback_response(user_input)
                 
@@ -690,6 +618,125 @@ class EnhancedFreeWebSearcher:
             'type': 'search_suggestion'
         }
 
+# Batched generation for the local model
+class BatchedGenerationScheduler:
+    """
+    Background scheduler that batches concurrent generation requests.
+    - Waits up to max_wait_ms for up to max_batch_size pending prompts
+    - Left-pads them with a private tokenizer copy and runs one model.generate call
+    - Resolves each caller's Future with its decoded completion
+    - generate() runs under generation_lock, shared with the streaming path
+    """
+    
+    def __init__(self, model, tokenizer, device, generation_kwargs, max_batch_size=8, max_wait_ms=25,
+                 generation_lock=None):
+        self.model = model
+        self.device = device
+        self.generation_lock = generation_lock or Lock()
+        self.generation_kwargs = generation_kwargs
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        
+        # Causal LMs must be left-padded so every prompt ends where generation starts;
+        # a copy keeps the shared tokenizer's padding side as the other paths expect
+        self.tokenizer = copy.deepcopy(tokenizer)
+        self.tokenizer.padding_side = 'left'
+        
+        self.pending = queue.Queue()
+        self.stats_lock = Lock()
+        self.stats = {
+            'batches': 0,
+            'requests': 0,
+            'failed_batches': 0,
+            'last_batch_size': 0,
+            'last_batch_seconds': 0.0,
+            'last_occupancy': 0.0,
+            'avg_occupancy': 0.0,
+            'batch_size_histogram': {}
+        }
+        
+        self.worker = Thread(target=self._run, name="generation-scheduler", daemon=True)
+        self.worker.start()
+        print(f"✅ Generation scheduler started (max batch {self.max_batch_size}, max wait {max_wait_ms:.0f}ms)")
+    
+    def submit(self, prompt):
+        """Queue a prompt and return a Future resolved with the generated text"""
+        future = Future()
+        self.pending.put((prompt, future))
+        return future
+    
+    def get_stats(self):
+        with self.stats_lock:
+            stats = dict(self.stats)
+            stats['batch_size_histogram'] = dict(self.stats['batch_size_histogram'])
+        stats['queue_depth'] = self.pending.qsize()
+        stats['max_batch_size'] = self.max_batch_size
+        stats['max_wait_ms'] = self.max_wait * 1000.0
+        return stats
+    
+    def _collect_batch(self):
+        batch = [self.pending.get()]
+        deadline = time.monotonic() + self.max_wait
+        
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.pending.get(timeout=remaining))
+            except queue.Empty:
+                break
+        
+        return batch
+    
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            # Drop requests whose caller already gave up
+            batch = [(prompt, future) for prompt, future in batch if future.set_running_or_notify_cancel()]
+            if batch:
+                self._process(batch)
+    
+    def _process(self, batch):
+        start_time = time.time()
+        prompts = [prompt for prompt, _ in batch]
+        
+        try:
+            inputs = self.tokenizer(prompts, return_tensors="pt", truncation=True, max_length=512, padding=True)
+            inputs = {k: v.to(self.device) for k, v in inputs.items()}
+            
+            with self.generation_lock, torch.no_grad():
+                output_ids = self.model.generate(**inputs, **self.generation_kwargs)
+            
+            prompt_length = inputs['input_ids'].shape[1]
+            for i, (_, future) in enumerate(batch):
+                future.set_result(self.tokenizer.decode(output_ids[i][prompt_length:], skip_special_tokens=True))
+            failed = False
+        
+        except Exception as e:
+            print(f"❌ Batched generation error: {e}")
+            for _, future in batch:
+                future.set_exception(e)
+            failed = True
+        
+        duration = time.time() - start_time
+        occupancy = len(batch) / self.max_batch_size
+        
+        with self.stats_lock:
+            self.stats['batches'] += 1
+            self.stats['requests'] += len(batch)
+            self.stats['failed_batches'] += int(failed)
+            self.stats['last_batch_size'] = len(batch)
+            self.stats['last_batch_seconds'] = round(duration, 3)
+            self.stats['last_occupancy'] = round(occupancy, 3)
+            self.stats['avg_occupancy'] = round(
+                self.stats['requests'] / (self.stats['batches'] * self.max_batch_size), 3
+            )
+            histogram = self.stats['batch_size_histogram']
+            histogram[len(batch)] = histogram.get(len(batch), 0) + 1
+        
+        print(f"🧮 Generation batch: {len(batch)}/{self.max_batch_size} ({occupancy:.0%} occupancy) in {duration:.2f}s")
+
 # Advanced AI Response Generator WITH CACHING
 class AdvancedAIResponses:
     def __init__(self, model, tokenizer, device):
@@ -698,97 +745,139 @@ class AdvancedAIResponses:
         self.device = device
         self.response_cache = {}  # Cache recent responses
         self.cache_max_size = 50  # Keep last 50 responses
+        
+        # One generate() at a time on the shared model, across batched, blocking and streaming requests
+        self.generation_lock = Lock()
+        
+        # Concurrent training-mode requests share batched generate() calls
+        self.scheduler = None
+        if model is not None and tokenizer is not None and GEN_MAX_BATCH_SIZE > 1:
+            self.scheduler = BatchedGenerationScheduler(
+                model, tokenizer, device, self._generation_kwargs(),
+                max_batch_size=GEN_MAX_BATCH_SIZE,
+                max_wait_ms=GEN_MAX_WAIT_MS,
+                generation_lock=self.generation_lock
+            )
     
     def _get_cache_key(self, user_input):
         """Generate cache key for similar inputs"""
         return user_input.lower().strip()[:100]  # Removed @lru_cache
     
-    def generate_ai_response(self, user_input):
-        """Generate high-quality AI response with caching"""
+    def _build_prompt(self, user_input):
+        """Build the Dr. Chen prompt for the fine-tuned model"""
+        return f"""You are Dr. Sarah Chen, a compassionate and experienced clinical psychologist. You specialize in evidence-based treatments and have 15 years of experience helping people with mental health challenges. 
+
+Provide a warm, professional, and helpful response to this person who is seeking mental health support. Be empathetic, specific, and actionable in your advice.
+
+Person: "{user_input}"
+
+Dr. Chen:"""
+    
+    def _generation_kwargs(self):
+        """Sampling settings shared by the blocking and streaming paths"""
+        eos_token_id = self.tokenizer.eos_token_id if hasattr(self.tokenizer, 'eos_token_id') else 0
+        return {
+            'max_new_tokens': 80,
+            'do_sample': True,
+            'temperature': 0.7,
+            'top_p': 0.9,
+            'top_k': 50,
+            'pad_token_id': eos_token_id,
+            'eos_token_id': eos_token_id,
+            'early_stopping': True,
+            'repetition_penalty': 1.2,
+            'no_repeat_ngram_size': 3
+        }
+    
+    def _tokenize_prompt(self, user_input):
+        inputs = self.tokenizer(self._build_prompt(user_input), return_tensors="pt", truncation=True, max_length=512, padding=True)
+        return {k: v.to(self.device) for k, v in inputs.items()}
+    
+    def _finalize_response(self, user_input, response):
+        """Clean decoded text, wrap it in the response envelope and cache it"""
+        cleaned_response = response.strip()
         
-        # Check cache first
+        # Remove incomplete sentences
+        if cleaned_response and not cleaned_response[-1] in '.!?':
+            sentences = cleaned_response.split('.')
+            cleaned_response = '.'.join(sentences[:-1]) + '.'
+        
+        # Enhance the response if it's too short or generic
+        if len(cleaned_response) < 50:
+            cleaned_response = self.enhance_response(user_input, cleaned_response)
+        
+        final_response = f"{cleaned_response}\n\n---\n*This response was generated by a fine-tuned AI model trained specifically on mental health conversations and therapeutic techniques. While AI can provide helpful insights, please consider professional counseling for personalized care.*"
+        
+        result = {
+            'answer': final_response,
+            'sources': [{
+                'title': 'Mental Health AI Model - Specialized Training Data',
+                'url': '#',
+                'snippet': 'AI model trained on thousands of therapeutic conversations, clinical guidelines, and evidence-based mental health practices',
+                'displayUrl': 'ai-model.local',
+                'source_id': 1,
+                'favicon': '/static/icons/ai-brain.png',
+                'published_date': datetime.now().strftime('%Y-%m-%d'),
+                'type': 'ai_generated'
+            }],
+            'type': 'training_model',
+            'confidence': 0.85
+        }
+        
+        # Cache the response
+        cache_key = self._get_cache_key(user_input)
+        self.response_cache[cache_key] = result.copy()
+        
+        # Maintain cache size
+        if len(self.response_cache) > self.cache_max_size:
+            oldest_key = next(iter(self.response_cache))
+            del self.response_cache[oldest_key]
+        
+        return result
+    
+    def _get_cached_response(self, user_input):
         cache_key = self._get_cache_key(user_input)
         if cache_key in self.response_cache:
             print("⚡ Using cached response for similar query")
             cached = self.response_cache[cache_key].copy()
             cached['answer'] = cached['answer'] + "\n\n*[Cached response for faster delivery]*"
             return cached
+        return None
+    
+    def generate_ai_response(self, user_input):
+        """Generate high-quality AI response with caching"""
+        
+        # Check cache first
+        cached = self._get_cached_response(user_input)
+        if cached:
+            return cached
         
         try:
             if self.model is None or self.tokenizer is None:
                 return self.get_fallback_response(user_input)
             
-            # Enhanced prompt for better responses
-            prompt = f"""You are Dr. Sarah Chen, a compassionate and experienced clinical psychologist. You specialize in evidence-based treatments and have 15 years of experience helping people with mental health challenges. 
-
-Provide a warm, professional, and helpful response to this person who is seeking mental health support. Be empathetic, specific, and actionable in your advice.
-
-Person: "{user_input}"
-
-Dr. Chen:"""
-
+            if self.scheduler is not None:
+                future = self.scheduler.submit(self._build_prompt(user_input))
+                try:
+                    response = future.result(timeout=GEN_RESULT_TIMEOUT)
+                except Exception as e:
+                    future.cancel()
+                    print(f"Generation error: {e}")
+                    return self.get_fallback_response(user_input)
+                return self._finalize_response(user_input, response)
+            
             try:
-                inputs = self.tokenizer(prompt, return_tensors="pt", truncation=True, max_length=512, padding=True)
-                inputs = {k: v.to(self.device) for k, v in inputs.items()}
+                inputs = self._tokenize_prompt(user_input)
             except Exception as e:
                 print(f"Tokenization error: {e}")
                 return self.get_fallback_response(user_input)
             
             try:
-                with torch.no_grad():
-                    output_ids = self.model.generate(
-                        **inputs,
-                        max_new_tokens=80,
-                        do_sample=True,
-                        temperature=0.7,
-                        top_p=0.9,
-                        top_k=50,
-                        pad_token_id=self.tokenizer.eos_token_id if hasattr(self.tokenizer, 'eos_token_id') else 0,
-                        eos_token_id=self.tokenizer.eos_token_id if hasattr(self.tokenizer, 'eos_token_id') else 0,
-                        early_stopping=True,
-                        repetition_penalty=1.2,
-                        no_repeat_ngram_size=3
-                    )
+                with self.generation_lock, torch.no_grad():
+                    output_ids = self.model.generate(**inputs, **self._generation_kwargs())
                 
                 response = self.tokenizer.decode(output_ids[0][inputs['input_ids'].shape[1]:], skip_special_tokens=True)
-                cleaned_response = response.strip()
-                
-                # Remove incomplete sentences
-                if cleaned_response and not cleaned_response[-1] in '.!?':
-                    sentences = cleaned_response.split('.')
-                    cleaned_response = '.'.join(sentences[:-1]) + '.'
-                
-                # Enhance the response if it's too short or generic
-                if len(cleaned_response) < 50:
-                    cleaned_response = self.enhance_response(user_input, cleaned_response)
-                
-                final_response = f"{cleaned_response}\n\n---\n*This response was generated by a fine-tuned AI model trained specifically on mental health conversations and therapeutic techniques. While AI can provide helpful insights, please consider professional counseling for personalized care.*"
-                
-                result = {
-                    'answer': final_response,
-                    'sources': [{
-                        'title': 'Mental Health AI Model - Specialized Training Data',
-                        'url': '#',
-                        'snippet': 'AI model trained on thousands of therapeutic conversations, clinical guidelines, and evidence-based mental health practices',
-                        'displayUrl': 'ai-model.local',
-                        'source_id': 1,
-                        'favicon': '/static/icons/ai-brain.png',
-                        'published_date': datetime.now().strftime('%Y-%m-%d'),
-                        'type': 'ai_generated'
-                    }],
-                    'type': 'training_model',
-                    'confidence': 0.85
-                }
-                
-                # Cache the response
-                self.response_cache[cache_key] = result.copy()
-                
-                # Maintain cache size
-                if len(self.response_cache) > self.cache_max_size:
-                    oldest_key = next(iter(self.response_cache))
-                    del self.response_cache[oldest_key]
-                
-                return result
+                return self._finalize_response(user_input, response)
             
             except Exception as e:
                 print(f"Generation error: {e}")
@@ -798,6 +887,66 @@ Dr. Chen:"""
             print(f"AI generation error: {e}")
             return self.get_fallback_response(user_input)
     
+    def generate_ai_response_stream(self, user_input):
+        """
+        Stream the fine-tuned model's output as it is decoded.
+        Yields ('token', text) pieces followed by a single ('final', response) envelope.
+        """
+        cached = self._get_cached_response(user_input)
+        if cached:
+            yield 'token', cached['answer']
+            yield 'final', cached
+            return
+        
+        if self.model is None or self.tokenizer is None:
+            fallback = self.get_fallback_response(user_input)
+            yield 'token', fallback['answer']
+            yield 'final', fallback
+            return
+        
+        try:
+            inputs = self._tokenize_prompt(user_input)
+        except Exception as e:
+            print(f"Tokenization error: {e}")
+            fallback = self.get_fallback_response(user_input)
+            yield 'token', fallback['answer']
+            yield 'final', fallback
+            return
+        
+        streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True, timeout=STREAM_TOKEN_TIMEOUT)
+        generation_errors = []
+        
+        def _produce():
+            try:
+                with self.generation_lock, torch.no_grad():
+                    self.model.generate(**inputs, **self._generation_kwargs(), streamer=streamer)
+            except Exception as e:
+                generation_errors.append(e)
+                streamer.end()
+        
+        producer = Thread(target=_produce, daemon=True)
+        producer.start()
+        
+        pieces = []
+        try:
+            for piece in streamer:
+                if piece:
+                    pieces.append(piece)
+                    yield 'token', piece
+        except Exception as e:
+            print(f"Streaming error: {e}")
+            generation_errors.append(e)
+        
+        producer.join(timeout=STREAM_TOKEN_TIMEOUT)
+        
+        if generation_errors or not pieces:
+            if generation_errors:
+                print(f"Generation error: {generation_errors[0]}")
+            yield 'final', self.get_fallback_response(user_input)
+            return
+        
+        yield 'final', self._finalize_response(user_input, ''.join(pieces))
+    
     def enhance_response(self, user_input, original_response):
         """Enhance short or generic responses"""
         enhancements = {
@@ -872,6 +1021,10 @@ The best approach depends on your specific concerns and preferences.""",
     def search_knowledge_with_ollama(self, query):  # RENAMED
         """Enhanced knowledge using Ollama API"""  # CHANGED
         
+        cached, query_embedding = llm_response_cache.lookup('expert_knowledge', query)
+        if cached:
+            return cached
+        
         if not check_ollama_rate_limit():  # CHANGED
             print("⚠️ Ollama rate limit hit - using fallback knowledge")  # CHANGED
             return self._get_fallback_knowledge(query)
@@ -890,10 +1043,10 @@ Use markdown with ## headers and bullets. Keep under 700 words."""
 
             response_text = call_ollama_api(prompt, max_tokens=900, temperature=0.7)  # CHANGED
             
-            increment_ollama_counter()  # CHANGED
+            release_ollama_slot(bool(response_text))
             
             if response_text:  # CHANGED
-                return {
+                result = {
                     'answer': response_text + "\n\n---\n*✨ Enhanced by Ollama AI • Expert knowledge from evidence-based research.*",  # CHANGED
                     'sources': [
                         {
@@ -910,6 +1063,8 @@ Use markdown with ## headers and bullets. Keep under 700 words."""
                     'type': 'expert_knowledge',
                     'confidence': 0.95
                 }
+                llm_response_cache.store('expert_knowledge', query, result, embedding=query_embedding)
+                return result
             else:
                 return self._get_fallback_knowledge(query)
                 
@@ -946,9 +1101,81 @@ Use markdown with ## headers and bullets. Keep under 700 words."""
             print("📚 Using pre-written expert knowledge...")
             return self._get_fallback_knowledge(query)
         
+def _load_base_model(path, **kwargs):
+    """from_pretrained with SDPA attention, falling back to the default kernel"""
+    try:
+        return AutoModelForCausalLM.from_pretrained(path, attn_implementation="sdpa", **kwargs), "sdpa"
+    except (ValueError, ImportError, TypeError) as e:
+        print(f"⚠️ SDPA attention not available ({e}) - using default attention")
+        return AutoModelForCausalLM.from_pretrained(path, **kwargs), "default"
+
+def _usable_merged_model():
+    """True if MERGED_MODEL_PATH holds a merge of the current ADAPTER_PATH"""
+    info_path = os.path.join(MERGED_MODEL_PATH, MERGE_INFO_FILE)
+    if not os.path.exists(info_path):
+        return False
+    try:
+        with open(info_path) as f:
+            info = json.load(f)
+        if os.path.isdir(ADAPTER_PATH) and info.get('adapter_fingerprint') != adapter_fingerprint(ADAPTER_PATH):
+            print("⚠️ Merged model is older than the adapter - rerun merge_adapter.py; loading base + adapter")
+            return False
+        return True
+    except Exception as e:
+        print(f"⚠️ Could not read merged model info: {e}")
+        return False
+
+def _optimize_for_cpu(model):
+    """Apply the MODEL_CPU_DTYPE weight format to a merged, eval-mode model"""
+    if MODEL_CPU_DTYPE == "int8":
+        try:
+            model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+            print("✅ Dynamic int8 quantization applied to Linear layers")
+            return model, "int8"
+        except Exception as e:
+            print(f"⚠️ int8 quantization failed ({e}) - keeping fp32 weights")
+            return model, "fp32"
+    if MODEL_CPU_DTYPE == "bf16":
+        return model, "bf16"  # loaded directly in bfloat16
+    if MODEL_CPU_DTYPE != "fp32":
+        print(f"⚠️ Unknown MODEL_CPU_DTYPE '{MODEL_CPU_DTYPE}' - using fp32")
+    return model, "fp32"
+
+def _measure_generation_speed(model, tokenizer, max_new_tokens, eager_forward=None):
+    """
+    Tokens/sec of a short greedy generate at startup (max_new_tokens=0: warm-up only, returns None)
+    - An untimed first run warms up kernels / compiled graphs, so only the second is timed
+    - torch.compile errors only surface on that first forward; given eager_forward, the model
+      is switched back to it instead of failing every later generate()
+    """
+    inputs = tokenizer("Hello, how are you feeling today?", return_tensors="pt")
+    inputs = {k: v.to(device) for k, v in inputs.items()}
+    generate_kwargs = dict(
+        max_new_tokens=max(max_new_tokens, 1),
+        min_new_tokens=max(max_new_tokens, 1),
+        do_sample=False,
+        pad_token_id=tokenizer.pad_token_id
+    )
+    with torch.inference_mode():
+        try:
+            model.generate(**inputs, **generate_kwargs)
+        except Exception as e:
+            if eager_forward is None:
+                raise
+            print(f"⚠️ Compiled forward failed on first use ({e}) - falling back to eager mode")
+            model.forward = eager_forward
+            model.generate(**inputs, **generate_kwargs)
+        if max_new_tokens <= 0:
+            return None
+        start = time.perf_counter()
+        output_ids = model.generate(**inputs, **generate_kwargs)
+        elapsed = time.perf_counter() - start
+    generated = output_ids.shape[-1] - inputs['input_ids'].shape[-1]
+    return generated / elapsed if elapsed > 0 else 0.0
+
 def initialize_model():
     """Initialize model with comprehensive error handling"""
-    global model, tokenizer, use_adapter, model_load_time
+    global model, tokenizer, use_adapter, model_load_time, model_runtime
     
     # Check if already loaded
     if model is not None and tokenizer is not None:
@@ -957,43 +1184,105 @@ def initialize_model():
     
     try:
         start_time = time.time()
-        print(f"🤖 Loading base model from: {BASE_MODEL_PATH}")
+        on_cuda = torch.cuda.is_available()
         print("⏳ This happens ONCE - subsequent requests use cached model...")
+
+        if not on_cuda:
+            torch.set_num_threads(TORCH_NUM_THREADS)
+            print(f"🧵 Torch intra-op threads: {TORCH_NUM_THREADS} ({WEB_CONCURRENCY} worker(s))")
         
-        tokenizer = AutoTokenizer.from_pretrained(BASE_MODEL_PATH, trust_remote_code=True)
+        # A merged checkpoint carries its own tokenizer, so the base model files are not needed
+        from_merged = _usable_merged_model()
+        tokenizer = AutoTokenizer.from_pretrained(MERGED_MODEL_PATH if from_merged else BASE_MODEL_PATH, trust_remote_code=True)
         if tokenizer.pad_token is None:
             tokenizer.pad_token = tokenizer.eos_token
 
-        base_model = AutoModelForCausalLM.from_pretrained(
-            BASE_MODEL_PATH,
-            trust_remote_code=True,
-            torch_dtype=torch.float16 if torch.cuda.is_available() else torch.float32,
-            device_map="auto" if torch.cuda.is_available() else None,
-            low_cpu_mem_usage=True
-        )
+        if on_cuda:
+            load_dtype = torch.float16
+        elif MODEL_CPU_DTYPE == "bf16":
+            load_dtype = torch.bfloat16
+        else:
+            load_dtype = torch.float32
+        load_kwargs = {
+            'trust_remote_code': True,
+            'torch_dtype': load_dtype,
+            'device_map': "auto" if on_cuda else None,
+            'low_cpu_mem_usage': True
+        }
 
-        try:
-            model = PeftModel.from_pretrained(base_model, ADAPTER_PATH)
+        adapter_merged = False
+        if from_merged:
+            # Adapter already folded in offline: one safetensors load, no PEFT wrapping
+            print(f"📦 Loading pre-merged model from: {MERGED_MODEL_PATH}")
+            model, attn_implementation = _load_base_model(MERGED_MODEL_PATH, **load_kwargs)
             print("✅ Fine-tuned model loaded successfully")
             use_adapter = True
-        except Exception as e:
-            print(f"⚠️ Could not load PEFT adapter: {e}")
-            model = base_model
-            use_adapter = False
+            adapter_merged = True
+        else:
+            print(f"🤖 Loading base model from: {BASE_MODEL_PATH}")
+            base_model, attn_implementation = _load_base_model(BASE_MODEL_PATH, **load_kwargs)
+            try:
+                model = PeftModel.from_pretrained(base_model, ADAPTER_PATH)
+                print("✅ Fine-tuned model loaded successfully")
+                use_adapter = True
+            except Exception as e:
+                print(f"⚠️ Could not load PEFT adapter: {e}")
+                model = base_model
+                use_adapter = False
+
+        # Folding LoRA into the base weights removes the per-layer adapter matmuls
+        if use_adapter and not adapter_merged and MODEL_MERGE_ADAPTER:
+            try:
+                model = model.merge_and_unload()
+                adapter_merged = True
+                print("✅ Adapter merged into base weights")
+            except Exception as e:
+                print(f"⚠️ Could not merge adapter: {e}")
 
         model = model.to(device)
         model.eval()
+
+        weight_dtype = "fp16" if on_cuda else "fp32"
+        if not on_cuda:
+            model, weight_dtype = _optimize_for_cpu(model)
         
-        # Enable optimizations
-        if hasattr(torch, 'compile') and torch.cuda.is_available():
+        # Enable optimizations; generate() calls forward, so compile that
+        compiled = False
+        eager_forward = model.forward
+        wants_compile = MODEL_TORCH_COMPILE in ("1", "true") or (MODEL_TORCH_COMPILE == "auto" and on_cuda)
+        if hasattr(torch, 'compile') and wants_compile:
             try:
-                model = torch.compile(model)
+                model.forward = torch.compile(model.forward, dynamic=True)
+                compiled = True
                 print("✅ Model compiled for faster inference")
-            except:
-                print("⚠️ Torch compile not available")
+            except Exception as e:
+                print(f"⚠️ Torch compile not available: {e}")
+
+        # A compiled model always gets the warm-up, since that is where compile errors show up
+        tokens_per_sec = None
+        if MODEL_BENCHMARK_TOKENS > 0 or compiled:
+            try:
+                tokens_per_sec = _measure_generation_speed(model, tokenizer, MODEL_BENCHMARK_TOKENS,
+                                                           eager_forward if compiled else None)
+                if tokens_per_sec is not None:
+                    tokens_per_sec = round(tokens_per_sec, 2)
+                    print(f"⚡ Generation speed: {tokens_per_sec} tokens/sec")
+            except Exception as e:
+                print(f"⚠️ Startup generation check failed: {e}")
+            compiled = compiled and model.forward is not eager_forward
         
         load_duration = time.time() - start_time
         model_load_time = datetime.now()
+        model_runtime = {
+            'source': 'merged' if from_merged else 'base+adapter',
+            'weights': weight_dtype,
+            'attention': attn_implementation,
+            'adapter_merged': adapter_merged,
+            'compiled': compiled,
+            'threads': torch.get_num_threads(),
+            'tokens_per_sec': tokens_per_sec,
+            'load_seconds': round(load_duration, 2)
+        }
         
         print(f"✅ Model loaded in {load_duration:.2f}s and CACHED in memory")
         print("✅ All future requests will use this cached model (no reloading!)")
@@ -1481,37 +1770,6 @@ def send_guardian_alert_email(guardian_email, user_name, user_message):
         print(f"❌ Guardian email error: {e}")
         return False
 
-def detect_suicide_risk(text):
-    """Detect suicide/self-harm indicators in user message"""
-    text_lower = text.lower()
-    
-    # High-risk keywords
-    high_risk_keywords = [
-        'suicide', 'kill myself', 'end my life', 'want to die', 'better off dead',
-        'no reason to live', 'ending it all', 'can\'t go on', 'goodbye forever',
-        'not worth living', 'kill me', 'wish i was dead', 'hang myself', 'overdose',
-        'shoot myself', 'jump off', 'slit my wrists'
-    ]
-    
-    # Medium-risk keywords
-    medium_risk_keywords = [
-        'self harm', 'hurt myself', 'cutting', 'worthless', 'hopeless',
-        'burden to everyone', 'everyone would be better without me',
-        'no point anymore', 'give up', 'can\'t take it anymore'
-    ]
-    
-    # Check high risk
-    for keyword in high_risk_keywords:
-        if keyword in text_lower:
-            return 'high', keyword
-    
-    # Check medium risk
-    for keyword in medium_risk_keywords:
-        if keyword in text_lower:
-            return 'medium', keyword
-    
-    return 'low', None
-
 @app.route("/auth/forgot-password", methods=["POST"])
 def forgot_password():
     """Send password reset code via email or SMS"""
@@ -1523,18 +1781,11 @@ def forgot_password():
         if not identifier:
             return jsonify({"error": "Email or phone required"}), 400
         
-        users = load_users()
-        
         # Find user by email or phone
-        user = None
         if method == 'email':
-            if identifier in users:
-                user = users[identifier]
+            user = user_repository.get(identifier)
         else:  # phone
-            for email, user_data in users.items():
-                if user_data.get('your_phone') == identifier:
-                    user = user_data
-                    break
+            user = user_repository.find_by_phone(identifier)
         
         if not user:
             return jsonify({"error": "User not found"}), 404
@@ -1543,11 +1794,7 @@ def forgot_password():
         code = ''.join([str(secrets.randbelow(10)) for _ in range(6)])
         
         # Store code with expiration
-        reset_codes[identifier] = {
-            'code': code,
-            'expires': datetime.now() + timedelta(minutes=10),
-            'attempts': 0
-        }
+        reset_codes.put(identifier, code)
         
         # Send code
         if method == 'email':
@@ -1572,9 +1819,6 @@ def forgot_password():
         print(f"Forgot password error: {e}")
         return jsonify({"error": "Failed to send reset code"}), 500
 
-# Add this global dictionary at the top with other globals (after reset_codes = {})
-verification_codes = {}  # Store email verification codes
-
 # Add this helper function after send_guardian_alert_email()
 def is_valid_email(email):
     """Validate email format"""
@@ -1659,9 +1903,7 @@ def check_email():
         if not is_valid_email(email):
             return jsonify({"error": "Invalid email format"}), 400
         
-        users = load_users()
-        
-        if email in users:
+        if user_repository.exists(email):
             return jsonify({
                 "exists": True,
                 "message": "This email is already registered. Please login instead."
@@ -1688,23 +1930,19 @@ def send_verification():
         
         # Check if email already exists (SAFE LOADING)
         try:
-            users = load_users()
+            already_registered = user_repository.exists(email)
         except Exception as load_error:
             print(f"⚠️ Database load error in send_verification: {load_error}")
-            users = {}  # ✅ Treat as empty database
+            already_registered = False  # ✅ Treat as empty database
         
-        if email in users:
+        if already_registered:
             return jsonify({"error": "Email already registered"}), 409
         
         # Generate 6-digit code
         code = ''.join([str(secrets.randbelow(10)) for _ in range(6)])
         
         # Store code with expiration
-        verification_codes[email] = {
-            'code': code,
-            'expires': datetime.now() + timedelta(minutes=10),
-            'attempts': 0
-        }
+        verification_codes.put(email, code)
         
         # Send verification email
         success = send_verification_email(email, code)
@@ -1733,26 +1971,19 @@ def verify_code():
         if not email or not code:
             return jsonify({"error": "Email and code required"}), 400
         
-        # Check if code exists
-        if email not in verification_codes:
-            return jsonify({"error": "Invalid or expired verification code"}), 400
+        # Check existence, expiration and attempts (prevent brute force) in one step
+        status, remaining = verification_codes.check(email, code)
         
-        stored_data = verification_codes[email]
+        if status == CODE_MISSING:
+            return jsonify({"error": "Invalid or expired verification code"}), 400
         
-        # Check expiration
-        if datetime.now() > stored_data['expires']:
-            del verification_codes[email]
+        if status == CODE_EXPIRED:
             return jsonify({"error": "Verification code expired. Please request a new one."}), 400
         
-        # Check attempts (prevent brute force)
-        if stored_data['attempts'] >= 5:
-            del verification_codes[email]
+        if status == CODE_LOCKED:
             return jsonify({"error": "Too many incorrect attempts. Please request a new code."}), 429
         
-        # Verify code
-        if stored_data['code'] != code:
-            verification_codes[email]['attempts'] += 1
-            remaining = 5 - verification_codes[email]['attempts']
+        if status != CODE_OK:
             return jsonify({
                 "error": f"Invalid code. {remaining} attempts remaining."
             }), 400
@@ -1779,49 +2010,32 @@ def reset_password():
         if not identifier or not code or not new_password:
             return jsonify({"error": "All fields required"}), 400
         
-        # Check if code exists
-        if identifier not in reset_codes:
-            return jsonify({"error": "Invalid or expired code"}), 400
+        # Check existence, expiration and attempts (prevent brute force) in one step
+        status, _ = reset_codes.check(identifier, code)
         
-        stored_data = reset_codes[identifier]
+        if status == CODE_MISSING:
+            return jsonify({"error": "Invalid or expired code"}), 400
         
-        # Check expiration
-        if datetime.now() > stored_data['expires']:
-            del reset_codes[identifier]
+        if status == CODE_EXPIRED:
             return jsonify({"error": "Code expired"}), 400
         
-        # Check attempts (prevent brute force)
-        if stored_data['attempts'] >= 5:
-            del reset_codes[identifier]
+        if status == CODE_LOCKED:
             return jsonify({"error": "Too many attempts"}), 429
         
-        # Verify code
-        if stored_data['code'] != code:
-            reset_codes[identifier]['attempts'] += 1
+        if status != CODE_OK:
             return jsonify({"error": "Invalid code"}), 400
         
-        # Update password
-        users = load_users()
-        
         # Find user
-        user_email = None
-        if identifier in users:
-            user_email = identifier
-        else:
-            for email, user_data in users.items():
-                if user_data.get('your_phone') == identifier:
-                    user_email = email
-                    break
+        user = user_repository.get(identifier) or user_repository.find_by_phone(identifier)
         
-        if not user_email:
+        if not user:
             return jsonify({"error": "User not found"}), 404
         
         # Update password
-        users[user_email]['password'] = generate_password_hash(new_password)
-        save_users(users)
+        user_repository.update(user['email'], password=generate_password_hash(new_password))
         
         # Clear reset code
-        del reset_codes[identifier]
+        reset_codes.discard(identifier)
         
         return jsonify({"success": True, "message": "Password reset successful"})
         
@@ -1840,11 +2054,10 @@ def send_crisis_alert():
         if not user_email:
             return jsonify({"error": "User not authenticated"}), 401
         
-        users = load_users()
-        if user_email not in users:
+        user = user_repository.get(user_email)
+        if not user:
             return jsonify({"error": "User not found"}), 404
         
-        user = users[user_email]
         guardian_phone = user.get('guardian_phone')
         user_name = user.get('name', 'User')
         
@@ -1879,6 +2092,7 @@ def home():
         "version": "2.0",
         "endpoints": {
             "chat": "/chat",
+            "chat_stream": "/chat/stream",
             "health": "/health"
         }
     })
@@ -1898,28 +2112,25 @@ def signup():
         if not email or not password:
             return jsonify({"error": "Email and password required"}), 400
         
-        # Verify email code before allowing signup
-        if email not in verification_codes:
-            return jsonify({"error": "Please verify your email first"}), 400
+        # Verify email code before allowing signup (wrong codes here are not counted as attempts)
+        status, _ = verification_codes.check(email, verification_code, count_attempt=False)
         
-        stored_data = verification_codes[email]
+        if status == CODE_MISSING:
+            return jsonify({"error": "Please verify your email first"}), 400
         
         # Check if code expired
-        if datetime.now() > stored_data['expires']:
-            del verification_codes[email]
+        if status == CODE_EXPIRED:
             return jsonify({"error": "Verification expired. Please start again."}), 400
         
+        if status == CODE_LOCKED:
+            return jsonify({"error": "Too many incorrect attempts. Please request a new code."}), 429
+        
         # Verify the code matches
-        if stored_data['code'] != verification_code:
+        if status != CODE_OK:
             return jsonify({"error": "Invalid verification code"}), 400
         
-        users = load_users()
-        
-        if email in users:
-            return jsonify({"error": "User already exists"}), 409
-        
         # Create new user
-        users[email] = {
+        created = user_repository.create(email, {
             "email": email,
             "password": generate_password_hash(password),
             "name": name,
@@ -1928,12 +2139,13 @@ def signup():
             "your_phone": your_phone,
             "created_at": datetime.now().isoformat(),
             "email_verified": True  # Mark as verified
-        }
+        })
         
-        save_users(users)
+        if not created:
+            return jsonify({"error": "User already exists"}), 409
         
         # Clear verification code after successful signup
-        del verification_codes[email]
+        verification_codes.discard(email)
         
         # Set session
         session['user_email'] = email
@@ -1963,13 +2175,11 @@ def login():
         if not email or not password:
             return jsonify({"error": "Email and password required"}), 400
         
-        users = load_users()
+        user = user_repository.get(email)
         
-        if email not in users:
+        if not user:
             return jsonify({"error": "User not found"}), 404
         
-        user = users[email]
-        
         if not check_password_hash(user["password"], password):
             return jsonify({"error": "Invalid password"}), 401
         
@@ -2002,11 +2212,10 @@ def get_current_user():
     if not email:
         return jsonify({"error": "Not authenticated"}), 401
     
-    users = load_users()
-    if email not in users:
+    user = user_repository.get(email)
+    if not user:
         return jsonify({"error": "User not found"}), 404
     
-    user = users[email]
     return jsonify({
         "user": {
             "email": email,
@@ -2023,8 +2232,15 @@ def get_chat_history():
     if not email:
         return jsonify({"error": "Not authenticated"}), 401
     
-    chats = load_user_chats(email)
-    return jsonify({"chats": chats})
+    # Cursor pagination: ?limit=N returns the N newest chats, ?before=<next_before> pages back.
+    # Without parameters the whole history is returned, as before.
+    before = request.args.get("before", type=int)
+    limit = request.args.get("limit", type=int)
+    if limit is not None and limit < 1:
+        return jsonify({"error": "limit must be positive"}), 400
+    
+    chats, next_before = chat_store.page(email, before=before, limit=limit)
+    return jsonify({"chats": chats, "next_before": next_before})
 
 @app.route("/chat/save", methods=["POST"])
 def save_chat():
@@ -2039,8 +2255,70 @@ def save_chat():
         "timestamp": datetime.now().isoformat()
     }
     
-    save_user_chat(email, chat_data)
+    seq = chat_store.save(email, chat_data)
+    try:
+        chat_search.index_chat(email, chat_data, seq)
+    except Exception as e:
+        print(f"⚠️ Chat search indexing failed: {e}")
     return jsonify({"success": True})
+
+@app.route("/chat/search", methods=["GET"])
+def search_chats():
+    email = session.get('user_email')
+    if not email:
+        return jsonify({"error": "Not authenticated"}), 401
+    
+    query = request.args.get("q", "").strip()
+    if not query:
+        return jsonify({"error": "Search query required"}), 400
+    if not chat_search.available:
+        return jsonify({"error": "Chat search is not available"}), 503
+    limit = min(max(request.args.get("limit", 20, type=int), 1), 100)
+    
+    start = time.perf_counter()
+    try:
+        results = chat_search.search(email, query, limit=limit)
+    except Exception as e:
+        print(f"Chat search error: {e}")
+        return jsonify({"error": "Search failed"}), 500
+    
+    return jsonify({
+        "query": query,
+        "results": results,
+        "took_ms": round((time.perf_counter() - start) * 1000, 2)
+    })
+
+def route_chat_response(user_message, response_type):
+    """Dispatch a chat message to the generator for the selected response mode"""
+    response = None
+    
+    if response_type == "training":
+        response = generate_training_response(user_message)
+    elif response_type == "professional":
+        response = generate_professional_response(user_message)
+    elif response_type == "web":
+        response = generate_web_response(user_message)
+    elif response_type == "rag":  # NEW MODE!
+        response = generate_rag_response(user_message, use_web_augmentation=True)
+    elif response_type == "mix":
+        response = generate_mixed_response(user_message)  # NEW - optimized version!
+    else:
+        response = generate_professional_response(user_message)
+    
+    if not response:
+        response = {
+            'answer': "I'm sorry, I'm having trouble generating a response right now. Please try again or select a different response mode. For immediate mental health crisis support, please contact 988 (Suicide & Crisis Lifeline).",
+            'sources': [],
+            'type': 'error',
+            'confidence': 0.0
+        }
+    
+    return response
+
+def format_sse(event, payload):
+    """Encode one Server-Sent Events frame"""
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
 # NEW: Updated chat endpoint with RAG mode
 @app.route("/chat", methods=["POST"])
 def chat():
@@ -2069,28 +2347,7 @@ def chat():
             pass
         
         # MAIN RESPONSE ROUTING (UPDATED)
-        response = None
-        
-        if response_type == "training":
-            response = generate_training_response(user_message)
-        elif response_type == "professional":
-            response = generate_professional_response(user_message)
-        elif response_type == "web":
-            response = generate_web_response(user_message)
-        elif response_type == "rag":  # NEW MODE!
-            response = generate_rag_response(user_message, use_web_augmentation=True)
-        elif response_type == "mix":
-            response = generate_mixed_response(user_message)  # NEW - optimized version!
-        else:
-            response = generate_professional_response(user_message)
-        
-        if not response:
-            response = {
-                'answer': "I'm sorry, I'm having trouble generating a response right now. Please try again or select a different response mode. For immediate mental health crisis support, please contact 988 (Suicide & Crisis Lifeline).",
-                'sources': [],
-                'type': 'error',
-                'confidence': 0.0
-            }
+        response = route_chat_response(user_message, response_type)
         
         return jsonify({"response": response})
         
@@ -2105,6 +2362,59 @@ def chat():
                 "confidence": 0.0
             }
         }), 500
+
+@app.route("/chat/stream", methods=["POST"])
+def chat_stream():
+    """
+    Streaming variant of /chat (Server-Sent Events).
+    Emits `token` events as text is produced and a trailing `done` event
+    carrying the full response envelope (answer, sources, confidence).
+    Only the training model decodes token-by-token; other modes send their
+    answer as a single token event.
+    """
+    email = session.get('user_email')
+    
+    data = request.json or {}
+    user_message = data.get("message", "").strip()
+    response_type = data.get("response_type", "training")
+    
+    if not user_message:
+        return jsonify({"error": "No message provided"}), 400
+    
+    print(f"🤖 Streaming: {user_message} | Type: {response_type} | User: {email or 'anonymous'}")
+    
+    def generate_events():
+        try:
+            if response_type == "training" and ai_generator is not None:
+                for kind, payload in ai_generator.generate_ai_response_stream(user_message):
+                    if kind == 'token':
+                        yield format_sse('token', {'text': payload})
+                    else:
+                        yield format_sse('done', {'response': payload})
+                return
+            
+            response = route_chat_response(user_message, response_type)
+            yield format_sse('token', {'text': response['answer']})
+            yield format_sse('done', {'response': response})
+        
+        except Exception as e:
+            print(f"❌ Error in chat stream: {e}")
+            yield format_sse('error', {
+                "error": "Internal server error",
+                "response": {
+                    "answer": "I'm experiencing technical difficulties. Please try again in a moment. For immediate mental health crisis support, please contact 988 (Suicide & Crisis Lifeline).",
+                    "sources": [],
+                    "type": "error",
+                    "confidence": 0.0
+                }
+            })
+    
+    return Response(
+        stream_with_context(generate_events()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 @app.route("/health")
 def health():
     return jsonify({
@@ -2115,16 +2425,19 @@ def health():
         "tokenizer_loaded": tokenizer is not None,
         "adapter_loaded": use_adapter,
         "device": str(device),
+        "model_runtime": model_runtime,
+        "generation_batching": ai_generator.scheduler.get_stats() if ai_generator and ai_generator.scheduler else None,
         "ollama_status": {  # CHANGED from gemini_status
             "enabled": ollama_client is not None,  # CHANGED
             "model": LLM_MODEL_NAME,
   # NEW
             "api_url": LLM_API_URL if ollama_client else None,  # NEW
-            "used_today": ollama_rate_limiter['request_count_day'],  # CHANGED
-            "used_this_minute": ollama_rate_limiter['request_count_minute'],  # CHANGED
-            "remaining_today": 10000 - ollama_rate_limiter['request_count_day'],  # CHANGED limits
-            "remaining_minute": 60 - ollama_rate_limiter['request_count_minute']  # CHANGED limits
+            "rate_limit": ollama_rate_limiter.snapshot()
         },
+        "response_cache": llm_response_cache.get_stats(),
+        "user_profile_cache": user_repository.get_stats(),
+        "query_embedding_cache": rag_retriever.retriever.query_cache.get_stats(),
+        "reranker": rag_retriever.retriever.get_rerank_stats(),
         "features": {
             "training_model": "✅ Available",
             "professional_responses": f"✅ {LLM_MODEL_NAME}" if ollama_client else "✅ Fallback",
@@ -0,0 +1,654 @@
+# benchmarks.py - OFFLINE PERFORMANCE CHECKS
+"""
+Offline micro-benchmarks for NISRA's backend components.
+
+Usage:
+    python benchmarks.py llm-pool [--requests 50]
+    python benchmarks.py fusion [--sizes 10000 100000 1000000] [--density 0.05]
+    python benchmarks.py ann [--k 5] [--synthetic 100000]
+    python benchmarks.py phrases [--log messages.txt] [--repeat 5]
+    python benchmarks.py backends [--backends torch onnx onnx-int8] [--queries 200]
+    python benchmarks.py startup [--paths adapter merged] [--runs 3]
+    python benchmarks.py users [--sizes 1000 10000 100000] [--processes 4 --threads 8]
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def _print_latencies(label, latencies):
+    latencies_ms = [t * 1000 for t in latencies]
+    print(f"   {label:<28} mean {statistics.mean(latencies_ms):7.2f} ms | "
+          f"p50 {statistics.median(latencies_ms):7.2f} ms | max {max(latencies_ms):7.2f} ms")
+
+
+# ============================================================================
+# LLM HTTP POOL
+# ============================================================================
+
+class _StubLLMHandler(BaseHTTPRequestHandler):
+    """OpenAI-compatible /chat/completions stub that counts TCP connections"""
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    connections = 0
+    connections_lock = threading.Lock()
+
+    def setup(self):
+        super().setup()
+        with _StubLLMHandler.connections_lock:
+            _StubLLMHandler.connections += 1
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        self.rfile.read(length)
+        body = json.dumps({
+            'choices': [{'message': {'role': 'assistant', 'content': 'stub response'}}]
+        }).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def bench_llm_pool(args):
+    import httpx
+    import llm_client
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _StubLLMHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    config = {
+        'api_url': f"http://127.0.0.1:{server.server_port}/v1/chat/completions",
+        'api_key': 'stub',
+        'model': 'stub-model'
+    }
+    print(f"🧪 Stub LLM server on {config['api_url']} - {args.requests} requests per client")
+
+    headers, payload = llm_client.build_llm_request(config, "ping", 16, 0.0)
+
+    _StubLLMHandler.connections = 0
+    fresh = []
+    for _ in range(args.requests):
+        start = time.perf_counter()
+        httpx.post(config['api_url'], headers=headers, json=payload)
+        fresh.append(time.perf_counter() - start)
+    fresh_connections = _StubLLMHandler.connections
+
+    llm_client.call_llm_api(config, "warmup", max_tokens=16)
+    _StubLLMHandler.connections = 0
+    pooled = []
+    for _ in range(args.requests):
+        start = time.perf_counter()
+        llm_client.call_llm_api(config, "ping", max_tokens=16)
+        pooled.append(time.perf_counter() - start)
+    pooled_connections = _StubLLMHandler.connections
+
+    async def _async_pooled():
+        timings = []
+        for _ in range(args.requests):
+            start = time.perf_counter()
+            await llm_client.acall_llm_api(config, "ping", max_tokens=16)
+            timings.append(time.perf_counter() - start)
+        await llm_client.aclose_http_clients()
+        return timings
+
+    _StubLLMHandler.connections = 0
+    async_pooled = asyncio.run(_async_pooled())
+    async_connections = _StubLLMHandler.connections
+
+    print("\n📊 Results:")
+    _print_latencies(f"fresh connection ({fresh_connections} conns)", fresh)
+    _print_latencies(f"pooled client ({pooled_connections} conns)", pooled)
+    _print_latencies(f"async pooled ({async_connections} conns)", async_pooled)
+
+    llm_client.close_http_clients()
+    server.shutdown()
+    server.server_close()
+
+
+# ============================================================================
+# HYBRID SCORE FUSION
+# ============================================================================
+
+def _dict_fusion(num_docs, faiss_idx, faiss_dist, bm25_dense, topk, alpha=0.7):
+    """The pre-vectorization fusion loop (dense BM25 vector, Python dict, full sort)"""
+    import numpy as np
+
+    combined = {}
+    max_dist = faiss_dist[0] if len(faiss_dist) > 0 else 1
+    for i, idx in enumerate(faiss_idx):
+        if idx < num_docs:
+            combined[int(idx)] = alpha * (1 / (1 + faiss_dist[i] / max_dist))
+
+    max_bm25 = np.max(bm25_dense) if np.max(bm25_dense) > 0 else 1
+    for idx, score in enumerate(bm25_dense):
+        normalized = score / max_bm25
+        if idx in combined:
+            combined[idx] += (1 - alpha) * normalized
+        else:
+            combined[idx] = (1 - alpha) * normalized
+
+    return sorted(combined.items(), key=lambda x: x[1], reverse=True)[:topk]
+
+
+def bench_fusion(args):
+    import numpy as np
+    from rag_retriever import fuse_hybrid_scores
+
+    rng = np.random.default_rng(0)
+    topk = 5
+    print(f"🧪 Fusion benchmark - topk={topk}, BM25 hit density {args.density:.0%}, {args.queries} queries per size")
+
+    for num_docs in args.sizes:
+        faiss_idx = rng.choice(num_docs, topk * 3, replace=False)
+        faiss_dist = np.sort(rng.uniform(0.5, 1.5, topk * 3))
+        hits = max(1, int(num_docs * args.density))
+        bm25_idx = np.sort(rng.choice(num_docs, hits, replace=False))
+        bm25_scores = rng.gamma(2.0, 2.0, hits)
+        bm25_dense = np.zeros(num_docs)
+        bm25_dense[bm25_idx] = bm25_scores
+
+        print(f"\n📊 {num_docs:,} documents ({hits:,} BM25 candidates)")
+        for method in ('weighted', 'rrf'):
+            timings = []
+            for _ in range(args.queries):
+                start = time.perf_counter()
+                fuse_hybrid_scores(num_docs, faiss_idx, faiss_dist, bm25_idx, bm25_scores, topk, method=method)
+                timings.append(time.perf_counter() - start)
+            _print_latencies(f"vectorized ({method})", timings)
+
+        if num_docs <= args.dict_limit:
+            timings = []
+            for _ in range(max(1, args.queries // 10)):
+                start = time.perf_counter()
+                _dict_fusion(num_docs, faiss_idx, faiss_dist, bm25_dense, topk)
+                timings.append(time.perf_counter() - start)
+            _print_latencies("dict loop (previous)", timings)
+
+
+# ============================================================================
+# APPROXIMATE NEAREST-NEIGHBOUR INDEXES
+# ============================================================================
+
+def _load_corpus_pairs(data_dir="document_store"):
+    from rag_retriever import MultiFileRAGRetriever
+
+    questions = []
+    answers = []
+    for path in sorted(Path(data_dir).glob('*.csv')):
+        file_questions, file_answers, _ = MultiFileRAGRetriever._load_data_from_file(path)
+        questions.extend(file_questions)
+        answers.extend(file_answers)
+    return questions, answers
+
+
+def _load_corpus_questions(data_dir="document_store"):
+    return _load_corpus_pairs(data_dir)[0]
+
+
+def _corpus_embeddings(args):
+    """mpnet embeddings of the document_store questions, or clustered random vectors"""
+    import numpy as np
+
+    if args.synthetic:
+        rng = np.random.default_rng(0)
+        centers = rng.normal(size=(256, 768)).astype('float32')
+        vectors = centers[rng.integers(0, 256, args.synthetic)] + 0.5 * rng.normal(size=(args.synthetic, 768)).astype('float32')
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors
+
+    from sentence_transformers import SentenceTransformer
+    questions = _load_corpus_questions(args.data_dir)
+    model = SentenceTransformer('sentence-transformers/all-mpnet-base-v2')
+    return model.encode(questions, batch_size=64, show_progress_bar=True, convert_to_numpy=True).astype('float32')
+
+
+def _search_latency(index, queries, k):
+    timings = []
+    results = []
+    for row in queries:
+        start = time.perf_counter()
+        _, idx = index.search(row.reshape(1, -1), k)
+        timings.append(time.perf_counter() - start)
+        results.append(idx[0])
+    return timings, results
+
+
+def bench_ann(args):
+    import numpy as np
+    from rag_retriever import create_faiss_index, set_faiss_search_params
+
+    vectors = _corpus_embeddings(args)
+    corpus, queries = vectors[:-args.queries], vectors[-args.queries:]
+    print(f"🧪 ANN benchmark - {len(corpus):,} vectors, {len(queries)} held-out queries, recall@{args.k}")
+
+    flat, _ = create_faiss_index('flat', corpus.shape[1], len(corpus))
+    flat.add(corpus)
+    flat_timings, truth = _search_latency(flat, queries, args.k)
+
+    print("\n📊 Results:")
+    _print_latencies("flat (exact)        recall 1.000", flat_timings)
+
+    sweeps = {
+        'ivf_flat': [('nprobe', n) for n in (1, 4, 16, 64)],
+        'ivf_pq': [('nprobe', n) for n in (1, 4, 16, 64)],
+        'hnsw': [('efSearch', n) for n in (16, 64, 256)]
+    }
+    for index_type, settings in sweeps.items():
+        start = time.perf_counter()
+        index, config = create_faiss_index(index_type, corpus.shape[1], len(corpus))
+        if not index.is_trained:
+            index.train(corpus)
+        index.add(corpus)
+        print(f"   {config} built in {time.perf_counter() - start:.1f}s")
+
+        for name, value in settings:
+            set_faiss_search_params(index, nprobe=value, ef_search=value)
+            timings, found = _search_latency(index, queries, args.k)
+            recall = np.mean([len(set(f) & set(t)) / args.k for f, t in zip(found, truth)])
+            _print_latencies(f"{index_type} {name}={value:<4} recall {recall:.3f}", timings)
+
+
+# ============================================================================
+# GREETING / RISK PHRASE MATCHING
+# ============================================================================
+
+def _legacy_is_greeting(query, phrases, keywords):
+    """The previous _is_greeting: rebuild the phrase sets, then a startswith loop"""
+    query_clean = query.lower().strip().rstrip('!?.,:;')
+    all_greeting_phrases = set().union(*[set(group) for group in phrases.values()])
+
+    if query_clean in all_greeting_phrases:
+        return True
+    for phrase in all_greeting_phrases:
+        if query_clean.startswith(phrase):
+            return True
+
+    if len(query_clean.split()) <= 3:
+        if set(query_clean.split()) & set(keywords):
+            return True
+    return False
+
+
+def _legacy_suicide_risk(text, high, medium):
+    """The previous detect_suicide_risk: one substring scan per keyword"""
+    text_lower = text.lower()
+    for keyword in high:
+        if keyword in text_lower:
+            return 'high', keyword
+    for keyword in medium:
+        if keyword in text_lower:
+            return 'medium', keyword
+    return 'low', None
+
+
+def _load_message_log(path):
+    """One message per line, or JSONL with a 'message'/'text' field"""
+    messages = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if path.endswith('.jsonl'):
+                record = json.loads(line)
+                line = record.get('message') or record.get('text') or ''
+            messages.append(line)
+    return messages
+
+
+def _time_replay(fn, messages, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for message in messages:
+            fn(message)
+    return (time.perf_counter() - start) / (repeat * len(messages))
+
+
+def bench_phrases(args):
+    from rag_retriever import MultiFileRAGRetriever, GREETING_PHRASES, GREETING_KEYWORDS
+    from risk_detection import detect_suicide_risk, HIGH_RISK_KEYWORDS, MEDIUM_RISK_KEYWORDS
+
+    messages = _load_message_log(args.log) if args.log else _load_corpus_questions(args.data_dir)
+    messages = [m for m in messages if isinstance(m, str)]
+    print(f"🧪 Phrase matcher benchmark - {len(messages):,} replayed messages x {args.repeat}")
+
+    # _is_greeting does not touch instance state
+    is_greeting = lambda message: MultiFileRAGRetriever._is_greeting(None, message)
+    legacy_greeting = lambda message: _legacy_is_greeting(message, GREETING_PHRASES, GREETING_KEYWORDS)
+    legacy_risk = lambda message: _legacy_suicide_risk(message, HIGH_RISK_KEYWORDS, MEDIUM_RISK_KEYWORDS)
+
+    greeting_mismatches = sum(is_greeting(m) != legacy_greeting(m) for m in messages)
+    risk_mismatches = sum(detect_suicide_risk(m) != legacy_risk(m) for m in messages)
+    print(f"   mismatches vs previous implementation: greeting {greeting_mismatches}, risk {risk_mismatches}")
+
+    print("\n📊 Mean time per message (best of 3 replays):")
+    timings = {}
+    for label, fn in (
+        ("_is_greeting (previous)", legacy_greeting),
+        ("_is_greeting (matcher)", is_greeting),
+        ("detect_suicide_risk (previous)", legacy_risk),
+        ("detect_suicide_risk (matcher)", detect_suicide_risk)
+    ):
+        timings[label] = min(_time_replay(fn, messages, args.repeat) for _ in range(3))
+        print(f"   {label:<32} {timings[label] * 1e6:8.2f} us")
+
+    # Risk screening runs on every message; it must not regress (5% allowance for timer noise)
+    baseline = timings["detect_suicide_risk (previous)"]
+    assert timings["detect_suicide_risk (matcher)"] <= baseline * 1.05, \
+        f"detect_suicide_risk is slower than the previous implementation ({baseline * 1e6:.2f} us)"
+
+
+# ============================================================================
+# EMBEDDING / RERANKER MODEL BACKENDS
+# ============================================================================
+
+def _exact_top_k(corpus, queries, k):
+    import faiss
+
+    index = faiss.IndexFlatL2(corpus.shape[1])
+    index.add(corpus)
+    return index.search(queries, k)[1]
+
+
+def _recall(found, truth):
+    import numpy as np
+    return float(np.mean([len(set(f) & set(t)) / len(t) for f, t in zip(found, truth)]))
+
+
+def bench_backends(args):
+    import numpy as np
+    from sentence_transformers import SentenceTransformer, CrossEncoder
+    from rag_retriever import load_sentence_model, EMBEDDING_MODEL_NAME, RERANKER_MODEL_NAME
+
+    pairs = [(q, a) for q, a in zip(*_load_corpus_pairs(args.data_dir)) if isinstance(q, str) and isinstance(a, str)]
+    questions = [q for q, _ in pairs]
+    answers = [a for _, a in pairs]
+    # Held-out questions are the queries; the rest is the corpus
+    corpus_text, query_text = questions[:-args.queries], questions[-args.queries:]
+    print(f"🧪 Backend benchmark - {len(corpus_text):,} corpus questions, {len(query_text)} queries, recall@{args.k}")
+
+    results = {}
+    for backend in args.backends:
+        model, used = load_sentence_model(SentenceTransformer, EMBEDDING_MODEL_NAME, backend,
+                                          args.onnx_dir, args.quantization)
+        corpus = model.encode(corpus_text, batch_size=64, convert_to_numpy=True).astype('float32')
+        queries = model.encode(query_text, batch_size=64, convert_to_numpy=True).astype('float32')
+        timings = []
+        for text in query_text:
+            start = time.perf_counter()
+            model.encode([text], convert_to_numpy=True)
+            timings.append(time.perf_counter() - start)
+
+        reranker, reranker_used = load_sentence_model(CrossEncoder, RERANKER_MODEL_NAME, backend,
+                                                      args.onnx_dir, args.quantization, max_length=256)
+        top = _exact_top_k(corpus, queries, 9)
+        rerank_timings = []
+        rerank_orders = []
+        for text, candidates in zip(query_text, top):
+            pairs = [[text, answers[i]] for i in candidates]
+            start = time.perf_counter()
+            scores = reranker.predict(pairs)
+            rerank_timings.append(time.perf_counter() - start)
+            rerank_orders.append([candidates[i] for i in np.argsort(-np.asarray(scores))[:3]])
+
+        results[backend] = {'used': used, 'reranker_used': reranker_used, 'corpus': corpus, 'queries': queries,
+                            'encode': timings, 'rerank': rerank_timings, 'rerank_orders': rerank_orders}
+
+    baseline = results.get('torch') or next(iter(results.values()))
+    truth = _exact_top_k(baseline['corpus'], baseline['queries'], args.k)
+
+    print(f"\n📊 Retrieval recall@{args.k} vs torch (own index / torch-built index):")
+    for backend, result in results.items():
+        own = _recall(_exact_top_k(result['corpus'], result['queries'], args.k), truth)
+        mixed = _recall(_exact_top_k(baseline['corpus'], result['queries'], args.k), truth)
+        print(f"   {backend:<10} ({result['used']:<9}) {own:.3f} / {mixed:.3f}")
+
+    print("\n📊 Latency:")
+    for backend, result in results.items():
+        _print_latencies(f"{backend} query encode", result['encode'])
+    for backend, result in results.items():
+        agreement = _recall(result['rerank_orders'], baseline['rerank_orders'])
+        _print_latencies(f"{backend} rerank 9 (top-3 {agreement:.2f})", result['rerank'])
+
+
+# ============================================================================
+# MODEL STARTUP
+# ============================================================================
+
+def _load_model_child(args):
+    """Runs in a fresh interpreter: load one way, print load time and peak RSS as JSON"""
+    import resource
+    start = time.perf_counter()
+    import torch
+    from transformers import AutoModelForCausalLM
+    imported = time.perf_counter()
+
+    dtype = {'fp32': torch.float32, 'bf16': torch.bfloat16}[args.dtype]
+    if args.child == 'merged':
+        model = AutoModelForCausalLM.from_pretrained(args.merged, torch_dtype=dtype, low_cpu_mem_usage=True)
+    else:
+        from peft import PeftModel
+        model = AutoModelForCausalLM.from_pretrained(args.base, torch_dtype=dtype, low_cpu_mem_usage=True)
+        model = PeftModel.from_pretrained(model, args.adapter)
+        if args.child == 'adapter-merge':
+            model = model.merge_and_unload()
+    model.eval()
+    loaded = time.perf_counter()
+
+    # ru_maxrss is KiB on Linux
+    print(json.dumps({
+        'import_s': imported - start,
+        'load_s': loaded - imported,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    }))
+
+
+def bench_startup(args):
+    if args.child:
+        _load_model_child(args)
+        return
+
+    print(f"🧪 Model startup - {args.runs} run(s) per path, {args.dtype} weights, fresh process each run")
+    for path in args.paths:
+        command = [sys.executable, __file__, 'startup', '--child', path, '--dtype', args.dtype,
+                   '--base', args.base, '--adapter', args.adapter, '--merged', args.merged]
+        runs = []
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            result = subprocess.run(command, capture_output=True, text=True)
+            wall = time.perf_counter() - start
+            if result.returncode != 0:
+                print(f"   {path:<14} failed: {result.stderr.strip().splitlines()[-1:]}")
+                break
+            stats = json.loads(result.stdout.strip().splitlines()[-1])
+            stats['wall_s'] = wall
+            runs.append(stats)
+        if not runs:
+            continue
+
+        print(f"   {path:<14} process {statistics.mean(r['wall_s'] for r in runs):6.2f} s | "
+              f"model load {statistics.mean(r['load_s'] for r in runs):6.2f} s | "
+              f"peak RSS {max(r['peak_rss_mb'] for r in runs):8.1f} MB")
+
+
+# ============================================================================
+# USER STORE
+# ============================================================================
+
+def _legacy_load_users(path):
+    # users.json handling from before UserRepository: unreadable file -> empty database
+    try:
+        content = path.read_text().strip()
+        return json.loads(content) if content else {}
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+
+def _legacy_save_users(path, users):
+    with open(path, 'w') as f:
+        json.dump(users, f, indent=2)
+
+
+def _fake_user(email, i):
+    return {'email': email, 'password': 'pbkdf2:sha256:600000$' + 'x' * 80, 'name': f"User {i}",
+            'gender': '', 'guardian_phone': f"+1555{i:07d}", 'your_phone': f"+1444{i:07d}",
+            'created_at': '2025-01-01T00:00:00', 'email_verified': True}
+
+
+def _signup_worker(backend, path, worker, threads, signups):
+    from user_store import UserRepository
+    path = Path(path)
+    repository = UserRepository(path) if backend == 'sqlite' else None
+
+    def run(thread):
+        for i in range(signups):
+            email = f"w{worker}t{thread}u{i}@example.com"
+            if repository:
+                repository.create(email, _fake_user(email, i))
+            else:
+                users = _legacy_load_users(path)
+                users[email] = _fake_user(email, i)
+                _legacy_save_users(path, users)
+
+    workers = [threading.Thread(target=run, args=(t,)) for t in range(threads)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+
+
+def bench_users(args):
+    import random
+    import tempfile
+    from user_store import UserRepository
+
+    print(f"🧪 User store - lookup latency ({args.lookups} lookups per size)")
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.sizes:
+            json_path = Path(tmp) / f"users_{size}.json"
+            emails = [f"user{i}@example.com" for i in range(size)]
+            _legacy_save_users(json_path, {email: _fake_user(email, i) for i, email in enumerate(emails)})
+
+            start = time.perf_counter()
+            repository = UserRepository(Path(tmp) / f"users_{size}.db", legacy_json_path=json_path)
+            migration = time.perf_counter() - start
+
+            picks = [random.randrange(size) for _ in range(args.lookups)]
+            timings = {'json email': [], 'json phone scan': [], 'sqlite email': [], 'sqlite phone': []}
+            for i in picks:
+                phone = f"+1444{i:07d}"
+                start = time.perf_counter()
+                _legacy_load_users(json_path).get(emails[i])
+                timings['json email'].append(time.perf_counter() - start)
+                start = time.perf_counter()
+                next((u for u in _legacy_load_users(json_path).values() if u.get('your_phone') == phone), None)
+                timings['json phone scan'].append(time.perf_counter() - start)
+                start = time.perf_counter()
+                assert repository.get(emails[i])['email'] == emails[i]
+                timings['sqlite email'].append(time.perf_counter() - start)
+                start = time.perf_counter()
+                assert repository.find_by_phone(phone)['email'] == emails[i]
+                timings['sqlite phone'].append(time.perf_counter() - start)
+
+            print(f"\n   {size:,} users (migration {migration:.2f}s)")
+            for label, latencies in timings.items():
+                _print_latencies(label, latencies)
+
+        expected = args.processes * args.threads * args.signups
+        print(f"\n🧪 Concurrent signups - {args.processes} processes x {args.threads} threads x {args.signups} signups")
+        for backend in ('json', 'sqlite'):
+            path = Path(tmp) / ("race.json" if backend == 'json' else "race.db")
+            if backend == 'json':
+                _legacy_save_users(path, {})
+            else:
+                UserRepository(path)
+
+            start = time.perf_counter()
+            processes = [multiprocessing.Process(target=_signup_worker,
+                                                 args=(backend, str(path), w, args.threads, args.signups))
+                         for w in range(args.processes)]
+            for p in processes:
+                p.start()
+            for p in processes:
+                p.join()
+            elapsed = time.perf_counter() - start
+
+            stored = len(_legacy_load_users(path)) if backend == 'json' else UserRepository(path).count()
+            print(f"   {backend:<7} stored {stored:>6,} / {expected:,} | lost {expected - stored:>6,} | "
+                  f"{expected / elapsed:8.1f} signups/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="NISRA offline benchmarks")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    llm_pool = subparsers.add_parser('llm-pool', help="Connection reuse of the pooled LLM client against a local stub")
+    llm_pool.add_argument('--requests', type=int, default=50)
+    llm_pool.set_defaults(func=bench_llm_pool)
+
+    fusion = subparsers.add_parser('fusion', help="Per-query hybrid score fusion time vs corpus size")
+    fusion.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    fusion.add_argument('--density', type=float, default=0.05, help="Fraction of documents matching a query term")
+    fusion.add_argument('--queries', type=int, default=50)
+    fusion.add_argument('--dict-limit', type=int, default=1_000_000, help="Largest size to run the dict baseline on")
+    fusion.set_defaults(func=bench_fusion)
+
+    ann = subparsers.add_parser('ann', help="Recall@k vs latency of ANN indexes against the flat baseline")
+    ann.add_argument('--k', type=int, default=5)
+    ann.add_argument('--queries', type=int, default=200)
+    ann.add_argument('--data-dir', default="document_store")
+    ann.add_argument('--synthetic', type=int, default=0, help="Use N clustered random vectors instead of mpnet embeddings")
+    ann.set_defaults(func=bench_ann)
+
+    phrases = subparsers.add_parser('phrases', help="Greeting and risk phrase matching over a replayed message log")
+    phrases.add_argument('--log', help="Message log (.txt one per line, or .jsonl); defaults to document_store questions")
+    phrases.add_argument('--data-dir', default="document_store")
+    phrases.add_argument('--repeat', type=int, default=5)
+    phrases.set_defaults(func=bench_phrases)
+
+    backends = subparsers.add_parser('backends', help="Recall@k and latency of ONNX / int8 model backends vs torch")
+    backends.add_argument('--backends', nargs='+', default=['torch', 'onnx', 'onnx-int8'])
+    backends.add_argument('--k', type=int, default=5)
+    backends.add_argument('--queries', type=int, default=200)
+    backends.add_argument('--data-dir', default="document_store")
+    backends.add_argument('--onnx-dir', default="./onnx_models")
+    backends.add_argument('--quantization', default="avx2")
+    backends.set_defaults(func=bench_backends)
+
+    startup = subparsers.add_parser('startup', help="Startup time and peak RSS: base + adapter vs pre-merged model")
+    startup.add_argument('--paths', nargs='+', default=['adapter', 'adapter-merge', 'merged'],
+                         help="adapter = PeftModel wrap, adapter-merge = wrap + merge_and_unload, merged = merge_adapter.py output")
+    startup.add_argument('--runs', type=int, default=3)
+    startup.add_argument('--dtype', choices=['fp32', 'bf16'], default='fp32')
+    startup.add_argument('--base', default="./TinyLlama-1.1B-Chat-v1.0")
+    startup.add_argument('--adapter', default="./trained_model")
+    startup.add_argument('--merged', default="./merged_model")
+    startup.add_argument('--child', choices=['adapter', 'adapter-merge', 'merged'], help=argparse.SUPPRESS)
+    startup.set_defaults(func=bench_startup)
+
+    users = subparsers.add_parser('users', help="users.json vs SQLite user store: lookups and concurrent signups")
+    users.add_argument('--sizes', type=int, nargs='+', default=[1_000, 10_000, 100_000])
+    users.add_argument('--lookups', type=int, default=50)
+    users.add_argument('--processes', type=int, default=4)
+    users.add_argument('--threads', type=int, default=8)
+    users.add_argument('--signups', type=int, default=25, help="Signups per thread")
+    users.set_defaults(func=bench_users)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+# bm25_index.py - SPARSE INVERTED-INDEX BM25 (DROP-IN FOR rank_bm25.BM25Okapi)
+from collections import Counter
+
+import numpy as np
+
+
+class InvertedIndexBM25:
+    """
+    Okapi BM25 over an inverted index
+    - Postings stored as CSR NumPy arrays (term -> doc ids + precomputed term weights)
+    - A query only touches the postings of its own terms, not every document
+    - Same parameters and scores as rank_bm25.BM25Okapi (k1, b, epsilon idf floor)
+    """
+
+    def __init__(self, corpus=None, k1=1.5, b=0.75, epsilon=0.25):
+        self.k1 = k1
+        self.b = b
+        self.epsilon = epsilon
+
+        self.vocab = {}
+        self.corpus_size = 0
+        self.avgdl = 0.0
+        self.doc_len = np.zeros(0, dtype=np.int32)
+        self.idf = {}
+        self.average_idf = 0.0
+
+        self.indptr = np.zeros(1, dtype=np.int64)
+        self.postings_docs = np.zeros(0, dtype=np.int32)
+        self.postings_tfs = np.zeros(0, dtype=np.float32)
+        self.postings_weights = np.zeros(0, dtype=np.float32)
+
+        # Postings added since the last finalize(), as (term_ids, doc_ids, tfs) arrays
+        self._pending = []
+        self._pending_doc_len = []
+
+        if corpus is not None:
+            self.add_documents(corpus)
+            self.finalize()
+
+    @classmethod
+    def from_bm25okapi(cls, bm25):
+        """Convert a pickled rank_bm25.BM25Okapi without re-tokenizing the corpus"""
+        index = cls(k1=bm25.k1, b=bm25.b, epsilon=bm25.epsilon)
+        index._add_term_counts(bm25.doc_freqs)
+        index.finalize()
+        return index
+
+    # ========================================================================
+    # INDEX CONSTRUCTION
+    # ========================================================================
+
+    def add_documents(self, corpus):
+        """Queue tokenized documents; they become searchable after finalize()"""
+        self._add_term_counts([Counter(doc) for doc in corpus])
+
+    def _add_term_counts(self, term_counts):
+        first_doc = self.corpus_size + sum(len(lengths) for lengths in self._pending_doc_len)
+        term_ids = []
+        doc_ids = []
+        tfs = []
+        doc_len = np.zeros(len(term_counts), dtype=np.int32)
+
+        for offset, counts in enumerate(term_counts):
+            total = 0
+            for term, tf in counts.items():
+                term_id = self.vocab.get(term)
+                if term_id is None:
+                    term_id = self.vocab[term] = len(self.vocab)
+                term_ids.append(term_id)
+                doc_ids.append(first_doc + offset)
+                tfs.append(tf)
+                total += tf
+            doc_len[offset] = total
+
+        self._pending.append((
+            np.asarray(term_ids, dtype=np.int64),
+            np.asarray(doc_ids, dtype=np.int32),
+            np.asarray(tfs, dtype=np.float32)
+        ))
+        self._pending_doc_len.append(doc_len)
+
+    def finalize(self):
+        """Merge queued documents into the postings and recompute idf/weights"""
+        if not self._pending:
+            return
+
+        existing_terms = np.repeat(np.arange(len(self.indptr) - 1, dtype=np.int64), np.diff(self.indptr))
+        term_ids = np.concatenate([existing_terms] + [terms for terms, _, _ in self._pending])
+        doc_ids = np.concatenate([self.postings_docs] + [docs for _, docs, _ in self._pending])
+        tfs = np.concatenate([self.postings_tfs] + [chunk_tfs for _, _, chunk_tfs in self._pending])
+        self.doc_len = np.concatenate([self.doc_len] + self._pending_doc_len)
+        self._pending = []
+        self._pending_doc_len = []
+
+        self._set_postings(term_ids, doc_ids, tfs)
+
+    def _set_postings(self, term_ids, doc_ids, tfs):
+        self.corpus_size = len(self.doc_len)
+        self.avgdl = float(self.doc_len.sum()) / self.corpus_size if self.corpus_size else 0.0
+
+        order = np.argsort(term_ids, kind='stable')
+        term_ids = term_ids[order]
+        self.postings_docs = doc_ids[order]
+        self.postings_tfs = tfs[order]
+
+        doc_freq = np.bincount(term_ids, minlength=len(self.vocab))
+        self.indptr = np.zeros(len(self.vocab) + 1, dtype=np.int64)
+        np.cumsum(doc_freq, out=self.indptr[1:])
+
+        idf = self._compute_idf(doc_freq)
+        self.idf = {term: float(idf[term_id]) for term, term_id in self.vocab.items()}
+
+        # Fold idf and length normalization into one weight per posting
+        norm = self.k1 * (1 - self.b + self.b * self.doc_len[self.postings_docs] / max(self.avgdl, 1e-9))
+        self.postings_weights = (idf[term_ids] * self.postings_tfs * (self.k1 + 1) / (self.postings_tfs + norm)).astype(np.float32)
+
+    def _compute_idf(self, doc_freq):
+        # Vocabulary terms without postings are left out of idf
+        present = doc_freq > 0
+        idf = np.zeros(len(doc_freq), dtype=np.float64)
+        if not present.any():
+            return idf
+
+        idf[present] = np.log(self.corpus_size - doc_freq[present] + 0.5) - np.log(doc_freq[present] + 0.5)
+        self.average_idf = float(idf[present].sum()) / int(present.sum())
+        idf[present & (idf < 0)] = self.epsilon * self.average_idf
+        return idf
+
+    # ========================================================================
+    # SCORING
+    # ========================================================================
+
+    def _gather(self, query):
+        docs = []
+        weights = []
+        for term in query:
+            term_id = self.vocab.get(term)
+            if term_id is None:
+                continue
+            start, end = self.indptr[term_id], self.indptr[term_id + 1]
+            docs.append(self.postings_docs[start:end])
+            weights.append(self.postings_weights[start:end])
+
+        if not docs:
+            return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.float32)
+        return np.concatenate(docs), np.concatenate(weights)
+
+    def get_sparse_scores(self, query):
+        """(doc_ids, scores) for documents containing at least one query term"""
+        docs, weights = self._gather(query)
+        if len(docs) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64)
+
+        doc_ids, inverse = np.unique(docs, return_inverse=True)
+        scores = np.bincount(inverse, weights=weights, minlength=len(doc_ids))
+        return doc_ids.astype(np.int64), scores
+
+    def get_sparse_scores_batch(self, queries):
+        """get_sparse_scores for several queries with a single unique/bincount pass"""
+        query_ids = []
+        docs = []
+        weights = []
+        for i, query in enumerate(queries):
+            query_docs, query_weights = self._gather(query)
+            query_ids.append(np.full(len(query_docs), i, dtype=np.int64))
+            docs.append(query_docs)
+            weights.append(query_weights)
+
+        empty = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64))
+        if not docs or sum(len(d) for d in docs) == 0:
+            return [empty for _ in queries]
+
+        # One key per (query, doc) pair so every query is scored in the same pass
+        stride = max(self.corpus_size, 1)
+        keys = np.concatenate(query_ids) * stride + np.concatenate(docs)
+        unique_keys, inverse = np.unique(keys, return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(weights), minlength=len(unique_keys))
+
+        bounds = np.searchsorted(unique_keys // stride, np.arange(len(queries) + 1))
+        return [(unique_keys[start:end] % stride, scores[start:end]) for start, end in zip(bounds[:-1], bounds[1:])]
+
+    def get_scores(self, query):
+        """Dense score vector over the whole corpus (BM25Okapi-compatible)"""
+        docs, weights = self._gather(query)
+        return np.bincount(docs, weights=weights, minlength=self.corpus_size).astype(np.float64)
+
+    def get_top_n_scores(self, query, n=5):
+        """(doc_ids, scores) of the n best-scoring documents, best first"""
+        doc_ids, scores = self.get_sparse_scores(query)
+        if len(doc_ids) > n:
+            top = np.argpartition(-scores, n - 1)[:n]
+            doc_ids, scores = doc_ids[top], scores[top]
+        order = np.argsort(-scores, kind='stable')
+        return doc_ids[order], scores[order]
+
+    def get_top_n(self, query, documents, n=5):
+        doc_ids, _ = self.get_top_n_scores(query, n)
+        return [documents[i] for i in doc_ids]
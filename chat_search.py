@@ -0,0 +1,158 @@
+# chat_search.py - FULL-TEXT SEARCH OVER SAVED CHATS (SQLITE FTS5)
+import re
+import sqlite3
+from pathlib import Path
+
+from chat_store import chat_key, user_file_stem
+
+QUERY_TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+def chat_text(chat):
+    """Searchable text of a chat: the content of every message"""
+    parts = []
+    for message in chat.get('messages') or []:
+        if isinstance(message, str):
+            parts.append(message)
+        elif isinstance(message, dict):
+            content = message.get('content', message.get('text'))
+            if isinstance(content, str):
+                parts.append(content)
+    return "\n".join(parts)
+
+
+def build_match_query(query):
+    """
+    Free text -> FTS5 MATCH expression
+    - Every word must appear (implicit AND); each is quoted so FTS5 syntax in the input is inert
+    - The last word also matches as a prefix, for search-as-you-type
+    """
+    tokens = QUERY_TOKEN_PATTERN.findall(query.lower())
+    if not tokens:
+        return None
+    terms = [f'"{token}"' for token in tokens]
+    terms[-1] += '*'
+    return " ".join(terms)
+
+
+class ChatSearchIndex:
+    """
+    Per-user FTS5 index next to the chat logs (<user>_chats.search.db)
+    - index_chat() is called on every /chat/save; a re-saved chat id replaces its old document
+    - search() ranks by bm25 and returns snippets; it never reads the chat logs
+    - A user's existing history is backfilled once, the first time their index is opened
+    """
+
+    def __init__(self, directory, chat_store, snippet_tokens=12):
+        self.directory = Path(directory)
+        self.chat_store = chat_store
+        self.snippet_tokens = snippet_tokens
+        self.available = self._fts5_available()
+        if not self.available:
+            print("⚠️ SQLite FTS5 not available - chat search disabled")
+
+    @staticmethod
+    def _fts5_available():
+        try:
+            conn = sqlite3.connect(":memory:")
+            conn.execute("CREATE VIRTUAL TABLE probe USING fts5(body)")
+            conn.close()
+            return True
+        except sqlite3.OperationalError:
+            return False
+
+    # ========================================================================
+    # CONNECTION / SCHEMA
+    # ========================================================================
+
+    def _connect(self, email):
+        # One short-lived connection per call: a worker thread serves many users
+        conn = sqlite3.connect(str(self.directory / f"{user_file_stem(email)}.search.db"),
+                               timeout=10.0, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS chat_fts USING fts5("
+            "body, chat_id UNINDEXED, timestamp UNINDEXED, tokenize='porter unicode61')"
+        )
+        # chat key -> seq of the indexed version (also the chat_fts rowid)
+        conn.execute("CREATE TABLE IF NOT EXISTS chat_docs (chat_key INTEGER PRIMARY KEY, seq INTEGER NOT NULL)")
+        conn.execute("CREATE TABLE IF NOT EXISTS search_meta (key TEXT PRIMARY KEY, value TEXT)")
+        self._backfill(conn, email)
+        return conn
+
+    def _backfill(self, conn, email):
+        if conn.execute("SELECT 1 FROM search_meta WHERE key = 'backfilled'").fetchone():
+            return
+
+        chats = self.chat_store.iter_chats(email)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if not conn.execute("SELECT 1 FROM search_meta WHERE key = 'backfilled'").fetchone():
+                for chat in chats:
+                    self._upsert(conn, chat, chat['seq'])
+                conn.execute("INSERT INTO search_meta (key, value) VALUES ('backfilled', ?)", (str(len(chats)),))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    # ========================================================================
+    # INDEXING
+    # ========================================================================
+
+    def _upsert(self, conn, chat, seq):
+        key = chat_key(chat, seq)
+        row = conn.execute("SELECT seq FROM chat_docs WHERE chat_key = ?", (key,)).fetchone()
+        if row:
+            if row[0] >= seq:
+                return  # a newer save of this chat is already indexed
+            conn.execute("DELETE FROM chat_fts WHERE rowid = ?", (row[0],))
+        conn.execute(
+            "INSERT INTO chat_fts (rowid, body, chat_id, timestamp) VALUES (?, ?, ?, ?)",
+            (seq, chat_text(chat), chat.get('id'), chat.get('timestamp'))
+        )
+        conn.execute("INSERT OR REPLACE INTO chat_docs (chat_key, seq) VALUES (?, ?)", (key, seq))
+
+    def index_chat(self, email, chat, seq):
+        """Add or replace one saved chat (seq as returned by ChatHistoryStore.save)"""
+        if not self.available:
+            return
+        conn = self._connect(email)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._upsert(conn, chat, seq)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        finally:
+            conn.close()
+
+    # ========================================================================
+    # SEARCH
+    # ========================================================================
+
+    def search(self, email, query, limit=20):
+        """Best-matching chats first: [{'id', 'seq', 'timestamp', 'snippet', 'score'}]"""
+        match = build_match_query(query)
+        if not self.available or match is None:
+            return []
+
+        conn = self._connect(email)
+        try:
+            rows = conn.execute(
+                "SELECT rowid, chat_id, timestamp, "
+                "snippet(chat_fts, 0, '**', '**', '…', ?), bm25(chat_fts) "
+                "FROM chat_fts WHERE chat_fts MATCH ? ORDER BY bm25(chat_fts) LIMIT ?",
+                (self.snippet_tokens, match, limit)
+            ).fetchall()
+        finally:
+            conn.close()
+
+        # bm25() is lower-is-better; report it negated so higher means more relevant
+        return [
+            {'id': chat_id, 'seq': seq, 'timestamp': timestamp, 'snippet': snippet, 'score': round(-score, 6)}
+            for seq, chat_id, timestamp, snippet, score in rows
+        ]
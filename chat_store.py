@@ -0,0 +1,304 @@
+# chat_store.py - APPEND-ONLY PER-USER CHAT HISTORY LOG
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: in-process locking only
+    fcntl = None
+
+# One index record per log line: seq, byte offset, byte length, hash of the chat id
+INDEX_DTYPE = np.dtype([('seq', '<i8'), ('offset', '<i8'), ('length', '<i8'), ('key', '<i8')])
+
+
+def _encode(chat, seq):
+    # seq travels with the line so the index can always be rebuilt from the log alone
+    return (json.dumps(dict(chat, seq=seq)) + "\n").encode('utf-8')
+
+
+def user_file_stem(email):
+    """File name prefix for a user's chat files (same scheme as the legacy *_chats.json)"""
+    return email.replace('@', '_').replace('.', '_') + "_chats"
+
+
+def chat_key(chat, seq):
+    """64-bit hash identifying a chat; chats without an id (old clients) never supersede each other"""
+    chat_id = chat.get('id') if isinstance(chat, dict) else None
+    raw = json.dumps(chat_id if chat_id is not None else f"seq:{seq}", default=str)
+    return int(np.frombuffer(hashlib.blake2b(raw.encode(), digest_size=8).digest(), dtype='<i8')[0])
+
+
+class ChatHistoryStore:
+    """
+    Chat history as one append-only JSONL log per user plus a fixed-width offset index
+    - save() appends one line and one index record: O(1) in the size of the history
+    - Per user, the next seq and live/superseded byte counts are kept in-process; save() only
+      stats the two files to check no other worker changed them (if one did, the index is
+      re-read once)
+    - The log is authoritative; a missing, short or stale index is rebuilt from it
+    - Saving a chat id again supersedes the older record (the chat moves to the end)
+    - Each record gets an increasing seq, used as the pagination cursor and kept by compaction
+    - Compaction rewrites the log without superseded records once they pass compact_ratio
+    - Legacy <user>_chats.json lists are imported on first access (the file is kept)
+    """
+
+    def __init__(self, directory, compact_ratio=0.5, compact_min_bytes=1 << 20, max_cached_users=1024):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.compact_ratio = compact_ratio
+        self.compact_min_bytes = compact_min_bytes
+        self.locks = {}
+        self.locks_guard = threading.Lock()
+
+        self.max_cached_users = max_cached_users
+        self.states = OrderedDict()  # email -> append state, in LRU order
+        self.states_guard = threading.Lock()
+
+    # ========================================================================
+    # FILES / LOCKING
+    # ========================================================================
+
+    def _paths(self, email):
+        base = self.directory / user_file_stem(email)
+        return (base.with_suffix('.jsonl'), base.with_suffix('.idx'),
+                base.with_suffix('.json'), base.with_suffix('.lock'))
+
+    @contextmanager
+    def _locked(self, email):
+        """Thread lock per user, plus a flock so worker processes agree too"""
+        with self.locks_guard:
+            lock = self.locks.setdefault(email, threading.RLock())
+        with lock:
+            if fcntl is None:
+                yield
+                return
+            with open(self._paths(email)[3], 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_index(self, email):
+        index_path = self._paths(email)[1]
+        if not index_path.exists() or index_path.stat().st_size % INDEX_DTYPE.itemsize:
+            return np.zeros(0, dtype=INDEX_DTYPE)
+        return np.fromfile(index_path, dtype=INDEX_DTYPE)
+
+    def _recover(self, email, index):
+        """
+        Bring the index in line with the log
+        - Lines past the last index record (crash between the two appends) are indexed
+        - An index pointing past the end of the log (crash mid-compaction) is rebuilt
+        """
+        log_path, index_path, _, _ = self._paths(email)
+        log_size = log_path.stat().st_size
+        indexed_end = int(index['offset'][-1] + index['length'][-1]) if len(index) else 0
+        if indexed_end == log_size:
+            return index
+        if indexed_end > log_size:
+            index, indexed_end = index[:0], 0
+
+        records = []
+        seq = int(index['seq'][-1]) + 1 if len(index) else 0
+        offset = indexed_end
+        with open(log_path, 'rb') as f:
+            f.seek(indexed_end)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break  # torn final write
+                try:
+                    chat = json.loads(line)
+                    seq = max(seq, int(chat.get('seq', seq)))
+                    records.append((seq, offset, len(line), chat_key(chat, seq)))
+                    seq += 1
+                except (ValueError, TypeError, AttributeError):
+                    pass
+                offset += len(line)
+        if offset < log_size:
+            os.truncate(log_path, offset)
+
+        index = np.concatenate([index, np.asarray(records, dtype=INDEX_DTYPE)])
+        index.tofile(f"{index_path}.tmp")
+        os.replace(f"{index_path}.tmp", index_path)
+        return index
+
+    def _migrate_legacy(self, email):
+        log_path, index_path, legacy_path, _ = self._paths(email)
+        if log_path.exists() or not legacy_path.exists():
+            return
+        try:
+            with open(legacy_path, 'r') as f:
+                chats = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Could not read {legacy_path} for migration: {e}")
+            chats = []
+        self._write_log(email, [chat for chat in chats if isinstance(chat, dict)])
+        print(f"✅ Migrated {len(chats)} chats from {legacy_path.name}")
+
+    def _write_log(self, email, chats, seqs=None):
+        """Write a complete log + index and swap both in"""
+        log_path, index_path, _, _ = self._paths(email)
+        records = []
+        offset = 0
+        with open(f"{log_path}.tmp", 'wb') as f:
+            for i, chat in enumerate(chats):
+                seq = seqs[i] if seqs is not None else i
+                line = _encode(chat, seq)
+                records.append((seq, offset, len(line), chat_key(chat, seq)))
+                f.write(line)
+                offset += len(line)
+        np.asarray(records, dtype=INDEX_DTYPE).tofile(f"{index_path}.tmp")
+        # Log first: a stale index left by a crash here points past the new log and is rebuilt
+        os.replace(f"{log_path}.tmp", log_path)
+        os.replace(f"{index_path}.tmp", index_path)
+
+    def _load(self, email):
+        """Index for email after migration and recovery; call with the lock held"""
+        self._migrate_legacy(email)
+        if not self._paths(email)[0].exists():
+            return np.zeros(0, dtype=INDEX_DTYPE)
+        return self._recover(email, self._read_index(email))
+
+    def _stamp(self, email):
+        # A compaction swaps in new files (new inode); an append grows them
+        stamp = []
+        for path in self._paths(email)[:2]:
+            try:
+                stat = path.stat()
+                stamp.append((stat.st_ino, stat.st_size))
+            except FileNotFoundError:
+                stamp.append(None)
+        return tuple(stamp)
+
+    def _state(self, email):
+        """
+        Append state for email; call with the lock held
+        {'stamp', 'next_seq', 'live': {key: length}, 'total_bytes', 'dead_bytes'}
+        """
+        stamp = self._stamp(email)
+        with self.states_guard:
+            state = self.states.get(email)
+            if state is not None and state['stamp'] == stamp:
+                self.states.move_to_end(email)
+                return state
+
+        index = self._load(email)
+        live = self._live(index)
+        total = int(index['length'].sum())
+        state = {
+            'stamp': self._stamp(email),
+            'next_seq': int(index['seq'][-1]) + 1 if len(index) else 0,
+            'live': dict(zip(live['key'].tolist(), live['length'].tolist())),
+            'total_bytes': total,
+            'dead_bytes': total - int(live['length'].sum())
+        }
+        with self.states_guard:
+            self.states[email] = state
+            self.states.move_to_end(email)
+            while len(self.states) > self.max_cached_users:
+                self.states.popitem(last=False)
+        return state
+
+    def _forget_state(self, email):
+        with self.states_guard:
+            self.states.pop(email, None)
+
+    @staticmethod
+    def _live(index):
+        # Latest record per chat key
+        if len(index) == 0:
+            return index
+        reversed_keys = index['key'][::-1]
+        _, first = np.unique(reversed_keys, return_index=True)
+        keep = np.zeros(len(index), dtype=bool)
+        keep[len(index) - 1 - first] = True
+        return index[keep]
+
+    def _read_records(self, email, records):
+        chats = []
+        with open(self._paths(email)[0], 'rb') as f:
+            for offset, length in zip(records['offset'].tolist(), records['length'].tolist()):
+                f.seek(offset)
+                chats.append(json.loads(f.read(length)))
+        return chats
+
+    # ========================================================================
+    # PUBLIC API
+    # ========================================================================
+
+    def save(self, email, chat):
+        """Append one chat to the user's log"""
+        log_path, index_path, _, _ = self._paths(email)
+        with self._locked(email):
+            state = self._state(email)
+            seq = state['next_seq']
+            line = _encode(chat, seq)
+            key = chat_key(chat, seq)
+
+            with open(log_path, 'ab') as f:
+                offset = f.tell()
+                f.write(line)
+            record = np.asarray([(seq, offset, len(line), key)], dtype=INDEX_DTYPE)
+            with open(index_path, 'ab') as f:
+                record.tofile(f)
+
+            state['dead_bytes'] += state['live'].get(key, 0)
+            state['live'][key] = len(line)
+            state['total_bytes'] += len(line)
+            state['next_seq'] = seq + 1
+            state['stamp'] = self._stamp(email)
+
+            self._maybe_compact(email, state)
+        return seq
+
+    def page(self, email, before=None, limit=None):
+        """
+        Chats older than cursor `before` (a seq), newest `limit` of them, oldest first
+        - Returns (chats, next_before); next_before is None when nothing older remains
+        - No before/limit returns the whole history
+        """
+        with self._locked(email):
+            live = self._live(self._load(email))
+            if before is not None:
+                live = live[live['seq'] < before]
+            if limit is not None and len(live) > limit:
+                live = live[len(live) - limit:] if limit > 0 else live[:0]
+                next_before = int(live['seq'][0]) if len(live) else None
+            else:
+                next_before = None
+            chats = self._read_records(email, live) if len(live) else []
+        return chats, next_before
+
+    def iter_chats(self, email):
+        """All current chats of a user, oldest first"""
+        return self.page(email)[0]
+
+    # ========================================================================
+    # COMPACTION
+    # ========================================================================
+
+    def _maybe_compact(self, email, state):
+        total = state['total_bytes']
+        if total >= self.compact_min_bytes and state['dead_bytes'] > total * self.compact_ratio:
+            self._rewrite_live(email, self._live(self._load(email)))
+
+    def _rewrite_live(self, email, live):
+        # Caller holds the lock (flock is per open file, so it must not be taken twice)
+        if len(live) == 0:
+            return
+        chats = self._read_records(email, live)
+        self._write_log(email, chats, seqs=live['seq'].tolist())
+        self._forget_state(email)
+
+    def compact(self, email):
+        """Rewrite the log with only the latest record per chat, keeping seqs"""
+        with self._locked(email):
+            self._rewrite_live(email, self._live(self._load(email)))
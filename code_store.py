@@ -0,0 +1,198 @@
+# code_store.py - EXPIRING ONE-TIME CODES (EMAIL VERIFICATION / PASSWORD RESET)
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+CODE_OK = 'ok'
+CODE_MISSING = 'missing'
+CODE_EXPIRED = 'expired'
+CODE_LOCKED = 'locked'
+CODE_INVALID = 'invalid'
+
+
+class ExpiringCodeStore:
+    """
+    TTL store for short-lived codes keyed by email / phone
+    - check() reads, counts a failed attempt and expires/locks a code in one transaction
+    - A background thread sweeps expired codes every sweep_interval seconds
+    - At max_size, the codes closest to expiry are evicted first
+    - Optional SQLite file backend (one table, namespaced) so codes survive restarts
+      and every worker process sees the same codes and attempt counts
+    """
+
+    def __init__(self, namespace, ttl=600, max_attempts=5, max_size=10000, db_path=None, sweep_interval=60):
+        self.namespace = namespace
+        self.ttl = float(ttl)
+        self.max_attempts = max_attempts
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.db_path = Path(db_path) if db_path else None
+
+        if self.db_path:
+            self.local = threading.local()
+            self._init_db()
+        else:
+            self.entries = {}  # key -> {'code', 'expires', 'attempts'}
+
+        self.stop_event = threading.Event()
+        if sweep_interval:
+            self.sweeper = threading.Thread(target=self._sweep_loop, args=(sweep_interval,),
+                                            name=f"{namespace}-code-sweeper", daemon=True)
+            self.sweeper.start()
+
+    # ========================================================================
+    # BACKENDS
+    # ========================================================================
+
+    def _connection(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.db_path), timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    def _init_db(self):
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = self._connection()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS expiring_codes ("
+            "namespace TEXT NOT NULL, key TEXT NOT NULL, code TEXT NOT NULL, "
+            "expires REAL NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, "
+            "PRIMARY KEY (namespace, key))"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS expiring_codes_expires ON expiring_codes (namespace, expires)")
+
+    def _transact(self, key, update):
+        """
+        Run update(entry, now) -> (result, new_entry) atomically for one key
+        - entry / new_entry: {'code', 'expires', 'attempts'} or None (new_entry None deletes)
+        """
+        now = time.time()
+
+        if not self.db_path:
+            with self.lock:
+                result, new_entry = update(self.entries.get(key), now)
+                if new_entry is None:
+                    self.entries.pop(key, None)
+                else:
+                    self.entries[key] = new_entry
+                return result
+
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT code, expires, attempts FROM expiring_codes WHERE namespace = ? AND key = ?",
+                (self.namespace, key)
+            ).fetchone()
+            entry = {'code': row[0], 'expires': row[1], 'attempts': row[2]} if row else None
+
+            result, new_entry = update(entry, now)
+
+            if new_entry is None:
+                if entry is not None:
+                    conn.execute("DELETE FROM expiring_codes WHERE namespace = ? AND key = ?", (self.namespace, key))
+            elif new_entry != entry:
+                conn.execute(
+                    "INSERT OR REPLACE INTO expiring_codes (namespace, key, code, expires, attempts) VALUES (?, ?, ?, ?, ?)",
+                    (self.namespace, key, new_entry['code'], new_entry['expires'], new_entry['attempts'])
+                )
+            conn.execute("COMMIT")
+            return result
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    # ========================================================================
+    # CODE OPERATIONS
+    # ========================================================================
+
+    def put(self, key, code):
+        """Store a fresh code for key (replacing any previous one) with a full TTL and no attempts"""
+        def update(entry, now):
+            return None, {'code': code, 'expires': now + self.ttl, 'attempts': 0}
+
+        self._transact(key, update)
+        self._enforce_max_size()
+
+    def check(self, key, code, count_attempt=True):
+        """
+        Verify code for key -> (status, remaining_attempts)
+        - Expired and locked-out codes are deleted
+        - A wrong code counts an attempt when count_attempt is set
+        - The code is kept on success; call discard() once it has been used
+        """
+        def update(entry, now):
+            if entry is None:
+                return (CODE_MISSING, 0), None
+            if now > entry['expires']:
+                return (CODE_EXPIRED, 0), None
+            if entry['attempts'] >= self.max_attempts:
+                return (CODE_LOCKED, 0), None
+            if entry['code'] != code:
+                if count_attempt:
+                    entry = dict(entry, attempts=entry['attempts'] + 1)
+                return (CODE_INVALID, self.max_attempts - entry['attempts']), entry
+            return (CODE_OK, self.max_attempts - entry['attempts']), entry
+
+        return self._transact(key, update)
+
+    def discard(self, key):
+        self._transact(key, lambda entry, now: (None, None))
+
+    # ========================================================================
+    # EXPIRY / SIZE
+    # ========================================================================
+
+    def sweep(self):
+        """Delete expired codes; returns how many were removed"""
+        now = time.time()
+        if not self.db_path:
+            with self.lock:
+                expired = [key for key, entry in self.entries.items() if entry['expires'] < now]
+                for key in expired:
+                    del self.entries[key]
+                return len(expired)
+
+        return self._connection().execute(
+            "DELETE FROM expiring_codes WHERE namespace = ? AND expires < ?", (self.namespace, now)
+        ).rowcount
+
+    def _sweep_loop(self, interval):
+        while not self.stop_event.wait(interval):
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"⚠️ {self.namespace} code sweep failed: {e}")
+
+    def _enforce_max_size(self):
+        if not self.db_path:
+            with self.lock:
+                excess = len(self.entries) - self.max_size
+                if excess > 0:
+                    for key in sorted(self.entries, key=lambda k: self.entries[k]['expires'])[:excess]:
+                        del self.entries[key]
+            return
+
+        conn = self._connection()
+        excess = self.size() - self.max_size
+        if excess > 0:
+            conn.execute(
+                "DELETE FROM expiring_codes WHERE namespace = ? AND key IN ("
+                "SELECT key FROM expiring_codes WHERE namespace = ? ORDER BY expires LIMIT ?)",
+                (self.namespace, self.namespace, excess)
+            )
+
+    def size(self):
+        if not self.db_path:
+            with self.lock:
+                return len(self.entries)
+        return self._connection().execute(
+            "SELECT COUNT(*) FROM expiring_codes WHERE namespace = ?", (self.namespace,)
+        ).fetchone()[0]
+
+    def close(self):
+        self.stop_event.set()
@@ -0,0 +1,132 @@
+# embedding_cache.py - LRU CACHE OF QUERY EMBEDDINGS
+import atexit
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+from response_cache import normalize_query
+
+
+class QueryEmbeddingCache:
+    """
+    Bounded LRU of normalized query -> embedding in front of SentenceTransformer.encode
+    - encode_fn(list_of_texts) returns a 2-D array; misses of one call are encoded together
+    - Queries are normalized (normalize_query) before encoding, so "Hi!" and "hi" share an entry
+    - precompute() pins known queries (e.g. greeting search strings) at startup
+    - Optional .npz persistence keyed by model name, saved atomically at exit
+    """
+
+    def __init__(self, encode_fn, max_size=2048, persist_path=None, model_name=""):
+        self.encode_fn = encode_fn
+        self.max_size = max_size
+        self.persist_path = Path(persist_path) if persist_path else None
+        self.model_name = model_name
+        self.lock = threading.Lock()
+
+        self.entries = OrderedDict()  # normalized query -> embedding, in LRU order
+        self.pinned = set()
+        self.metrics = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+        if self.persist_path:
+            self._load()
+            atexit.register(self.save)
+
+    # ========================================================================
+    # LOOKUP
+    # ========================================================================
+
+    def encode(self, texts):
+        """Embeddings for texts in input order, encoding only uncached queries"""
+        keys = [normalize_query(text) for text in texts]
+        found = {}
+        missing = []
+
+        with self.lock:
+            for key in dict.fromkeys(keys):
+                embedding = self.entries.get(key)
+                if embedding is None:
+                    missing.append(key)
+                else:
+                    self.entries.move_to_end(key)
+                    found[key] = embedding
+            self.metrics['hits'] += len(keys) - len(missing)
+            self.metrics['misses'] += len(missing)
+
+        if not keys:
+            return np.zeros((0, 0), dtype=np.float32)
+
+        if missing:
+            embeddings = np.asarray(self.encode_fn(missing), dtype=np.float32)
+            with self.lock:
+                for key, embedding in zip(missing, embeddings):
+                    found[key] = embedding
+                    self._insert(key, embedding)
+
+        return np.stack([found[key] for key in keys])
+
+    def _insert(self, key, embedding):
+        self.entries[key] = embedding
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size + len(self.pinned):
+            for candidate in self.entries:
+                if candidate not in self.pinned:
+                    del self.entries[candidate]
+                    self.metrics['evictions'] += 1
+                    break
+            else:
+                break
+
+    def precompute(self, texts):
+        """Encode texts now and keep them out of LRU eviction"""
+        with self.lock:
+            self.pinned.update(normalize_query(text) for text in texts)
+        self.encode(texts)
+
+    # ========================================================================
+    # PERSISTENCE
+    # ========================================================================
+
+    def _load(self):
+        if not self.persist_path.exists():
+            return
+        try:
+            data = np.load(self.persist_path, allow_pickle=False)
+            if str(data['model']) != self.model_name:
+                print(f"⚠️ Query embedding cache was built with another model - ignoring")
+                return
+            for key, embedding in zip(data['keys'].tolist(), data['embeddings']):
+                self._insert(key, embedding)
+            print(f"✅ Loaded {len(self.entries)} cached query embeddings")
+        except Exception as e:
+            print(f"⚠️ Could not load query embedding cache: {e}")
+
+    def save(self):
+        if not self.persist_path:
+            return
+        with self.lock:
+            if not self.entries:
+                return
+            keys = np.asarray(list(self.entries.keys()))
+            embeddings = np.stack(list(self.entries.values()))
+
+        try:
+            self.persist_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.persist_path.with_suffix('.tmp.npz')
+            np.savez(tmp_path, keys=keys, embeddings=embeddings, model=np.asarray(self.model_name))
+            os.replace(tmp_path, self.persist_path)
+        except Exception as e:
+            print(f"⚠️ Could not save query embedding cache: {e}")
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.metrics)
+            stats['size'] = len(self.entries)
+            stats['pinned'] = len(self.pinned)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 3) if lookups else 0.0
+        stats['max_size'] = self.max_size
+        stats['persistent'] = self.persist_path is not None
+        return stats
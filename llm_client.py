@@ -0,0 +1,194 @@
+# llm_client.py - POOLED HTTP CLIENT FOR THE OPENAI-COMPATIBLE LLM API
+import asyncio
+import atexit
+import importlib.util
+import os
+import threading
+import weakref
+
+import httpx
+
+
+# HTTP/2 needs the optional `h2` package; fall back to keep-alive HTTP/1.1 without it
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+_client = None
+_client_lock = threading.Lock()
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def _client_settings():
+    """Pool settings, read lazily so values from .env are picked up"""
+    pool_size = int(os.environ.get("LLM_POOL_SIZE", "10"))
+    timeout = float(os.environ.get("LLM_TIMEOUT", "60"))
+    keepalive = float(os.environ.get("LLM_KEEPALIVE_SECONDS", "60"))
+    http2 = os.environ.get("LLM_HTTP2", "1") not in ("0", "false", "False") and HTTP2_AVAILABLE
+
+    return {
+        'http2': http2,
+        'limits': httpx.Limits(
+            max_connections=pool_size,
+            max_keepalive_connections=pool_size,
+            keepalive_expiry=keepalive
+        ),
+        'timeout': httpx.Timeout(timeout, connect=10.0)
+    }
+
+
+def get_http_client():
+    """Process-wide keep-alive client shared by all Flask worker threads"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                settings = _client_settings()
+                _client = httpx.Client(**settings)
+                atexit.register(close_http_clients)
+                print(f"✅ LLM HTTP pool ready ({'HTTP/2' if settings['http2'] else 'HTTP/1.1 keep-alive'}, {settings['limits'].max_connections} connections)")
+    return _client
+
+
+def get_async_http_client():
+    """
+    Keep-alive AsyncClient for the running event loop (clients cannot cross loops)
+    - Await aclose_http_clients() on that loop before it shuts down, or its connections leak
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = httpx.AsyncClient(**_client_settings())
+        _async_clients[loop] = client
+    return client
+
+
+def close_http_clients():
+    """Close the sync pool (registered with atexit once the pool exists)"""
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+
+
+async def aclose_http_clients():
+    """Close the running event loop's AsyncClient and its pooled connections"""
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+def build_llm_request(llm_config, prompt, max_tokens, temperature):
+    headers = {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {llm_config['api_key']}"
+    }
+
+    # OpenAI-compatible chat completion format
+    payload = {
+        "model": llm_config['model'],
+        "messages": [
+            {
+                "role": "user",
+                "content": prompt
+            }
+        ],
+        "max_tokens": max_tokens,
+        "temperature": temperature,
+        "stream": False
+    }
+
+    return headers, payload
+
+
+def parse_llm_response(llm_config, response):
+    """Extract the completion text from any of the supported response formats"""
+    print(f"📡 LLM Response Status: {response.status_code} ({response.http_version})")
+
+    if response.status_code == 200:
+        data = response.json()
+
+        # OpenAI-compatible format: choices[0].message.content
+        if 'choices' in data and len(data['choices']) > 0:
+            message = data['choices'][0].get('message', {})
+            content = message.get('content', '')
+            if content:
+                print(f"✅ LLM Response received ({len(content)} chars)")
+                return content
+
+        # Alternative formats
+        elif 'message' in data:
+            if isinstance(data['message'], dict) and 'content' in data['message']:
+                return data['message']['content']
+            elif isinstance(data['message'], str):
+                return data['message']
+
+        elif 'response' in data:
+            return data['response']
+
+        elif 'content' in data:
+            return data['content']
+
+        print(f"⚠️ Unexpected response format: {list(data.keys())}")
+        return None
+
+    elif response.status_code == 405:
+        print(f"❌ 405 Method Not Allowed")
+        print(f"🔗 Endpoint: {llm_config['api_url']}")
+        print(f"💡 Check if the endpoint URL is correct")
+        return None
+
+    elif response.status_code == 401:
+        print(f"❌ 401 Unauthorized - Check your LLM_API_KEY")
+        return None
+
+    elif response.status_code == 404:
+        print(f"❌ 404 Not Found - Check your LLM_API_URL")
+        return None
+
+    elif response.status_code == 400:
+        print(f"❌ 400 Bad Request: {response.text}")
+        return None
+
+    else:
+        print(f"❌ LLM API error: {response.status_code} - {response.text}")
+        return None
+
+
+def call_llm_api(llm_config, prompt, max_tokens=1000, temperature=0.7):
+    """Call the LLM API over the pooled client; returns the text or None"""
+    try:
+        headers, payload = build_llm_request(llm_config, prompt, max_tokens, temperature)
+        print(f"🔄 Calling LLM API: {llm_config['api_url']}")
+
+        response = get_http_client().post(llm_config['api_url'], headers=headers, json=payload)
+        return parse_llm_response(llm_config, response)
+
+    except httpx.TimeoutException:
+        print(f"⏱️ LLM API request timeout")
+        return None
+    except httpx.TransportError:
+        print(f"🔌 LLM API connection error")
+        return None
+    except Exception as e:
+        print(f"❌ LLM API call failed: {e}")
+        return None
+
+
+async def acall_llm_api(llm_config, prompt, max_tokens=1000, temperature=0.7):
+    """asyncio-native variant of call_llm_api"""
+    try:
+        headers, payload = build_llm_request(llm_config, prompt, max_tokens, temperature)
+        print(f"🔄 Calling LLM API (async): {llm_config['api_url']}")
+
+        response = await get_async_http_client().post(llm_config['api_url'], headers=headers, json=payload)
+        return parse_llm_response(llm_config, response)
+
+    except httpx.TimeoutException:
+        print(f"⏱️ LLM API request timeout")
+        return None
+    except httpx.TransportError:
+        print(f"🔌 LLM API connection error")
+        return None
+    except Exception as e:
+        print(f"❌ LLM API call failed: {e}")
+        return None
@@ -0,0 +1,97 @@
+# merge_adapter.py - OFFLINE LoRA MERGE INTO A STANDALONE CHECKPOINT
+"""
+Fold the PEFT adapter into the base model once, ahead of deployment.
+
+Usage:
+    python merge_adapter.py [--base ./TinyLlama-1.1B-Chat-v1.0] [--adapter ./trained_model]
+                            [--output ./merged_model] [--dtype fp32|bf16|fp16]
+
+The output directory holds safetensors weights, the config and the tokenizer.
+When MERGED_MODEL_PATH points at it, initialize_model loads it directly and skips
+both the base load and PeftModel.from_pretrained (safetensors are memory-mapped by
+from_pretrained, so no second full copy of the weights is built at startup).
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import time
+from datetime import datetime
+from pathlib import Path
+
+import torch
+from dotenv import load_dotenv
+from peft import PeftModel
+from transformers import AutoModelForCausalLM, AutoTokenizer
+
+DTYPES = {'fp32': torch.float32, 'bf16': torch.bfloat16, 'fp16': torch.float16}
+MERGE_INFO_FILE = "merge_info.json"
+
+
+def adapter_fingerprint(adapter_path):
+    """Hash of the adapter config + weights, stored with the merged model to detect stale merges"""
+    digest = hashlib.sha256()
+    for path in sorted(Path(adapter_path).glob("adapter_*")):
+        if path.is_file():
+            digest.update(path.name.encode())
+            with open(path, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(block)
+    return digest.hexdigest()
+
+
+def merge(base_path, adapter_path, output_path, dtype='fp32'):
+    start = time.time()
+    output_path = Path(output_path)
+    tmp_path = output_path.with_name(output_path.name + ".tmp")
+    if tmp_path.exists():
+        shutil.rmtree(tmp_path)
+
+    print(f"🤖 Loading base model from: {base_path} ({dtype})")
+    base_model = AutoModelForCausalLM.from_pretrained(
+        base_path,
+        trust_remote_code=True,
+        torch_dtype=DTYPES[dtype],
+        low_cpu_mem_usage=True
+    )
+    print(f"🔗 Merging adapter from: {adapter_path}")
+    model = PeftModel.from_pretrained(base_model, adapter_path).merge_and_unload()
+
+    # Same tokenizer the app loads for the adapter path
+    tokenizer = AutoTokenizer.from_pretrained(base_path, trust_remote_code=True)
+
+    print(f"💾 Saving merged model to: {output_path}")
+    model.save_pretrained(tmp_path, safe_serialization=True)
+    tokenizer.save_pretrained(tmp_path)
+    with open(tmp_path / MERGE_INFO_FILE, 'w') as f:
+        json.dump({
+            'base_model': str(base_path),
+            'adapter': str(adapter_path),
+            'adapter_fingerprint': adapter_fingerprint(adapter_path),
+            'dtype': dtype,
+            'created': datetime.now().isoformat()
+        }, f, indent=2)
+
+    # Swap in the finished directory so a running loader never sees a partial checkpoint
+    if output_path.exists():
+        shutil.rmtree(output_path)
+    os.replace(tmp_path, output_path)
+    print(f"✅ Merged model written in {time.time() - start:.1f}s")
+
+
+def main():
+    # Only when run as a script: app.py imports this module and loads .env itself
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Merge the LoRA adapter into the base model")
+    parser.add_argument('--base', default=os.environ.get("MODEL_BASE_PATH", "./TinyLlama-1.1B-Chat-v1.0"))
+    parser.add_argument('--adapter', default=os.environ.get("ADAPTER_PATH", "./trained_model"))
+    parser.add_argument('--output', default=os.environ.get("MERGED_MODEL_PATH", "./merged_model"))
+    parser.add_argument('--dtype', choices=list(DTYPES), default='fp32',
+                        help="Stored weight dtype (bf16 halves the file and matches MODEL_CPU_DTYPE=bf16)")
+    args = parser.parse_args()
+    merge(args.base, args.adapter, args.output, args.dtype)
+
+
+if __name__ == "__main__":
+    main()
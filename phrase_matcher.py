@@ -0,0 +1,107 @@
+# phrase_matcher.py - PRECOMPILED MULTI-PHRASE MATCHER
+import re
+from typing import NamedTuple
+
+
+class PhraseMatch(NamedTuple):
+    phrase: str
+    category: str
+    start: int
+    end: int
+
+
+class PhraseMatcher:
+    """
+    Matches a fixed phrase set, built once and shared
+    - phrases_by_category: {'category': [phrase, ...]}; list order sets priority
+    - find_prefixes(): compiled alternations anchored at position 0; phrases are split into
+      layers with no phrase a prefix of another in the same layer, so all prefixes are reported.
+      Each alternation is built as a trie (shared prefixes factored out)
+    - find_all() / first(): CPython's substring search per phrase. A regex scan has to try
+      almost every position (the phrases' first letters are common ones) and measured slower
+      than these scans at the risk keyword set's size (`benchmarks.py phrases`)
+    - Plain substring semantics (like `phrase in text`); pass lowercased text
+    """
+
+    def __init__(self, phrases_by_category):
+        self.categories = {}
+        self.priority = {}
+        by_category = {}
+        for category, phrases in phrases_by_category.items():
+            for phrase in phrases:
+                phrase = phrase.lower()
+                if phrase and phrase not in self.categories:
+                    self.categories[phrase] = category
+                    self.priority[phrase] = len(self.priority)
+                    by_category.setdefault(category, []).append(phrase)
+
+        self.phrases = tuple(self.categories)
+        self.by_category = {category: tuple(phrases) for category, phrases in by_category.items()}
+        self.layers = [
+            re.compile(self._trie_pattern(layer))
+            for layer in self._split_layers(self.phrases)
+        ]
+
+    @staticmethod
+    def _split_layers(phrases):
+        # Longest first: a phrase can only be the prefix of a phrase placed before it
+        layers = []
+        for phrase in sorted(phrases, key=len, reverse=True):
+            for layer in layers:
+                if not any(other.startswith(phrase) for other in layer):
+                    layer.append(phrase)
+                    break
+            else:
+                layers.append([phrase])
+        return layers
+
+    @staticmethod
+    def _trie_pattern(phrases):
+        """Regex matching any of phrases, e.g. ['kill me', 'kill myself'] -> 'kill\\ m(?:e|yself)'"""
+        trie = {}
+        for phrase in phrases:
+            node = trie
+            for char in phrase:
+                node = node.setdefault(char, {})
+            node[''] = {}
+
+        def build(node):
+            branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+            if not branches:
+                return ''
+            pattern = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+            # Greedy: a phrase that is a prefix of another still prefers the longer one
+            return '(?:' + pattern + ')?' if '' in node else pattern
+
+        return build(trie)
+
+    def _make_match(self, phrase, start):
+        return PhraseMatch(phrase, self.categories[phrase], start, start + len(phrase))
+
+    def find_prefixes(self, text):
+        """Phrases that text starts with (the `text.startswith(phrase)` set)"""
+        matches = []
+        for layer in self.layers:
+            m = layer.match(text)
+            if m:
+                matches.append(self._make_match(m.group(), 0))
+        return matches
+
+    def find_all(self, text):
+        """All phrase occurrences (overlaps included), ordered by position then priority"""
+        matches = []
+        for phrase in self.phrases:
+            if phrase in text:
+                start = text.find(phrase)
+                while start != -1:
+                    matches.append(self._make_match(phrase, start))
+                    start = text.find(phrase, start + 1)
+        matches.sort(key=lambda m: (m.start, self.priority[m.phrase]))
+        return matches
+
+    def first(self, text, category):
+        """Highest-priority phrase of one category found in text, or None"""
+        for phrase in self.by_category.get(category, ()):
+            if phrase in text:
+                return self._make_match(phrase, text.find(phrase))
+        return None
@@ -4,15 +4,294 @@ import numpy as np
 import os
 import pandas as pd
 import pickle
+import psutil
 from pathlib import Path
 from sentence_transformers import SentenceTransformer, CrossEncoder
-from rank_bm25 import BM25Okapi
+from bm25_index import InvertedIndexBM25
+from row_store import write_rows, open_rows
+from embedding_cache import QueryEmbeddingCache
+from response_cache import normalize_query
+from phrase_matcher import PhraseMatcher
 import requests
 from bs4 import BeautifulSoup
 from urllib.parse import quote
 import time
 import random
 import json
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+def fuse_hybrid_scores(num_docs, faiss_idx, faiss_dist, bm25_idx, bm25_scores, topk,
+                       alpha=0.7, method='weighted', rrf_k=60):
+    """
+    Fuse FAISS and BM25 candidates on NumPy arrays.
+    - faiss_idx/faiss_dist: one FAISS result row (nearest first, -1 for empty slots)
+    - bm25_idx/bm25_scores: sparse BM25 scores
+    - method='weighted': alpha * (1 / (1 + d / d_min)) + (1 - alpha) * bm25 / max_bm25
+    - method='rrf': Reciprocal Rank Fusion, scaled so ranking first in both lists scores 1.0
+    Returns (doc_ids, scores), best first.
+    """
+    faiss_idx = np.asarray(faiss_idx, dtype=np.int64)
+    faiss_dist = np.asarray(faiss_dist, dtype=np.float64)
+    bm25_idx = np.asarray(bm25_idx, dtype=np.int64)
+    bm25_scores = np.asarray(bm25_scores, dtype=np.float64)
+    
+    valid = (faiss_idx >= 0) & (faiss_idx < num_docs)
+    faiss_idx, faiss_dist = faiss_idx[valid], faiss_dist[valid]
+    valid = bm25_idx < num_docs
+    bm25_idx, bm25_scores = bm25_idx[valid], bm25_scores[valid]
+    
+    if method == 'rrf':
+        faiss_part = 1.0 / (rrf_k + np.arange(1, len(faiss_idx) + 1))
+        bm25_ranks = np.empty(len(bm25_idx), dtype=np.float64)
+        bm25_ranks[np.argsort(-bm25_scores, kind='stable')] = np.arange(1, len(bm25_idx) + 1)
+        bm25_part = 1.0 / (rrf_k + bm25_ranks)
+        scale = (rrf_k + 1) / 2.0
+        faiss_part *= scale
+        bm25_part *= scale
+    else:
+        max_dist = faiss_dist[0] if len(faiss_dist) > 0 and faiss_dist[0] > 0 else 1
+        faiss_part = alpha * (1 / (1 + faiss_dist / max_dist))
+        max_bm25 = bm25_scores.max() if len(bm25_scores) > 0 and bm25_scores.max() > 0 else 1
+        bm25_part = (1 - alpha) * (bm25_scores / max_bm25)
+    
+    candidates = np.concatenate([faiss_idx, bm25_idx])
+    if len(candidates) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64)
+    
+    doc_ids, inverse = np.unique(candidates, return_inverse=True)
+    fused = np.bincount(inverse, weights=np.concatenate([faiss_part, bm25_part]), minlength=len(doc_ids))
+    
+    if len(doc_ids) > topk:
+        top = np.argpartition(-fused, topk - 1)[:topk]
+        doc_ids, fused = doc_ids[top], fused[top]
+    order = np.argsort(-fused, kind='stable')
+    return doc_ids[order], fused[order]
+
+
+FAISS_INDEX_TYPES = ('flat', 'ivf_flat', 'ivf_pq', 'hnsw')
+
+
+def create_faiss_index(index_type, dimension, num_vectors, nlist=None, pq_m=16, hnsw_m=32):
+    """
+    Create an empty FAISS index of the requested family.
+    - flat: exact IndexFlatL2 scan
+    - ivf_flat / ivf_pq: inverted lists (optionally product-quantized), need train()
+    - hnsw: graph index over full vectors
+    Returns (index, config) where config records the structure actually built.
+    """
+    requested = index_type
+    if index_type not in FAISS_INDEX_TYPES:
+        print(f"⚠️ Unknown index type '{index_type}' - using flat")
+        index_type = 'flat'
+    
+    if index_type in ('ivf_flat', 'ivf_pq'):
+        nlist = nlist or int(4 * np.sqrt(max(num_vectors, 1)))
+        nlist = max(1, min(nlist, num_vectors))
+        # PQ codebooks need at least 256 training points (8-bit codes)
+        if index_type == 'ivf_pq' and (num_vectors < 256 or dimension % pq_m != 0):
+            print(f"⚠️ IVF-PQ needs >= 256 vectors and dimension divisible by {pq_m} - using IVF-Flat")
+            index_type = 'ivf_flat'
+    
+    if index_type == 'ivf_flat':
+        index = faiss.index_factory(dimension, f"IVF{nlist},Flat")
+        return index, {'type': index_type, 'requested': requested, 'nlist': nlist}
+    
+    if index_type == 'ivf_pq':
+        index = faiss.index_factory(dimension, f"IVF{nlist},PQ{pq_m}")
+        return index, {'type': index_type, 'requested': requested, 'nlist': nlist, 'pq_m': pq_m}
+    
+    if index_type == 'hnsw':
+        index = faiss.index_factory(dimension, f"HNSW{hnsw_m}")
+        return index, {'type': index_type, 'requested': requested, 'hnsw_m': hnsw_m}
+    
+    return faiss.IndexFlatL2(dimension), {'type': 'flat', 'requested': requested}
+
+
+def set_faiss_search_params(index, nprobe=16, ef_search=64):
+    """Apply query-time accuracy/speed knobs (no-op for flat indexes)"""
+    try:
+        faiss.extract_index_ivf(index).nprobe = nprobe
+    except Exception:
+        pass
+    
+    if isinstance(index, faiss.IndexIDMap):
+        index = faiss.downcast_index(index.index)
+    if isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = ef_search
+
+
+# Greeting phrases by category; a message equal to or starting with one is a greeting
+GREETING_PHRASES = {
+    'simple_greetings': {
+        'hi', 'hello', 'hey', 'hiya', 'howdy', 'yo', 'sup', 
+        'wassup', 'greetings', 'hola', 'namaste', 'hi there'
+    },
+    'time_greetings': {
+        'good morning', 'good afternoon', 'good evening', 'good night',
+        'morning', 'afternoon', 'evening'
+    },
+    'check_ins': {
+        'how are you', "how're you", 'how are u', 'how r u',
+        "what's up", 'whats up', "what's going on", 'whats going on',
+        "how's it going", 'hows it going', "how's everything",
+        'how are you doing', 'how have you been', "how's your day",
+        "how's life", 'how do you do'
+    },
+    'gratitude': {
+        'thank you', 'thanks', 'thank u', 'thx', 'thanx',
+        'thanks a lot', 'thank you so much', 'thanks so much',
+        'i appreciate it', 'appreciate it', "you're helpful",
+        'that helped', 'that was helpful'
+    },
+    'farewells': {
+        'bye', 'goodbye', 'good bye', 'see you', 'see ya',
+        'see you later', 'talk to you later', 'ttyl',
+        'gotta go', 'got to go', 'i have to go', 'have to go',
+        'catch you later', 'take care', 'later', 'cya'
+    },
+    'casual': {
+        'okay', 'ok', 'k', 'alright', 'cool', 'nice',
+        'great', 'awesome', 'sounds good', 'got it',
+        "i'm fine", "i'm okay", "i'm good", "i'm alright",
+        'fine', 'not much', 'nothing much', 'nm',
+        'just checking in', 'just saying hi'
+    },
+    'system_questions': {
+        'testing', 'test', 'are you there', 'are you available',
+        'are you real', 'are you a bot', 'are you human',
+        'who are you', 'what are you', "what's your name",
+        'whats your name', 'tell me about yourself'
+    },
+    'introductions': {
+        "i'm new here", 'im new here', 'new here', 'first time here',
+        'first time', 'what can you do', 'what do you do',
+        'can you help me', 'can you help', 'i need help',
+        'i need someone to talk to', 'can we talk'
+    }
+}
+GREETING_MATCHER = PhraseMatcher(GREETING_PHRASES)
+
+# Short (<= 3 word) messages containing one of these are treated as greetings
+GREETING_KEYWORDS = frozenset({
+    'hi', 'hey', 'hello', 'thanks', 'bye', 'ok', 
+    'yeah', 'yes', 'no', 'sure', 'fine', 'good'
+})
+
+EMBEDDING_MODEL_NAME = 'sentence-transformers/all-mpnet-base-v2'
+RERANKER_MODEL_NAME = 'cross-encoder/ms-marco-MiniLM-L-6-v2'
+
+# torch: PyTorch fp32 | onnx: ONNX Runtime fp32 | onnx-int8: ONNX Runtime, dynamic int8 quantization
+MODEL_BACKENDS = ('torch', 'onnx', 'onnx-int8')
+
+
+def load_sentence_model(model_cls, model_name, backend='torch', export_dir='./onnx_models',
+                        quantization='avx2', **kwargs):
+    """
+    Load a SentenceTransformer or CrossEncoder on the requested CPU backend.
+    - ONNX exports are written to export_dir on first use, so later starts run offline
+    - onnx-int8 adds a dynamically quantized model (quantization: arm64 | avx2 | avx512 | avx512_vnni)
+    - Needs `optimum[onnxruntime]`; any failure falls back to PyTorch
+    Returns (model, backend actually used).
+    """
+    if backend not in MODEL_BACKENDS:
+        print(f"⚠️ Unknown model backend '{backend}' - using torch")
+        backend = 'torch'
+    if backend == 'torch':
+        return model_cls(model_name, **kwargs), 'torch'
+    
+    local_dir = Path(export_dir) / model_name.replace('/', '__')
+    try:
+        if not (local_dir / 'onnx' / 'model.onnx').exists():
+            print(f"📄 Exporting {model_name} to ONNX ({local_dir})...")
+            model_cls(model_name, backend='onnx', **kwargs).save_pretrained(str(local_dir))
+        
+        if backend == 'onnx':
+            return model_cls(str(local_dir), backend='onnx', **kwargs), 'onnx'
+        
+        # The exporter names the file model_qint8_<config>.onnx or model_quint8_<config>.onnx
+        quantized = sorted((local_dir / 'onnx').glob(f"model_*int8_{quantization}.onnx"))
+        if not quantized:
+            from sentence_transformers.backend import export_dynamic_quantized_onnx_model
+            print(f"📄 Quantizing {model_name} to int8 ({quantization})...")
+            export_dynamic_quantized_onnx_model(
+                model_cls(str(local_dir), backend='onnx', **kwargs), quantization, str(local_dir)
+            )
+            quantized = sorted((local_dir / 'onnx').glob(f"model_*int8_{quantization}.onnx"))
+        
+        quantized_file = f"onnx/{quantized[0].name}"
+        model = model_cls(str(local_dir), backend='onnx', model_kwargs={'file_name': quantized_file}, **kwargs)
+        return model, 'onnx-int8'
+    
+    except Exception as e:
+        print(f"⚠️ {backend} backend unavailable for {model_name} ({e}) - using torch")
+        return model_cls(model_name, **kwargs), 'torch'
+
+# Canned retrieval queries for greetings (first key contained in the message wins)
+GREETING_SEARCH_MAP = {
+    'hi': 'hello greeting introduction welcome mental health support',
+    'hello': 'hello greeting welcome mental health counseling',
+    'hey': 'hey greeting casual hello mental health',
+    'how are you': 'how are you feeling mental health wellbeing check-in',
+    "what's up": 'what is up how are you feeling mental state',
+    'thank you': 'thank you gratitude appreciation therapy progress',
+    'thanks': 'thanks gratitude appreciation mental health support',
+    'bye': 'goodbye farewell ending session closure mental health',
+    'goodbye': 'goodbye farewell ending therapy session',
+    "i'm fine": 'i am fine wellbeing mental health check',
+    "i'm new here": 'new here first time introduction mental health support',
+    'what can you do': 'capabilities mental health support help available',
+    'can you help me': 'help support mental health assistance available',
+    'who are you': 'who are you introduction mental health support'
+}
+GREETING_DEFAULT_SEARCH = 'greeting hello introduction mental health support'
+
+
+def read_faiss_index(path, mmap=True):
+    """
+    Read a FAISS index, memory-mapping it when the index type allows.
+    - IO_FLAG_MMAP_IFC maps flat/HNSW vector codes, IO_FLAG_MMAP maps IVF inverted lists
+    - Mapped pages live in the page cache and are shared by every worker process
+    - Mapped indexes are read-only; re-read without mmap before add/remove
+    Returns (index, mmapped).
+    """
+    if mmap:
+        flag_sets = [faiss.IO_FLAG_MMAP | getattr(faiss, 'IO_FLAG_MMAP_IFC', 0), faiss.IO_FLAG_MMAP]
+        for flags in dict.fromkeys(flag_sets):
+            try:
+                return faiss.read_index(str(path), flags), True
+            except Exception:
+                continue
+        print("⚠️ Index type cannot be memory-mapped - loading into memory")
+    return faiss.read_index(str(path)), False
+
+
+def index_memory_report(path, rss_before):
+    """Bytes of an index file resident in this process: shared mapped pages vs private copies"""
+    process = psutil.Process()
+    rss_delta = max(process.memory_info().rss - rss_before, 0)
+    resolved = str(Path(path).resolve())
+    try:
+        mapped = sum(m.rss for m in process.memory_maps() if m.path == resolved)
+    except Exception:
+        mapped = 0
+    file_bytes = Path(path).stat().st_size
+    return {
+        'file_bytes': file_bytes,
+        # Several mappings of one file share pages
+        'mapped_resident_bytes': min(mapped, file_bytes),
+        'private_bytes': max(rss_delta - mapped, 0)
+    }
+
+
+def _write_atomically(path, write_fn):
+    """Write via a temp file + rename so processes mapping the old file keep a valid copy"""
+    tmp_path = Path(f"{path}.tmp")
+    write_fn(str(tmp_path))
+    os.replace(tmp_path, path)
+
 
 class MultiFileRAGRetriever:
     """
@@ -24,7 +303,15 @@ class MultiFileRAGRetriever:
     - Greeting detection for natural conversation
     """
     
-    def __init__(self, data_sources, index_dir="./faiss_index"):
+    # Minimum seconds between partial-index checkpoints during a build
+    BUILD_CHECKPOINT_INTERVAL = 60.0
+    
+    def __init__(self, data_sources, index_dir="./faiss_index", fusion="weighted", rrf_k=60,
+                 index_type="flat", nlist=None, pq_m=16, hnsw_m=32, nprobe=16, ef_search=64,
+                 build_chunk_size=2048, mmap_index=True, query_cache_size=2048, query_cache_path=None,
+                 rerank_warmup=True, rerank_max_length=256, rerank_cache_size=4096,
+                 rerank_skip_margin=0.0, rerank_prune_ratio=0.0,
+                 model_backend="torch", onnx_dir="./onnx_models", onnx_quantization="avx2"):
         if isinstance(data_sources, str):
             self.data_sources = [data_sources]
         else:
@@ -33,12 +320,49 @@ class MultiFileRAGRetriever:
         self.index_dir = Path(index_dir)
         self.index_dir.mkdir(exist_ok=True)
         
+        self.fusion = fusion
+        self.rrf_k = rrf_k
+        
+        self.index_type = index_type
+        self.index_params = {'nlist': nlist, 'pq_m': pq_m, 'hnsw_m': hnsw_m}
+        self.nprobe = nprobe
+        self.ef_search = ef_search
+        self.index_config = {'type': 'flat'}
+        self.build_chunk_size = build_chunk_size
+        self.mmap_index = mmap_index
+        self.index_mmapped = False
+        
         self.index_file = self.index_dir / "multi_rag.index"
-        self.cache_file = self.index_dir / "multi_rag_cache.pkl"
+        self.cache_file = self.index_dir / "multi_rag_cache.json"
+        self.legacy_cache_file = self.index_dir / "multi_rag_cache.pkl"
+        self.rows_dir = self.index_dir / "rows"
         self.bm25_file = self.index_dir / "multi_rag_bm25.pkl"
+        self.partial_index_file = self.index_dir / "multi_rag.index.partial"
+        self.progress_file = self.index_dir / "build_progress.json"
+        self.manifest_file = self.index_dir / "manifest.json"
         
         self.embedding_model = None
         self.reranker = None
+        self.model_backend = model_backend
+        self.onnx_dir = onnx_dir
+        self.onnx_quantization = onnx_quantization
+        self.model_backends = {}
+        
+        # Cross-encoder settings; a skip margin of 0 always reranks
+        self.rerank_max_length = rerank_max_length
+        self.rerank_skip_margin = rerank_skip_margin
+        self.rerank_prune_ratio = rerank_prune_ratio
+        self.rerank_cache_size = rerank_cache_size
+        self.rerank_cache = OrderedDict()  # (query hash, doc id) -> score, in LRU order
+        self.rerank_lock = threading.Lock()
+        self.rerank_metrics = {'reranked': 0, 'skipped': 0, 'pairs_scored': 0, 'cache_hits': 0}
+        self.query_cache = QueryEmbeddingCache(
+            lambda texts: self.embedding_model.encode(texts, batch_size=32, convert_to_numpy=True),
+            max_size=query_cache_size,
+            persist_path=query_cache_path,
+            # int8 embeddings differ slightly, so persisted entries are per backend
+            model_name=f"{EMBEDDING_MODEL_NAME}:{model_backend}"
+        )
         self.bm25 = None
         
         self.docs = []
@@ -46,26 +370,63 @@ class MultiFileRAGRetriever:
         self.metadata = []
         self.index = None
         
+        # Greeting search string -> precomputed top result (None if below threshold)
+        self.greeting_table = None
+        
+        # FAISS vector ids -> row positions (ids stop being contiguous after incremental updates)
+        self.manifest = None
+        self.row_ids = None
+        self.id_to_row = None
+        
         self.user_agents = [
             'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
             'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36'
         ]
         
         self._load_or_build_index()
+        
+        self._refresh_greeting_table()
+        
+        if rerank_warmup:
+            self._warmup_reranker()
     
     def _load_embedding_model(self):
         if self.embedding_model is None:
-            print("📄 Loading SentenceTransformer (all-mpnet-base-v2)...")
-            self.embedding_model = SentenceTransformer('sentence-transformers/all-mpnet-base-v2')
+            print(f"📄 Loading SentenceTransformer (all-mpnet-base-v2, {self.model_backend})...")
+            self.embedding_model, self.model_backends['embedding'] = load_sentence_model(
+                SentenceTransformer, EMBEDDING_MODEL_NAME, self.model_backend,
+                self.onnx_dir, self.onnx_quantization
+            )
             print("✅ Embedding model loaded")
     
+    def _embedding_backend(self):
+        """Backend the stored vectors were made with (int8 exports differ per quantization config)"""
+        self._load_embedding_model()
+        backend = self.model_backends['embedding']
+        return f"{backend}:{self.onnx_quantization}" if backend == 'onnx-int8' else backend
+    
     def _load_reranker(self):
         if self.reranker is None:
             print("📄 Loading re-ranker...")
-            self.reranker = CrossEncoder('cross-encoder/ms-marco-MiniLM-L-6-v2')
+            # max_length truncates long answers before they reach the cross-encoder
+            self.reranker, self.model_backends['reranker'] = load_sentence_model(
+                CrossEncoder, RERANKER_MODEL_NAME, self.model_backend,
+                self.onnx_dir, self.onnx_quantization, max_length=self.rerank_max_length
+            )
             print("✅ Re-ranker loaded")
     
-    def _load_data_from_file(self, file_path):
+    def _warmup_reranker(self):
+        """Load the cross-encoder and run one prediction so the first request is not a cold start"""
+        try:
+            start = time.time()
+            self._load_reranker()
+            self.reranker.predict([["warmup query", "warmup answer"]])
+            print(f"✅ Re-ranker warmed up in {time.time() - start:.2f}s")
+        except Exception as e:
+            print(f"⚠️ Re-ranker warmup failed: {e}")
+    
+    @staticmethod
+    def _load_data_from_file(file_path):
         file_path = Path(file_path)
         
         if not file_path.exists():
@@ -182,26 +543,58 @@ class MultiFileRAGRetriever:
             return [], [], []
     
     def _load_or_build_index(self):
-        if self.index_file.exists() and self.cache_file.exists():
+        if self.index_file.exists() and (self.cache_file.exists() or self.legacy_cache_file.exists()):
             try:
                 print("⚡ Loading cached multi-file RAG index...")
                 
-                self.index = faiss.read_index(str(self.index_file))
+                self._read_index()
+                
+                cache = self._load_cached_rows()
+                cached_sources = cache.get('sources', [])
+                self.index_config = cache.get('index_config', {'type': 'flat'})
+                
+                cached_type = self.index_config.get('requested', self.index_config['type'])
+                if cached_type != self.index_type:
+                    print(f"🔨 Index type changed ({cached_type} -> {self.index_type}) - rebuilding...")
+                    self._build_new_index()
+                    return
                 
-                with open(self.cache_file, 'rb') as f:
-                    cache = pickle.load(f)
-                    self.docs = cache['docs']
-                    self.answers = cache['answers']
-                    self.metadata = cache.get('metadata', [{}] * len(self.docs))
-                    cached_sources = cache.get('sources', [])
+                # Vectors from another backend are not comparable with new query embeddings
+                cached_backend = self.index_config.get('embedding_backend', 'torch')
+                if cached_backend != self._embedding_backend():
+                    print(f"🔨 Embedding backend changed ({cached_backend} -> {self._embedding_backend()}) - rebuilding...")
+                    self._build_new_index()
+                    return
+                
+                manifest = self._load_manifest()
+                if manifest is None:
+                    print("🔨 Cached index has no file manifest - rebuilding once to enable incremental updates...")
+                    self._build_new_index()
+                    return
+                self._set_manifest(manifest)
+                if len(self.row_ids) != len(self.docs):
+                    raise ValueError(f"manifest lists {len(self.row_ids)} rows, row store has {len(self.docs)}")
+                
+                self._apply_search_params()
                 
                 if self.bm25_file.exists():
                     with open(self.bm25_file, 'rb') as f:
                         self.bm25 = pickle.load(f)
+                    
+                    # Indexes saved before the inverted-index engine are rank_bm25 objects
+                    if not isinstance(self.bm25, InvertedIndexBM25):
+                        print("📄 Converting cached BM25 to inverted index...")
+                        self.bm25 = InvertedIndexBM25.from_bm25okapi(self.bm25)
+                        with open(self.bm25_file, 'wb') as f:
+                            pickle.dump(self.bm25, f)
                 
                 print(f"✅ Loaded {len(self.docs)} dialogues from {len(cached_sources)} file(s)")
                 
-                self._load_embedding_model()
+                file_hashes = {str(source): self._file_hash(source) for source in self.data_sources}
+                # A reordered data_sources list changes the row layout even if no file changed
+                if any(manifest['files'].get(key, {}).get('hash') != file_hash for key, file_hash in file_hashes.items()) \
+                        or self.manifest['sources'] != list(file_hashes):
+                    self._update_index(file_hashes)
                 return
                 
             except Exception as e:
@@ -210,6 +603,202 @@ class MultiFileRAGRetriever:
         
         self._build_new_index()
     
+    def _read_index(self):
+        rss_before = psutil.Process().memory_info().rss
+        self.index, self.index_mmapped = read_faiss_index(self.index_file, self.mmap_index)
+        
+        report = index_memory_report(self.index_file, rss_before)
+        mode = "memory-mapped" if self.index_mmapped else "loaded"
+        print(f"📊 FAISS index {mode}: {report['file_bytes'] / 1e6:.1f} MB on disk, "
+              f"{report['mapped_resident_bytes'] / 1e6:.1f} MB resident via shared mapping, "
+              f"{report['private_bytes'] / 1e6:.1f} MB private to this worker")
+    
+    def _load_cached_rows(self):
+        """Map docs/answers/metadata from the row store (pickled caches are converted once)"""
+        if not self.cache_file.exists():
+            print("📄 Converting pickled row cache to memory-mapped row store...")
+            with open(self.legacy_cache_file, 'rb') as f:
+                cache = pickle.load(f)
+            write_rows(self.rows_dir, cache['docs'], cache['answers'], cache.get('metadata', [{}] * len(cache['docs'])))
+            self._write_cache_info(cache.get('sources', []), cache.get('index_config', {'type': 'flat'}), len(cache['docs']))
+            self.legacy_cache_file.unlink()
+        
+        with open(self.cache_file, encoding='utf-8') as f:
+            cache = json.load(f)
+        
+        self.docs, self.answers, self.metadata = open_rows(self.rows_dir)
+        if len(self.docs) != cache['rows']:
+            raise ValueError(f"row store has {len(self.docs)} rows, expected {cache['rows']}")
+        return cache
+    
+    def _write_cache_info(self, sources, index_config, rows):
+        tmp_file = self.cache_file.with_suffix('.tmp')
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump({
+                'sources': [str(source) for source in sources],
+                'index_config': index_config,
+                'rows': rows,
+                'version': '4.0'
+            }, f)
+        os.replace(tmp_file, self.cache_file)
+    
+    # ========================================================================
+    # FILE MANIFEST & INCREMENTAL UPDATES
+    # ========================================================================
+    
+    @staticmethod
+    def _file_hash(path):
+        """sha1 of a data file's bytes (None if it is missing)"""
+        path = Path(path)
+        if not path.exists():
+            return None
+        digest = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        return digest.hexdigest()
+    
+    @staticmethod
+    def _row_fingerprint(text):
+        """Fingerprint of the embedded text; rows with equal fingerprints share a vector"""
+        return hashlib.sha1(text.encode('utf-8', 'replace')).hexdigest()[:16]
+    
+    def _load_manifest(self):
+        if not self.manifest_file.exists():
+            return None
+        try:
+            with open(self.manifest_file, encoding='utf-8') as f:
+                manifest = json.load(f)
+            if not self.index_config.get('ids'):
+                return None
+            if manifest.get('embedding_backend', 'torch') != self._embedding_backend():
+                return None
+            return manifest
+        except Exception as e:
+            print(f"⚠️ Could not read index manifest: {e}")
+            return None
+    
+    def _set_manifest(self, manifest):
+        """
+        Adopt a manifest: {'next_id': int, 'embedding_backend': str, 'sources': [source, ...],
+                           'files': {source: {'hash', 'ids', 'rows'}}}
+        Rows are laid out file by file in the manifest's 'sources' order (the data_sources
+        order when it was written), which may differ from the current data_sources.
+        """
+        # Older manifests have no 'sources'; 'files' was filled in data_sources order
+        manifest.setdefault('sources', list(manifest['files']))
+        self.manifest = manifest
+        ids = [row_id for source in manifest['sources'] for row_id in manifest['files'][source]['ids']]
+        self.row_ids = np.asarray(ids, dtype=np.int64)
+        self.id_to_row = np.full(max(manifest['next_id'], 1), -1, dtype=np.int64)
+        self.id_to_row[self.row_ids] = np.arange(len(self.row_ids))
+    
+    def _save_manifest(self):
+        tmp_file = self.manifest_file.with_suffix('.tmp')
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f)
+        os.replace(tmp_file, self.manifest_file)
+    
+    def _update_index(self, file_hashes):
+        """
+        Bring the index in line with changed data files.
+        - Unchanged files keep their rows untouched
+        - Rows of changed/new files reuse the vector of any old row with the same fingerprint
+        - Only rows without a match are embedded; vectors left unused are removed
+        """
+        print("🔄 Data files (or their order) changed - updating index incrementally...")
+        old_files = self.manifest['files']
+        next_id = self.manifest['next_id']
+        
+        # Vectors of rows in changed or removed files, available for reuse
+        reusable = {}
+        for key, entry in old_files.items():
+            if file_hashes.get(key) != entry['hash']:
+                for fingerprint, row_id in zip(entry['rows'], entry['ids']):
+                    reusable.setdefault(fingerprint, []).append(row_id)
+        
+        docs, answers, metadata = [], [], []
+        files = {}
+        embed_positions = []
+        embed_ids = []
+        
+        for source in self.data_sources:
+            key = str(source)
+            entry = old_files.get(key)
+            
+            if entry is not None and entry['hash'] == file_hashes[key]:
+                for row in self.id_to_row[np.asarray(entry['ids'], dtype=np.int64)]:
+                    docs.append(self.docs[row])
+                    answers.append(self.answers[row])
+                    metadata.append(self.metadata[row])
+                files[key] = entry
+                continue
+            
+            questions, file_answers, file_metadata = self._load_data_from_file(source)
+            entry = {'hash': file_hashes[key], 'ids': [], 'rows': []}
+            for question, answer, meta in zip(questions, file_answers, file_metadata):
+                fingerprint = self._row_fingerprint(question)
+                candidates = reusable.get(fingerprint)
+                if candidates:
+                    row_id = candidates.pop()
+                else:
+                    row_id = next_id
+                    next_id += 1
+                    embed_positions.append(len(docs))
+                    embed_ids.append(row_id)
+                
+                entry['ids'].append(row_id)
+                entry['rows'].append(fingerprint)
+                docs.append(question)
+                answers.append(answer)
+                metadata.append(meta)
+            files[key] = entry
+        
+        stale_ids = np.asarray([row_id for ids in reusable.values() for row_id in ids], dtype=np.int64)
+        
+        if not docs:
+            print("❌ No data loaded - creating fallback")
+            self._create_fallback()
+            return
+        
+        if self.index_mmapped:
+            # Mutating a mapped index aborts inside FAISS - take a private copy
+            self.index = faiss.read_index(str(self.index_file))
+            self.index_mmapped = False
+            self._apply_search_params()
+        
+        if len(stale_ids) > 0:
+            try:
+                self.index.remove_ids(stale_ids)
+            except Exception as e:
+                # HNSW graphs cannot drop vectors
+                print(f"⚠️ {self.index_config['type']} index cannot remove vectors ({e}) - rebuilding...")
+                self._build_new_index()
+                return
+        
+        self.docs, self.answers, self.metadata = docs, answers, metadata
+        
+        chunk_size = max(1, self.build_chunk_size)
+        for chunk_start in range(0, len(embed_positions), chunk_size):
+            positions = embed_positions[chunk_start:chunk_start + chunk_size]
+            embeddings = self.embedding_model.encode(
+                [docs[i] for i in positions],
+                batch_size=32,
+                show_progress_bar=False,
+                convert_to_numpy=True
+            ).astype('float32')
+            self.index.add_with_ids(embeddings, np.asarray(embed_ids[chunk_start:chunk_start + chunk_size], dtype=np.int64))
+        
+        self._set_manifest({'next_id': next_id, 'embedding_backend': self._embedding_backend(),
+                            'sources': [str(source) for source in self.data_sources], 'files': files})
+        
+        # BM25 doc ids are row positions, and tokenizing is cheap - rebuild it
+        self.bm25 = InvertedIndexBM25([doc.lower().split() for doc in self.docs])
+        
+        reused = len(self.docs) - len(embed_positions)
+        print(f"✅ Index updated: {len(embed_positions)} rows embedded, {reused} reused, {len(stale_ids)} removed")
+        self._save_index()
+    
     def _build_new_index(self):
         print("🔨 Building multi-source RAG index...")
         print(f"📚 Processing {len(self.data_sources)} file(s)...")
@@ -217,9 +806,15 @@ class MultiFileRAGRetriever:
         all_questions = []
         all_answers = []
         all_metadata = []
+        files = {}
         
         for source in self.data_sources:
             questions, answers, metadata = self._load_data_from_file(source)
+            files[str(source)] = {
+                'hash': self._file_hash(source),
+                'ids': list(range(len(all_questions), len(all_questions) + len(questions))),
+                'rows': [self._row_fingerprint(q) for q in questions]
+            }
             all_questions.extend(questions)
             all_answers.extend(answers)
             all_metadata.extend(metadata)
@@ -234,53 +829,195 @@ class MultiFileRAGRetriever:
         self.docs = all_questions
         self.answers = all_answers
         self.metadata = all_metadata
+        self._set_manifest({'next_id': len(all_questions), 'embedding_backend': self._embedding_backend(),
+                            'sources': [str(source) for source in self.data_sources], 'files': files})
         
-        self._load_embedding_model()
-        
-        print(f"📄 Generating embeddings (this may take 2-5 minutes)...")
-        embeddings = self.embedding_model.encode(
-            self.docs[:15000],
-            batch_size=32,
-            show_progress_bar=True,
-            convert_to_numpy=True
-        )
-        
-        print("📄 Building FAISS semantic search index...")
-        dimension = embeddings.shape[1]
-        self.index = faiss.IndexFlatL2(dimension)
-        self.index.add(embeddings.astype('float32'))
-        print("✅ FAISS index built")
-        
-        print("📄 Building BM25 keyword search index...")
-        tokenized_docs = [doc.lower().split() for doc in self.docs[:15000]]
-        self.bm25 = BM25Okapi(tokenized_docs)
-        print("✅ BM25 index built")
+        self._stream_build_index()
         
         self._save_index()
         
         print(f"\n✅ Multi-source RAG built successfully!")
     
+    def _corpus_fingerprint(self):
+        """Identifies the corpus + index settings a partial build belongs to"""
+        digest = hashlib.sha1()
+        digest.update(json.dumps({'sources': [str(s) for s in self.data_sources], 'index_type': self.index_type,
+                                  'embedding_backend': self._embedding_backend(), 'id_map': True}).encode())
+        for doc in self.docs:
+            digest.update(doc.encode('utf-8', 'replace'))
+            digest.update(b'\x00')
+        return digest.hexdigest()
+    
+    def _load_build_progress(self, fingerprint):
+        if not (self.progress_file.exists() and self.partial_index_file.exists()):
+            return None
+        try:
+            with open(self.progress_file, encoding='utf-8') as f:
+                progress = json.load(f)
+            if progress.get('fingerprint') != fingerprint:
+                print("⚠️ Partial build is for a different corpus - starting over")
+                return None
+            return progress
+        except Exception as e:
+            print(f"⚠️ Could not read build progress: {e}")
+            return None
+    
+    def _read_partial_index(self, progress, total):
+        """Partial index of an interrupted build, or None if it can't be resumed safely"""
+        try:
+            index = faiss.read_index(str(self.partial_index_file))
+        except Exception as e:
+            print(f"⚠️ Partial index unreadable ({e}) - starting over")
+            return None
+        if 'ntotal' not in progress and index.ntotal != progress['next_row']:
+            print("⚠️ Partial index does not match build progress - starting over")
+            return None
+        if not 0 < index.ntotal <= total:
+            print("⚠️ Partial index size is out of range - starting over")
+            return None
+        return index
+    
+    def _checkpoint_build(self, fingerprint, next_row):
+        """Persist the partial FAISS index and the next row to embed"""
+        # Index first, each file atomically: a crash in between leaves an index ahead of the
+        # progress file, and resuming goes by index.ntotal
+        _write_atomically(self.partial_index_file, lambda path: faiss.write_index(self.index, path))
+        tmp_file = self.progress_file.with_suffix('.tmp')
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump({
+                'fingerprint': fingerprint,
+                'next_row': next_row,
+                'ntotal': int(self.index.ntotal),
+                'total_rows': len(self.docs),
+                'index_config': self.index_config
+            }, f)
+        os.replace(tmp_file, self.progress_file)
+    
+    def _encode_rows(self, start, end):
+        return self.embedding_model.encode(
+            self.docs[start:end],
+            batch_size=32,
+            show_progress_bar=False,
+            convert_to_numpy=True
+        ).astype('float32')
+    
+    def _stream_build_index(self):
+        """
+        Embed the corpus in chunks of build_chunk_size rows.
+        Each chunk is appended to FAISS and BM25, then checkpointed to index_dir,
+        so memory stays bounded and an interrupted build resumes where it stopped.
+        """
+        total = len(self.docs)
+        chunk_size = max(1, self.build_chunk_size)
+        fingerprint = self._corpus_fingerprint()
+        self.bm25 = InvertedIndexBM25()
+        
+        progress = self._load_build_progress(fingerprint)
+        self.index = self._read_partial_index(progress, total) if progress else None
+        if self.index is not None:
+            # Rows are added in order with id == row, so the index itself says where to resume
+            start = int(self.index.ntotal)
+            self.index_config = progress['index_config']
+            print(f"♻️ Resuming index build at row {start}/{total}")
+            # Tokenizing is cheap - only embeddings are checkpointed
+            self.bm25.add_documents(doc.lower().split() for doc in self.docs[:start])
+        else:
+            start = 0
+        
+        print(f"📄 Generating embeddings for {total} rows in chunks of {chunk_size} (this may take a few minutes)...")
+        
+        if self.index is None:
+            sample = self._encode_rows(0, min(total, chunk_size))
+            base_index, self.index_config = create_faiss_index(
+                self.index_type, sample.shape[1], total, **self.index_params
+            )
+            # Explicit ids let incremental updates add and remove rows;
+            # IVF lists store ids natively, other indexes get an IndexIDMap
+            if self.index_config['type'] in ('ivf_flat', 'ivf_pq'):
+                self.index = base_index
+            else:
+                self.index = faiss.IndexIDMap(base_index)
+            self.index_config['ids'] = True
+            self.index_config['embedding_backend'] = self._embedding_backend()
+            print(f"📄 Building FAISS semantic search index ({self.index_config['type']})...")
+            
+            if not self.index.is_trained:
+                # IVF needs ~39 points per list and PQ ~10k points for stable centroids
+                train_rows = min(total, max(len(sample), 39 * self.index_config.get('nlist', 1),
+                                            10000 if self.index_config['type'] == 'ivf_pq' else 0))
+                if train_rows > len(sample):
+                    sample = np.vstack([sample, self._encode_rows(len(sample), train_rows)])
+                print(f"📄 Training {self.index_config['type']} index on {len(sample)} rows...")
+                self.index.train(sample)
+            
+            self.index.add_with_ids(sample, np.arange(len(sample), dtype=np.int64))
+            self.bm25.add_documents(doc.lower().split() for doc in self.docs[:len(sample)])
+            start = len(sample)
+            self._checkpoint_build(fingerprint, start)
+            print(f"   ✅ {start}/{total} rows indexed")
+            del sample
+        
+        # Each checkpoint rewrites the whole partial index, so space them out in time
+        last_checkpoint = time.time()
+        for chunk_start in range(start, total, chunk_size):
+            chunk_end = min(total, chunk_start + chunk_size)
+            self.index.add_with_ids(self._encode_rows(chunk_start, chunk_end), np.arange(chunk_start, chunk_end, dtype=np.int64))
+            self.bm25.add_documents(doc.lower().split() for doc in self.docs[chunk_start:chunk_end])
+            if chunk_end < total and time.time() - last_checkpoint >= self.BUILD_CHECKPOINT_INTERVAL:
+                self._checkpoint_build(fingerprint, chunk_end)
+                last_checkpoint = time.time()
+            print(f"   ✅ {chunk_end}/{total} rows indexed")
+        
+        self._apply_search_params()
+        print(f"✅ FAISS index built: {self.index_config}")
+        
+        print("📄 Finalizing BM25 keyword search index...")
+        self.bm25.finalize()
+        print("✅ BM25 index built")
+    
+    def _clear_build_progress(self):
+        for path in (self.partial_index_file, self.progress_file):
+            if path.exists():
+                path.unlink()
+    
     def _save_index(self):
         try:
-            faiss.write_index(self.index, str(self.index_file))
+            _write_atomically(self.index_file, lambda path: faiss.write_index(self.index, path))
             
-            with open(self.cache_file, 'wb') as f:
-                pickle.dump({
-                    'docs': self.docs,
-                    'answers': self.answers,
-                    'metadata': self.metadata,
-                    'sources': self.data_sources,
-                    'version': '3.0'
-                }, f)
+            write_rows(self.rows_dir, self.docs, self.answers, self.metadata)
+            self._write_cache_info(self.data_sources, self.index_config, len(self.docs))
             
-            with open(self.bm25_file, 'wb') as f:
-                pickle.dump(self.bm25, f)
+            def write_bm25(path):
+                with open(path, 'wb') as f:
+                    pickle.dump(self.bm25, f)
+            _write_atomically(self.bm25_file, write_bm25)
             
+            if self.manifest is not None:
+                self._save_manifest()
+            
+            self._clear_build_progress()
             print(f"💾 Index saved to {self.index_dir}")
             
+            # Row positions may now point at different answers
+            with self.rerank_lock:
+                self.rerank_cache.clear()
+            
+            # Serve from the mapped files so the build's lists and vectors can be freed
+            self.docs, self.answers, self.metadata = open_rows(self.rows_dir)
+            if self.mmap_index:
+                self._read_index()
+                self._apply_search_params()
+            
+            # Rebuilt after construction only; __init__ builds the first table
+            if self.greeting_table is not None:
+                self._refresh_greeting_table()
+            
         except Exception as e:
             print(f"⚠️ Save failed: {e}")
     
+    def _apply_search_params(self):
+        set_faiss_search_params(self.index, nprobe=self.nprobe, ef_search=self.ef_search)
+    
     def _create_fallback(self):
         print("⚠️ Creating fallback index")
         self.docs = ["Mental health support is available"]
@@ -291,8 +1028,13 @@ class MultiFileRAGRetriever:
         embeddings = self.embedding_model.encode(self.docs, convert_to_numpy=True)
         self.index = faiss.IndexFlatL2(embeddings.shape[1])
         self.index.add(embeddings.astype('float32'))
+        self.index_config = {'type': 'flat'}
+        self.index_mmapped = False
+        self.manifest = None
+        self.row_ids = None
+        self.id_to_row = None
         
-        self.bm25 = BM25Okapi([doc.lower().split() for doc in self.docs])
+        self.bm25 = InvertedIndexBM25([doc.lower().split() for doc in self.docs])
     
     # ========================================================================
     # GREETING DETECTION METHODS
@@ -302,116 +1044,50 @@ class MultiFileRAGRetriever:
         query_lower = query.lower().strip()
         query_clean = query_lower.rstrip('!?.,:;')
         
-        simple_greetings = {
-            'hi', 'hello', 'hey', 'hiya', 'howdy', 'yo', 'sup', 
-            'wassup', 'greetings', 'hola', 'namaste', 'hi there'
-        }
-        
-        time_greetings = {
-            'good morning', 'good afternoon', 'good evening', 'good night',
-            'morning', 'afternoon', 'evening'
-        }
-        
-        check_ins = {
-            'how are you', "how're you", 'how are u', 'how r u',
-            "what's up", 'whats up', "what's going on", 'whats going on',
-            "how's it going", 'hows it going', "how's everything",
-            'how are you doing', 'how have you been', "how's your day",
-            "how's life", 'how do you do'
-        }
-        
-        gratitude = {
-            'thank you', 'thanks', 'thank u', 'thx', 'thanx',
-            'thanks a lot', 'thank you so much', 'thanks so much',
-            'i appreciate it', 'appreciate it', "you're helpful",
-            'that helped', 'that was helpful'
-        }
-        
-        farewells = {
-            'bye', 'goodbye', 'good bye', 'see you', 'see ya',
-            'see you later', 'talk to you later', 'ttyl',
-            'gotta go', 'got to go', 'i have to go', 'have to go',
-            'catch you later', 'take care', 'later', 'cya'
-        }
-        
-        casual = {
-            'okay', 'ok', 'k', 'alright', 'cool', 'nice',
-            'great', 'awesome', 'sounds good', 'got it',
-            "i'm fine", "i'm okay", "i'm good", "i'm alright",
-            'fine', 'not much', 'nothing much', 'nm',
-            'just checking in', 'just saying hi'
-        }
-        
-        system_questions = {
-            'testing', 'test', 'are you there', 'are you available',
-            'are you real', 'are you a bot', 'are you human',
-            'who are you', 'what are you', "what's your name",
-            'whats your name', 'tell me about yourself'
-        }
-        
-        introductions = {
-            "i'm new here", 'im new here', 'new here', 'first time here',
-            'first time', 'what can you do', 'what do you do',
-            'can you help me', 'can you help', 'i need help',
-            'i need someone to talk to', 'can we talk'
-        }
-        
-        all_greeting_phrases = (
-            simple_greetings | time_greetings | check_ins | 
-            gratitude | farewells | casual | 
-            system_questions | introductions
-        )
+        # Covers exact matches too: a phrase equal to the message is also a prefix of it
+        if GREETING_MATCHER.find_prefixes(query_clean):
+            return True
         
-        if query_clean in all_greeting_phrases:
+        words = query_clean.split()
+        if len(words) <= 3 and not GREETING_KEYWORDS.isdisjoint(words):
             return True
         
-        for phrase in all_greeting_phrases:
-            if query_clean.startswith(phrase):
-                return True
+        return False
+    
+    def _refresh_greeting_table(self):
+        """Retrieve the best match for every greeting search string in one batch"""
+        search_queries = list(dict.fromkeys(list(GREETING_SEARCH_MAP.values()) + [GREETING_DEFAULT_SEARCH]))
+        self.query_cache.precompute(search_queries)
         
-        word_count = len(query_clean.split())
-        if word_count <= 3:
-            greeting_keywords = {
-                'hi', 'hey', 'hello', 'thanks', 'bye', 'ok', 
-                'yeah', 'yes', 'no', 'sure', 'fine', 'good'
+        try:
+            batch = self.retrieve_hybrid_batch(search_queries, topk=1, alpha=0.85, fusion='weighted')
+            self.greeting_table = {
+                search_query: results if results and results[0]['score'] > 0.25 else None
+                for search_query, results in zip(search_queries, batch)
             }
-            words = set(query_clean.split())
-            if words & greeting_keywords:
-                return True
-        
-        return False
+            print(f"✅ Greeting table ready ({sum(r is not None for r in self.greeting_table.values())}/{len(search_queries)} matched)")
+        except Exception as e:
+            print(f"⚠️ Greeting table build failed: {e}")
+            self.greeting_table = None
     
     def _get_greeting_response(self, query):
         query_lower = query.lower().strip().rstrip('!?.,:;')
         
-        greeting_search_map = {
-            'hi': 'hello greeting introduction welcome mental health support',
-            'hello': 'hello greeting welcome mental health counseling',
-            'hey': 'hey greeting casual hello mental health',
-            'how are you': 'how are you feeling mental health wellbeing check-in',
-            "what's up": 'what is up how are you feeling mental state',
-            'thank you': 'thank you gratitude appreciation therapy progress',
-            'thanks': 'thanks gratitude appreciation mental health support',
-            'bye': 'goodbye farewell ending session closure mental health',
-            'goodbye': 'goodbye farewell ending therapy session',
-            "i'm fine": 'i am fine wellbeing mental health check',
-            "i'm new here": 'new here first time introduction mental health support',
-            'what can you do': 'capabilities mental health support help available',
-            'can you help me': 'help support mental health assistance available',
-            'who are you': 'who are you introduction mental health support'
-        }
-        
         search_query = None
-        for key, value in greeting_search_map.items():
+        for key, value in GREETING_SEARCH_MAP.items():
             if key in query_lower:
                 search_query = value
                 break
         
         if not search_query:
-            search_query = 'greeting hello introduction mental health support'
+            search_query = GREETING_DEFAULT_SEARCH
         
         try:
-            results = self.retrieve_hybrid(search_query, topk=1, alpha=0.85)
+            if self.greeting_table is not None and search_query in self.greeting_table:
+                results = self.greeting_table[search_query]
+                results = [dict(r) for r in results] if results else None
+            else:
+                results = self.retrieve_hybrid(search_query, topk=1, alpha=0.85, fusion='weighted')
             
             if results and len(results) > 0 and results[0]['score'] > 0.25:
                 best_match = results[0]
@@ -464,41 +1140,51 @@ class MultiFileRAGRetriever:
     # RAG RETRIEVAL METHODS
     # ========================================================================
     
-    def retrieve_hybrid(self, query, topk=5, alpha=0.7):
-        query_emb = self.embedding_model.encode([query], convert_to_numpy=True)
-        faiss_scores, faiss_idx = self.index.search(
-            query_emb.astype('float32'), 
-            min(topk * 3, len(self.docs))
-        )
-        
-        tokenized_query = query.lower().split()
-        bm25_scores = self.bm25.get_scores(tokenized_query)
-        
-        combined = {}
+    def _search_index(self, query_emb, k):
+        """FAISS search returning row positions instead of vector ids"""
+        distances, ids = self.index.search(query_emb.astype('float32'), k)
+        if self.id_to_row is None:
+            return distances, ids
+        rows = np.where(ids >= 0, self.id_to_row[np.clip(ids, 0, len(self.id_to_row) - 1)], -1)
+        return distances, rows
+    
+    def retrieve_hybrid(self, query, topk=5, alpha=0.7, fusion=None):
+        return self.retrieve_hybrid_batch([query], topk=topk, alpha=alpha, fusion=fusion)[0]
+    
+    def retrieve_hybrid_batch(self, queries, topk=5, alpha=0.7, fusion=None):
+        """
+        Hybrid retrieval for several queries at once
+        - One embedding pass (uncached queries only) and one FAISS search over the query matrix
+        - BM25 scored for all queries together
+        Returns one result list per query, in input order.
+        """
+        if not queries:
+            return []
         
-        max_dist = faiss_scores[0][0] if len(faiss_scores[0]) > 0 else 1
-        for i, idx in enumerate(faiss_idx[0]):
-            if idx < len(self.answers):
-                similarity = 1 / (1 + faiss_scores[0][i] / max_dist)
-                combined[int(idx)] = alpha * similarity
+        query_emb = self.query_cache.encode(queries)
+        faiss_scores, faiss_idx = self._search_index(query_emb, min(topk * 3, len(self.docs)))
         
-        max_bm25 = np.max(bm25_scores) if np.max(bm25_scores) > 0 else 1
-        for idx, score in enumerate(bm25_scores):
-            if idx < len(self.answers):
-                normalized = score / max_bm25
-                if idx in combined:
-                    combined[idx] += (1 - alpha) * normalized
-                else:
-                    combined[idx] = (1 - alpha) * normalized
+        # Only documents sharing a term with a query get a (non-zero) BM25 score
+        bm25_results = self.bm25.get_sparse_scores_batch([query.lower().split() for query in queries])
         
-        sorted_results = sorted(combined.items(), key=lambda x: x[1], reverse=True)
+        all_results = []
+        for i, (bm25_idx, bm25_scores) in enumerate(bm25_results):
+            top_idx, top_scores = fuse_hybrid_scores(
+                len(self.answers), faiss_idx[i], faiss_scores[i], bm25_idx, bm25_scores, topk,
+                alpha=alpha, method=fusion or self.fusion, rrf_k=self.rrf_k
+            )
+            all_results.append(self._format_results(top_idx, top_scores))
         
+        return all_results
+    
+    def _format_results(self, top_idx, top_scores):
         results = []
-        for idx, score in sorted_results[:topk]:
+        for idx, score in zip(top_idx.tolist(), top_scores.tolist()):
             metadata = self.metadata[idx] if idx < len(self.metadata) else {}
             source_file = metadata.get('source', 'unknown')
             
             results.append({
+                'doc_id': idx,
                 'answer': self.answers[idx],
                 'context': self.docs[idx],
                 'score': float(score),
@@ -514,20 +1200,69 @@ class MultiFileRAGRetriever:
         if len(candidates) <= topk:
             return candidates
         
+        # A decisive hybrid winner would not change after reranking
+        margin = candidates[0]['score'] - candidates[1]['score']
+        if self.rerank_skip_margin and margin >= self.rerank_skip_margin:
+            with self.rerank_lock:
+                self.rerank_metrics['skipped'] += 1
+            return candidates[:topk]
+        
+        if self.rerank_prune_ratio:
+            cutoff = candidates[0]['score'] * self.rerank_prune_ratio
+            candidates = candidates[:topk] + [c for c in candidates[topk:] if c['score'] >= cutoff]
+        
         self._load_reranker()
         
-        pairs = [[query, c['answer']] for c in candidates]
-        rerank_scores = self.reranker.predict(pairs)
+        rerank_scores = self._rerank_scores(query, candidates)
         
+        # 'score' stays the 0-1 hybrid score on every path (confidence and the web fallback
+        # threshold read it); cross-encoder logits only go in 'rerank_score' and set the order
         for i, candidate in enumerate(candidates):
             candidate['rerank_score'] = float(rerank_scores[i])
-            candidate['original_score'] = candidate['score']
-            candidate['score'] = float(rerank_scores[i])
         
         candidates.sort(key=lambda x: x['rerank_score'], reverse=True)
         
         return candidates[:topk]
     
+    def _rerank_scores(self, query, candidates):
+        """Cross-encoder scores per candidate, predicting only pairs missing from the cache"""
+        # Normalized only for the cache key; the cross-encoder scores the query as the user typed it
+        query_hash = hashlib.sha1(normalize_query(query).encode('utf-8')).hexdigest()
+        keys = [(query_hash, c['doc_id']) for c in candidates]
+        
+        with self.rerank_lock:
+            scores = [self.rerank_cache.get(key) for key in keys]
+            for key, score in zip(keys, scores):
+                if score is not None:
+                    self.rerank_cache.move_to_end(key)
+        
+        missing = [i for i, score in enumerate(scores) if score is None]
+        if missing:
+            predicted = self.reranker.predict([[query, candidates[i]['answer']] for i in missing], batch_size=32)
+            for i, score in zip(missing, predicted):
+                scores[i] = float(score)
+        
+        with self.rerank_lock:
+            for i in missing:
+                self.rerank_cache[keys[i]] = scores[i]
+            while len(self.rerank_cache) > self.rerank_cache_size:
+                self.rerank_cache.popitem(last=False)
+            self.rerank_metrics['reranked'] += 1
+            self.rerank_metrics['pairs_scored'] += len(missing)
+            self.rerank_metrics['cache_hits'] += len(keys) - len(missing)
+        
+        return scores
+    
+    def get_rerank_stats(self):
+        with self.rerank_lock:
+            stats = dict(self.rerank_metrics)
+            stats['cache_size'] = len(self.rerank_cache)
+        stats['loaded'] = self.reranker is not None
+        stats['backend'] = self.model_backends.get('reranker')
+        stats['max_length'] = self.rerank_max_length
+        stats['skip_margin'] = self.rerank_skip_margin
+        return stats
+    
     def search_web(self, query, num_results=2):
         try:
             time.sleep(0.5)
@@ -642,7 +1377,29 @@ class RagRetriever:
             print("⚠️ No data sources found! Using fallback.")
             existing_sources = data_sources
         
-        self.retriever = MultiFileRAGRetriever(existing_sources)
+        self.retriever = MultiFileRAGRetriever(
+            existing_sources,
+            fusion=os.environ.get("RAG_FUSION", "weighted"),
+            rrf_k=int(os.environ.get("RAG_RRF_K", "60")),
+            index_type=os.environ.get("RAG_INDEX_TYPE", "flat"),
+            nlist=int(os.environ["RAG_IVF_NLIST"]) if os.environ.get("RAG_IVF_NLIST") else None,
+            pq_m=int(os.environ.get("RAG_PQ_M", "16")),
+            hnsw_m=int(os.environ.get("RAG_HNSW_M", "32")),
+            nprobe=int(os.environ.get("RAG_NPROBE", "16")),
+            ef_search=int(os.environ.get("RAG_EF_SEARCH", "64")),
+            build_chunk_size=int(os.environ.get("RAG_BUILD_CHUNK_SIZE", "2048")),
+            mmap_index=os.environ.get("RAG_INDEX_MMAP", "1") not in ("0", "false", "False"),
+            query_cache_size=int(os.environ.get("RAG_QUERY_CACHE_SIZE", "2048")),
+            query_cache_path=os.environ.get("RAG_QUERY_CACHE_PATH") or None,
+            rerank_warmup=os.environ.get("RAG_RERANK_WARMUP", "1") not in ("0", "false", "False"),
+            rerank_max_length=int(os.environ.get("RAG_RERANK_MAX_LENGTH", "256")),
+            rerank_cache_size=int(os.environ.get("RAG_RERANK_CACHE_SIZE", "4096")),
+            rerank_skip_margin=float(os.environ.get("RAG_RERANK_SKIP_MARGIN", "0")),
+            rerank_prune_ratio=float(os.environ.get("RAG_RERANK_PRUNE_RATIO", "0")),
+            model_backend=os.environ.get("RAG_MODEL_BACKEND", "torch"),
+            onnx_dir=os.environ.get("RAG_ONNX_DIR", "./onnx_models"),
+            onnx_quantization=os.environ.get("RAG_ONNX_QUANTIZATION", "avx2")
+        )
     
     def get_answer(self, user_query, use_web=True):
         result = self.retriever.get_augmented_answer(user_query, use_web=use_web)
@@ -0,0 +1,151 @@
+# rate_limiter.py - TOKEN-BUCKET RATE LIMITING FOR LLM API CALLS
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+
+class TokenBucketRateLimiter:
+    """
+    Thread-safe token-bucket limiter with one bucket per window
+    - buckets: {'minute': (60, 60), 'day': (10000, 86400)} -> capacity per period seconds
+    - acquire() takes a token from every bucket or from none
+    - Returns a wait time instead of sleeping the caller's thread
+    - Optional SQLite file backend so several worker processes share one budget
+    """
+
+    def __init__(self, buckets, db_path=None):
+        self.buckets = {
+            name: {'capacity': float(capacity), 'period': float(period), 'rate': float(capacity) / float(period)}
+            for name, (capacity, period) in buckets.items()
+        }
+        self.lock = threading.Lock()
+        self.db_path = Path(db_path) if db_path else None
+
+        if self.db_path:
+            self.local = threading.local()
+            self._init_db()
+        else:
+            now = time.time()
+            self.state = {name: [bucket['capacity'], now] for name, bucket in self.buckets.items()}
+
+    # ========================================================================
+    # BACKENDS
+    # ========================================================================
+
+    def _connection(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.db_path), timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    def _init_db(self):
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = self._connection()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS rate_limit_buckets ("
+            "name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+        )
+        now = time.time()
+        conn.executemany(
+            "INSERT OR IGNORE INTO rate_limit_buckets (name, tokens, updated) VALUES (?, ?, ?)",
+            [(name, bucket['capacity'], now) for name, bucket in self.buckets.items()]
+        )
+
+    def _read_state(self, conn, now):
+        rows = conn.execute("SELECT name, tokens, updated FROM rate_limit_buckets").fetchall()
+        state = {name: [tokens, updated] for name, tokens, updated in rows if name in self.buckets}
+        for name, bucket in self.buckets.items():
+            state.setdefault(name, [bucket['capacity'], now])
+        return state
+
+    def _transact(self, update):
+        """Run update(state, now) atomically against the configured backend"""
+        now = time.time()
+
+        if not self.db_path:
+            with self.lock:
+                return update(self.state, now)
+
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            state = self._read_state(conn, now)
+
+            result = update(state, now)
+
+            conn.executemany(
+                "INSERT OR REPLACE INTO rate_limit_buckets (name, tokens, updated) VALUES (?, ?, ?)",
+                [(name, tokens, updated) for name, (tokens, updated) in state.items()]
+            )
+            conn.execute("COMMIT")
+            return result
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    # ========================================================================
+    # BUCKET OPERATIONS
+    # ========================================================================
+
+    def _refill(self, state, now):
+        for name, bucket in self.buckets.items():
+            tokens, updated = state[name]
+            elapsed = max(0.0, now - updated)
+            state[name] = [min(bucket['capacity'], tokens + elapsed * bucket['rate']), now]
+
+    def acquire(self, tokens=1):
+        """Take `tokens` from every bucket; returns 0.0 on success, else seconds to wait"""
+        def update(state, now):
+            self._refill(state, now)
+
+            wait_time = 0.0
+            for name, bucket in self.buckets.items():
+                missing = tokens - state[name][0]
+                if missing > 0:
+                    wait_time = max(wait_time, missing / bucket['rate'])
+
+            if wait_time == 0.0:
+                for name in self.buckets:
+                    state[name][0] -= tokens
+            return wait_time
+
+        return self._transact(update)
+
+    def refund(self, tokens=1):
+        """Give back tokens for a request that never reached the API"""
+        def update(state, now):
+            self._refill(state, now)
+            for name, bucket in self.buckets.items():
+                state[name][0] = min(bucket['capacity'], state[name][0] + tokens)
+
+        self._transact(update)
+
+    def snapshot(self):
+        """
+        Current bucket levels for health reporting
+        - Read-only: the refill is applied to a copy, so no write lock is taken
+        """
+        now = time.time()
+        if self.db_path:
+            state = self._read_state(self._connection(), now)
+        else:
+            with self.lock:
+                state = {name: list(level) for name, level in self.state.items()}
+        self._refill(state, now)
+
+        snapshot = {
+            name: {
+                'capacity': int(bucket['capacity']),
+                'available': round(state[name][0], 2),
+                'used': round(bucket['capacity'] - state[name][0], 2),
+                'period_seconds': int(bucket['period']),
+                'refill_per_second': round(bucket['rate'], 4)
+            }
+            for name, bucket in self.buckets.items()
+        }
+        snapshot['backend'] = 'sqlite' if self.db_path else 'memory'
+        return snapshot
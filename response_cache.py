@@ -0,0 +1,166 @@
+# response_cache.py - SEMANTIC CACHE FOR LLM-BACKED RESPONSES
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+def normalize_query(query):
+    """Lowercase, collapse whitespace and drop trailing punctuation"""
+    return re.sub(r'\s+', ' ', query.lower()).strip().rstrip('!?.,:;')
+
+
+class SemanticResponseCache:
+    """
+    Response cache matched on query-embedding similarity
+    - encode_fn(text) returns one embedding (the retriever's SentenceTransformer)
+    - Cosine similarity >= threshold within the same namespace is a hit
+    - Exact repeats skip encoding entirely
+    - Entries expire after ttl seconds; least-recently-used entries are evicted beyond max_size
+    - max_size=0 disables the cache (every lookup misses, store() is a no-op)
+    """
+
+    def __init__(self, encode_fn, threshold=0.92, ttl=3600, max_size=500):
+        self.encode_fn = encode_fn
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_size = max(0, int(max_size))
+        self.lock = threading.Lock()
+
+        # Slot-based storage so similarity search is one matrix-vector product
+        self.embeddings = None
+        self.slot_namespace = np.full(self.max_size, -1, dtype=np.int32)
+        self.slot_expires = np.zeros(self.max_size, dtype=np.float64)
+        self.entries = OrderedDict()  # slot -> entry, in LRU order
+        self.exact = {}  # (namespace, normalized query) -> slot
+        self.free_slots = list(range(self.max_size - 1, -1, -1))
+        self.namespaces = {}
+
+        self.metrics = {
+            'hits': 0,
+            'exact_hits': 0,
+            'semantic_hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'expirations': 0,
+            'encode_errors': 0
+        }
+
+    def _namespace_id(self, namespace):
+        if namespace not in self.namespaces:
+            self.namespaces[namespace] = len(self.namespaces)
+        return self.namespaces[namespace]
+
+    def _encode(self, text):
+        embedding = np.asarray(self.encode_fn(text), dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(embedding)
+        return embedding / norm if norm > 0 else embedding
+
+    def _release(self, slot):
+        entry = self.entries.pop(slot)
+        self.exact.pop((entry['namespace'], entry['key']), None)
+        self.slot_namespace[slot] = -1
+        self.free_slots.append(slot)
+
+    def _purge_expired(self, now):
+        expired = np.nonzero((self.slot_namespace >= 0) & (self.slot_expires <= now))[0]
+        for slot in expired:
+            self._release(int(slot))
+        self.metrics['expirations'] += len(expired)
+
+    def lookup(self, namespace, query):
+        """
+        Return (value, embedding). value is None on a miss; embedding can be
+        passed back to store() so the query is only encoded once.
+        """
+        if self.max_size == 0:
+            with self.lock:
+                self.metrics['misses'] += 1
+            return None, None
+
+        key = normalize_query(query)
+        now = time.time()
+
+        with self.lock:
+            slot = self.exact.get((namespace, key))
+            if slot is not None and self.slot_expires[slot] > now:
+                self.entries.move_to_end(slot)
+                self.metrics['hits'] += 1
+                self.metrics['exact_hits'] += 1
+                return dict(self.entries[slot]['value']), None
+
+        try:
+            embedding = self._encode(key)
+        except Exception as e:
+            print(f"⚠️ Response cache encode failed: {e}")
+            with self.lock:
+                self.metrics['encode_errors'] += 1
+                self.metrics['misses'] += 1
+            return None, None
+
+        with self.lock:
+            ns_id = self.namespaces.get(namespace)
+            if self.embeddings is not None and ns_id is not None and self.entries:
+                similarities = self.embeddings @ embedding
+                similarities[(self.slot_namespace != ns_id) | (self.slot_expires <= now)] = -np.inf
+                best = int(np.argmax(similarities))
+
+                if similarities[best] >= self.threshold:
+                    self.entries.move_to_end(best)
+                    self.metrics['hits'] += 1
+                    self.metrics['semantic_hits'] += 1
+                    print(f"⚡ Semantic cache hit ({similarities[best]:.3f}) for '{self.entries[best]['query'][:60]}'")
+                    return dict(self.entries[best]['value']), embedding
+
+            self.metrics['misses'] += 1
+            return None, embedding
+
+    def store(self, namespace, query, value, embedding=None):
+        if self.max_size == 0:
+            return
+
+        key = normalize_query(query)
+
+        if embedding is None:
+            try:
+                embedding = self._encode(key)
+            except Exception as e:
+                print(f"⚠️ Response cache encode failed: {e}")
+                with self.lock:
+                    self.metrics['encode_errors'] += 1
+                return
+
+        now = time.time()
+        with self.lock:
+            if self.embeddings is None:
+                self.embeddings = np.zeros((self.max_size, embedding.shape[0]), dtype=np.float32)
+
+            existing = self.exact.get((namespace, key))
+            if existing is not None:
+                self._release(existing)
+
+            if not self.free_slots:
+                self._purge_expired(now)
+            if not self.free_slots:
+                self._release(next(iter(self.entries)))
+                self.metrics['evictions'] += 1
+
+            slot = self.free_slots.pop()
+            self.embeddings[slot] = embedding
+            self.slot_namespace[slot] = self._namespace_id(namespace)
+            self.slot_expires[slot] = now + self.ttl
+            self.entries[slot] = {'namespace': namespace, 'key': key, 'query': query, 'value': dict(value)}
+            self.exact[(namespace, key)] = slot
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.metrics)
+            stats['size'] = len(self.entries)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 3) if lookups else 0.0
+        stats['max_size'] = self.max_size
+        stats['threshold'] = self.threshold
+        stats['ttl_seconds'] = self.ttl
+        return stats
@@ -0,0 +1,34 @@
+# risk_detection.py - SUICIDE / SELF-HARM KEYWORD SCREENING
+from phrase_matcher import PhraseMatcher
+
+
+# High-risk keywords
+HIGH_RISK_KEYWORDS = [
+    'suicide', 'kill myself', 'end my life', 'want to die', 'better off dead',
+    'no reason to live', 'ending it all', 'can\'t go on', 'goodbye forever',
+    'not worth living', 'kill me', 'wish i was dead', 'hang myself', 'overdose',
+    'shoot myself', 'jump off', 'slit my wrists'
+]
+
+# Medium-risk keywords
+MEDIUM_RISK_KEYWORDS = [
+    'self harm', 'hurt myself', 'cutting', 'worthless', 'hopeless',
+    'burden to everyone', 'everyone would be better without me',
+    'no point anymore', 'give up', 'can\'t take it anymore'
+]
+
+RISK_MATCHER = PhraseMatcher({'high': HIGH_RISK_KEYWORDS, 'medium': MEDIUM_RISK_KEYWORDS})
+
+
+def detect_suicide_risk(text):
+    """Detect suicide/self-harm indicators in user message"""
+    text_lower = text.lower()
+    
+    # High risk wins over medium; within a level the earlier keyword in the list wins.
+    # Plain substring scans: the fastest option at this keyword count (benchmarks.py phrases)
+    for level in ('high', 'medium'):
+        for phrase in RISK_MATCHER.by_category[level]:
+            if phrase in text_lower:
+                return level, phrase
+    
+    return 'low', None
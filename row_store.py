@@ -0,0 +1,95 @@
+# row_store.py - MEMORY-MAPPED COLUMNAR STORAGE FOR RAG ROWS
+import json
+import os
+from collections.abc import Sequence
+from pathlib import Path
+
+import numpy as np
+
+
+def write_text_column(directory, name, values, encode=None):
+    """
+    Write one column as <name>.bin (concatenated UTF-8) + <name>.idx (int64 offsets, N+1)
+    - encode(value) -> str is applied first (e.g. json.dumps for metadata dicts)
+    - Files are replaced atomically, so readers mapping the old files are unaffected
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    blob_path = directory / f"{name}.bin"
+    offsets_path = directory / f"{name}.idx"
+
+    offsets = [0]
+    with open(f"{blob_path}.tmp", 'wb') as blob:
+        for value in values:
+            data = (encode(value) if encode else value).encode('utf-8', 'replace')
+            blob.write(data)
+            offsets.append(offsets[-1] + len(data))
+
+    np.asarray(offsets, dtype=np.int64).tofile(f"{offsets_path}.tmp")
+    os.replace(f"{blob_path}.tmp", blob_path)
+    os.replace(f"{offsets_path}.tmp", offsets_path)
+
+
+def _metadata_to_json(value):
+    # NaN from pandas is kept (json allows it); numpy scalars/timestamps fall back to str
+    return json.dumps(value, default=str)
+
+
+class MappedTextColumn(Sequence):
+    """
+    Read-only, memory-mapped string column
+    - Only the offsets and blob pages a lookup touches are read
+    - Rows are decoded on access, so nothing is copied onto the worker's heap at startup
+    - Pages are shared by every process mapping the same files
+    """
+
+    def __init__(self, directory, name, decode=None):
+        directory = Path(directory)
+        self.name = name
+        self.decode = decode
+        self.offsets = np.memmap(directory / f"{name}.idx", dtype=np.int64, mode='r')
+
+        blob_path = directory / f"{name}.bin"
+        if blob_path.stat().st_size > 0:
+            self.blob = np.memmap(blob_path, dtype=np.uint8, mode='r')
+        else:
+            self.blob = np.zeros(0, dtype=np.uint8)
+
+    def __len__(self):
+        return max(len(self.offsets) - 1, 0)
+
+    def _decode_row(self, i):
+        text = self.blob[self.offsets[i]:self.offsets[i + 1]].tobytes().decode('utf-8')
+        return self.decode(text) if self.decode else text
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self._decode_row(j) for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(f"{self.name} row {i} out of range")
+        return self._decode_row(int(i))
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self._decode_row(i)
+
+    def nbytes(self):
+        return int(self.offsets.nbytes + self.blob.nbytes)
+
+
+def write_rows(directory, docs, answers, metadata):
+    """Persist the docs / answers / metadata columns of a RAG corpus"""
+    write_text_column(directory, 'docs', docs)
+    write_text_column(directory, 'answers', answers)
+    write_text_column(directory, 'metadata', metadata, encode=_metadata_to_json)
+
+
+def open_rows(directory):
+    """Map the columns written by write_rows -> (docs, answers, metadata)"""
+    return (
+        MappedTextColumn(directory, 'docs'),
+        MappedTextColumn(directory, 'answers'),
+        MappedTextColumn(directory, 'metadata', decode=json.loads)
+    )
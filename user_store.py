@@ -0,0 +1,256 @@
+# user_store.py - SQLITE USER ACCOUNTS (REPLACES users.json)
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+
+class UserRepository:
+    """
+    User accounts in one SQLite file shared by every worker process
+    - WAL mode: readers never block on a signup or password reset
+    - email is the primary key and your_phone has its own index, so lookups are O(log n)
+    - Each record is kept as its JSON document, so existing fields pass through unchanged
+    - create() is a single INSERT: concurrent signups for one email cannot both succeed
+    - One-time import of legacy users.json (left in place as a backup)
+    - get() is served from an in-process LRU of records, written through by create()/update()
+    - Triggers stamp every changed row with a store-wide version; a worker re-reads only the
+      rows changed since its last sync, and only after PRAGMA data_version shows another
+      connection committed, so other workers' writes are never served stale
+    """
+
+    def __init__(self, db_path, legacy_json_path=None, cache_size=10000):
+        self.db_path = Path(db_path)
+        self.legacy_json_path = Path(legacy_json_path) if legacy_json_path else None
+        self.local = threading.local()
+
+        self.cache_size = cache_size
+        self.cache = OrderedDict()  # email -> record, in LRU order
+        self.cache_lock = threading.Lock()
+        self.synced_version = 0
+        self.metrics = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+        self._init_db()
+        self.synced_version = self._store_version()
+
+    # ========================================================================
+    # CONNECTION / SCHEMA
+    # ========================================================================
+
+    def _connection(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.db_path), timeout=10.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    def _init_db(self):
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = self._connection()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS users ("
+            "email TEXT PRIMARY KEY, phone TEXT, data TEXT NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS users_phone ON users (phone)")
+        conn.execute("CREATE TABLE IF NOT EXISTS user_store_meta (key TEXT PRIMARY KEY, value TEXT)")
+        self._init_versioning(conn)
+        self._migrate_legacy_json(conn)
+
+    def _init_versioning(self, conn):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(users)")]
+            if 'change_seq' not in columns:
+                conn.execute("ALTER TABLE users ADD COLUMN change_seq INTEGER NOT NULL DEFAULT 0")
+            conn.execute("CREATE INDEX IF NOT EXISTS users_change_seq ON users (change_seq)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS user_store_version ("
+                "id INTEGER PRIMARY KEY CHECK (id = 1), version INTEGER NOT NULL)"
+            )
+            conn.execute("INSERT OR IGNORE INTO user_store_version (id, version) VALUES (1, 0)")
+            # change_seq is only written by these triggers, so they do not re-fire each other
+            for event in ("INSERT", "UPDATE OF phone, data"):
+                name = "users_version_" + event.split()[0].lower()
+                conn.execute(
+                    f"CREATE TRIGGER IF NOT EXISTS {name} AFTER {event} ON users BEGIN "
+                    "UPDATE user_store_version SET version = version + 1 WHERE id = 1; "
+                    "UPDATE users SET change_seq = (SELECT version FROM user_store_version WHERE id = 1) "
+                    "WHERE email = NEW.email; "
+                    "END"
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _migrate_legacy_json(self, conn):
+        if not self.legacy_json_path or not self.legacy_json_path.exists():
+            return
+
+        # BEGIN IMMEDIATE so only one worker imports; the others see the marker
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            done = conn.execute("SELECT 1 FROM user_store_meta WHERE key = 'legacy_json_migrated'").fetchone()
+            if done:
+                conn.execute("COMMIT")
+                return
+
+            try:
+                content = self.legacy_json_path.read_text().strip()
+                users = json.loads(content) if content else {}
+            except (OSError, json.JSONDecodeError) as e:
+                print(f"⚠️ Could not read {self.legacy_json_path} for migration: {e}")
+                users = {}
+
+            conn.executemany(
+                "INSERT OR IGNORE INTO users (email, phone, data) VALUES (?, ?, ?)",
+                [self._row(email, user) for email, user in users.items() if isinstance(user, dict)]
+            )
+            conn.execute(
+                "INSERT INTO user_store_meta (key, value) VALUES ('legacy_json_migrated', ?)",
+                (str(len(users)),)
+            )
+            conn.execute("COMMIT")
+            print(f"✅ Migrated {len(users)} users from {self.legacy_json_path} to {self.db_path}")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    @staticmethod
+    def _row(email, user):
+        user = dict(user, email=email)
+        return email, user.get('your_phone') or None, json.dumps(user)
+
+    # ========================================================================
+    # PROFILE CACHE
+    # ========================================================================
+
+    def _store_version(self):
+        return self._connection().execute("SELECT version FROM user_store_version WHERE id = 1").fetchone()[0]
+
+    def _sync(self):
+        """Drop cached records that another connection changed since the last sync"""
+        conn = self._connection()
+        data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+        if getattr(self.local, 'data_version', None) == data_version:
+            return
+        self.local.data_version = data_version
+
+        with self.cache_lock:
+            since = self.synced_version
+        version = self._store_version()
+        if version <= since:
+            return
+        changed = [row[0] for row in conn.execute("SELECT email FROM users WHERE change_seq > ?", (since,))]
+
+        with self.cache_lock:
+            for email in changed:
+                if self.cache.pop(email, None) is not None:
+                    self.metrics['invalidations'] += 1
+            self.synced_version = max(self.synced_version, version)
+
+    def _sync_token(self):
+        """Sync, then return the cursor that _cache_put checks against"""
+        self._sync()
+        with self.cache_lock:
+            return self.synced_version
+
+    def _cache_put(self, email, user, synced_version):
+        with self.cache_lock:
+            # A sync that ran during the read/write may have seen a newer write by another worker
+            if synced_version != self.synced_version:
+                return
+            self.cache[email] = user
+            self.cache.move_to_end(email)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+    def get_stats(self):
+        with self.cache_lock:
+            stats = dict(self.metrics)
+            stats['size'] = len(self.cache)
+            stats['synced_version'] = self.synced_version
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 3) if lookups else 0.0
+        stats['max_size'] = self.cache_size
+        return stats
+
+    # ========================================================================
+    # QUERIES
+    # ========================================================================
+
+    def get(self, email):
+        """User record for email, or None (a copy; cached in-process)"""
+        if self.cache_size > 0:
+            synced_version = self._sync_token()
+            with self.cache_lock:
+                user = self.cache.get(email)
+                if user is not None:
+                    self.cache.move_to_end(email)
+                    self.metrics['hits'] += 1
+                    return dict(user)
+                self.metrics['misses'] += 1
+
+        row = self._connection().execute("SELECT data FROM users WHERE email = ?", (email,)).fetchone()
+        if not row:
+            return None
+        user = json.loads(row[0])
+        if self.cache_size > 0:
+            self._cache_put(email, user, synced_version)
+        return dict(user)
+
+    def exists(self, email):
+        return self.get(email) is not None
+
+    def find_by_phone(self, phone):
+        """First user (by signup order) registered with this phone number, or None"""
+        if not phone:
+            return None
+        row = self._connection().execute(
+            "SELECT data FROM users WHERE phone = ? ORDER BY rowid LIMIT 1", (phone,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def count(self):
+        return self._connection().execute("SELECT COUNT(*) FROM users").fetchone()[0]
+
+    # ========================================================================
+    # WRITES
+    # ========================================================================
+
+    def create(self, email, user):
+        """Insert a new user; False if the email is already registered"""
+        row = self._row(email, user)
+        synced_version = self._sync_token() if self.cache_size > 0 else None
+        try:
+            self._connection().execute("INSERT INTO users (email, phone, data) VALUES (?, ?, ?)", row)
+        except sqlite3.IntegrityError:
+            return False
+        if self.cache_size > 0:
+            self._cache_put(email, json.loads(row[2]), synced_version)
+        return True
+
+    def update(self, email, **fields):
+        """Set fields on an existing user; False if there is no such user"""
+        conn = self._connection()
+        synced_version = self._sync_token() if self.cache_size > 0 else None
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT data FROM users WHERE email = ?", (email,)).fetchone()
+            if not row:
+                conn.execute("ROLLBACK")
+                return False
+            user = json.loads(row[0])
+            user.update(fields)
+            _, phone, data = self._row(email, user)
+            conn.execute("UPDATE users SET phone = ?, data = ? WHERE email = ?", (phone, data, email))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        if self.cache_size > 0:
+            self._cache_put(email, json.loads(data), synced_version)
+        return True